@@ -1,9 +1,10 @@
 # app.py (Backend - Flask)
 from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, Response
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
 from werkzeug.utils import secure_filename
 import pandas as pd
+import numpy as np
 import os
 import random
 from datetime import datetime, timedelta
@@ -12,6 +13,11 @@ try:
     import pdfkit
 except Exception:
     pdfkit = None
+# Optional: merges per-student script PDFs into one printable file
+try:
+    from pypdf import PdfWriter
+except Exception:
+    PdfWriter = None
 from io import BytesIO
 from openpyxl import workbook, load_workbook
 from openpyxl import Workbook
@@ -23,6 +29,10 @@ except Exception:
 # Optional HTTP client for AI integration
 import json
 import re
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from sqlalchemy import func
 from sqlalchemy.exc import OperationalError
 
@@ -33,7 +43,14 @@ app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or 'sqlite:///cbt.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Files only authorised routes may serve (job inputs and outputs, cached result PDFs). Kept outside UPLOAD_FOLDER,
+# which /uploads serves to anyone.
+app.config['PRIVATE_FOLDER'] = os.environ.get('PRIVATE_FOLDER') or 'private'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Password hashing policy per account tier (preset name or werkzeug method string).
+# Students log in in bursts at the start of a sitting, so they default to a cheaper scrypt cost.
+app.config['PASSWORD_HASH_ADMIN'] = os.environ.get('PASSWORD_HASH_ADMIN') or 'high'
+app.config['PASSWORD_HASH_STUDENT'] = os.environ.get('PASSWORD_HASH_STUDENT') or 'low'
 
 db = SQLAlchemy(app)
 
@@ -44,6 +61,7 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 MAX_PASSPORT_BYTES = 2 * 1024 * 1024  # 2 MB
 MAX_PASSPORT_DIM = 1024  # max width/height in pixels
 ALLOWED_IMAGE_MIMES = ('image/jpeg', 'image/jpg', 'image/png')
+PASSPORT_RAW_EXTS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp'}
 
 def _safe_path_under_uploads(filename):
     # ensure filename resolved under upload folder
@@ -65,16 +83,18 @@ def _remove_old_passport(user):
     except Exception:
         pass
 
-def _process_and_save_image_bytes(data_bytes, filename_base):
-    """Validate, resize and save image bytes. Returns relative path or raises."""
+def process_passport_image(source, target):
+    """Decode `source`, flatten it to RGB, bound it to MAX_PASSPORT_DIM and save it as JPEG at `target`.
+
+    Runs in the CPU pool (see `schedule_passport_processing`), so it only works on files. Returns target.
+    """
     if Image is None:
         raise RuntimeError('Pillow is not installed')
-    # quick size check
-    if len(data_bytes) > MAX_PASSPORT_BYTES:
-        # still allow, but we will resize; continue
-        pass
     try:
-        im = Image.open(io.BytesIO(data_bytes))
+        im = Image.open(source)
+        # decode at a reduced scale up front when the source is much larger than needed (JPEG only)
+        im.draft('RGB', (MAX_PASSPORT_DIM, MAX_PASSPORT_DIM))
+        im.load()
     except Exception as e:
         raise ValueError('Invalid image data: ' + str(e))
     # convert to RGB for JPEG
@@ -92,26 +112,298 @@ def _process_and_save_image_bytes(data_bytes, filename_base):
     maxdim = max(w, h)
     if maxdim > MAX_PASSPORT_DIM:
         scale = MAX_PASSPORT_DIM / float(maxdim)
-        neww = int(w * scale)
-        newh = int(h * scale)
-        im = im.resize((neww, newh), Image.LANCZOS)
-    # ensure dest directory
+        im = im.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    tmp = target + '.tmp'
+    try:
+        im.save(tmp, format='JPEG', quality=85, optimize=True)
+    except Exception:
+        im.save(tmp, format='JPEG')
+    os.replace(tmp, target)
+    return target
+
+
+def store_raw_passport(data, filename_base, ext='jpg'):
+    """Write uploaded passport bytes (or a file-like object) as-is under uploads/passports.
+
+    The request only pays for this write; `schedule_passport_processing` later swaps in the resized
+    JPEG. Names carry a random token so uploads never overwrite each other. Returns the relative path.
+    """
+    import shutil
+    import uuid
     dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
     os.makedirs(dest_dir, exist_ok=True)
-    fname = f"{secure_filename(filename_base)}.jpg"
-    target = os.path.join(dest_dir, fname)
-    # avoid overwriting by adding timestamp if exists
-    if os.path.exists(target):
-        ts = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-        fname = f"{secure_filename(filename_base)}_{ts}.jpg"
-        target = os.path.join(dest_dir, fname)
-    # save with reasonable quality
+    ext = (ext or 'jpg').lower().lstrip('.')
+    if ext not in PASSPORT_RAW_EXTS:
+        ext = 'jpg'
+    base = secure_filename(filename_base or '') or 'passport'
+    target = os.path.join(dest_dir, f"{base}_{uuid.uuid4().hex[:12]}_raw.{ext}")
+    with open(target, 'wb') as out:
+        if isinstance(data, (bytes, bytearray)):
+            out.write(data)
+        else:
+            shutil.copyfileobj(data, out, 64 * 1024)
+    return os.path.relpath(target)
+
+
+def _processed_passport_path(raw_path):
+    stem, _ext = os.path.splitext(raw_path)
+    if stem.endswith('_raw'):
+        stem = stem[:-len('_raw')]
+    return stem + '.jpg'
+
+
+def _swap_in_processed_passport(user_id, raw_rel, processed_rel):
+    """Point the user at the processed image unless they uploaded another passport meanwhile."""
+    with app.app_context():
+        try:
+            swapped = User.query.filter_by(id=user_id, passport_filename=raw_rel).update(
+                {'passport_filename': processed_rel}, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print('Failed to record processed passport:', raw_rel, e)
+            return
+    _remove_upload_file(raw_rel)
+    if not swapped:
+        _remove_upload_file(processed_rel)
+
+
+def _remove_upload_file(relpath):
     try:
-        im.save(target, format='JPEG', quality=85, optimize=True)
+        target = _safe_path_under_uploads(media_relpath(relpath) or '')
+        if os.path.isfile(target):
+            os.remove(target)
     except Exception:
-        # fallback
-        im.save(target, format='JPEG')
-    return os.path.relpath(target)
+        pass
+
+
+def schedule_passport_processing(user_id, raw_rel):
+    """Resize a stored raw passport in the background CPU pool and swap it in when done.
+
+    If processing fails the raw file stays in place, which is what the old inline fallback did.
+    """
+    if not raw_rel or Image is None:
+        return
+    processed_rel = _processed_passport_path(raw_rel)
+    source = os.path.abspath(raw_rel)
+    target = os.path.abspath(processed_rel)
+
+    def _done(fut):
+        if fut.exception() is not None:
+            print('Passport processing failed:', raw_rel, fut.exception())
+            return
+        _swap_in_processed_passport(user_id, raw_rel, processed_rel)
+
+    if app.config.get('JOBS_INLINE'):
+        try:
+            process_passport_image(source, target)
+        except Exception as e:
+            print('Passport processing failed:', raw_rel, e)
+            return
+        _swap_in_processed_passport(user_id, raw_rel, processed_rel)
+        return
+    try:
+        _get_cpu_pool().submit(process_passport_image, source, target).add_done_callback(_done)
+    except Exception as e:
+        print('Could not queue passport processing:', raw_rel, e)
+        _reset_cpu_pool()
+
+
+def save_passport_from_request(user, filename_base):
+    """Store the passport sent with the current form (file field `passport` or camera data URI in
+    `passport_data`) as raw bytes on `user`. Returns the raw relative path, or None if nothing was sent.
+
+    Call `schedule_passport_processing(user.id, path)` once the user row is committed.
+    """
+    pf = request.files.get('passport')
+    if pf and pf.filename:
+        ext = pf.filename.rsplit('.', 1)[1] if '.' in pf.filename else 'jpg'
+        rel = store_raw_passport(pf.stream, filename_base, ext)
+    elif request.form.get('passport_data'):
+        import base64
+        header, encoded = request.form.get('passport_data').split(',', 1)
+        mime = header.split(';')[0].split(':')[-1]
+        rel = store_raw_passport(base64.b64decode(encoded), filename_base, mime.split('/')[-1])
+    else:
+        return None
+    user.passport_filename = rel
+    return rel
+
+def store_content_addressed(fileobj, subdir, ext):
+    """Stream `fileobj` into uploads/<subdir>/<aa>/<sha256>.<ext>, hashing as it copies.
+
+    Identical content always lands on the same path, so duplicates are stored once.
+    Returns (relative path, sha256 hex digest, created) where `created` is False for a duplicate.
+    """
+    import hashlib
+    import tempfile
+    dest_root = os.path.join(app.config['UPLOAD_FOLDER'], subdir)
+    os.makedirs(dest_root, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=dest_root, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                block = fileobj.read(64 * 1024)
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+        sha = digest.hexdigest()
+        ext = (ext or '').lower().lstrip('.')
+        target_dir = os.path.join(dest_root, sha[:2])
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, f'{sha}.{ext}' if ext else sha)
+        created = not os.path.exists(target)
+        if created:
+            os.replace(tmp_path, target)
+        else:
+            os.remove(tmp_path)
+        return os.path.relpath(target), sha, created
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Image derivatives: size-bounded JPEG/WebP variants of question and exam images, built in
+# the background CPU pool when an image is stored and served by `serve_media_variant`.
+IMAGE_VARIANTS = {'thumb': 320, 'medium': 960}  # longest side in pixels
+IMAGE_VARIANT_FORMATS = {'jpg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp')}
+IMAGE_VARIANT_QUALITY = {'thumb': 70, 'medium': 80}
+# only these originals get variants; anything else under /media/v/ is a 404
+IMAGE_VARIANT_SOURCE_EXTS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp'}
+DERIVED_SUBDIR = 'derived'
+_variants_pending = set()
+_variants_lock = threading.Lock()
+
+
+def media_relpath(stored):
+    """Turn a stored image reference ('uploads/question_images/x.png' or 'question_images/x.png')
+    into a path relative to UPLOAD_FOLDER, or None."""
+    if not stored:
+        return None
+    p = str(stored).replace('\\', '/')
+    prefix = app.config['UPLOAD_FOLDER'].rstrip('/') + '/'
+    if p.startswith(prefix):
+        p = p[len(prefix):]
+    p = p.lstrip('/')
+    if not p or '..' in p.split('/'):
+        return None
+    return p
+
+
+def _variant_dir(relpath):
+    """Derivatives live under uploads/derived/<key>/; content-addressed images reuse their hash."""
+    import hashlib
+    stem = os.path.splitext(os.path.basename(relpath))[0]
+    if re.fullmatch(r'[0-9a-f]{64}', stem):
+        key = stem
+    else:
+        key = hashlib.sha256(relpath.encode('utf-8')).hexdigest()
+    return os.path.join(app.config['UPLOAD_FOLDER'], DERIVED_SUBDIR, key[:2], key)
+
+
+def build_image_variants(source, dest_dir):
+    """Worker: write every size/format variant of `source` into `dest_dir` (never upscaling).
+    Runs in the CPU process pool, so it only touches the filesystem."""
+    if Image is None:
+        return []
+    os.makedirs(dest_dir, exist_ok=True)
+    written = []
+    with Image.open(source) as im:
+        im.load()
+        has_alpha = im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info)
+        for name, bound in IMAGE_VARIANTS.items():
+            variant = im.copy()
+            variant.thumbnail((bound, bound), Image.LANCZOS)
+            for ext, (fmt, _) in IMAGE_VARIANT_FORMATS.items():
+                if fmt == 'JPEG':
+                    out = variant.convert('RGBA') if has_alpha else variant.convert('RGB')
+                    if has_alpha:
+                        bg = Image.new('RGB', out.size, (255, 255, 255))
+                        bg.paste(out, mask=out.split()[-1])
+                        out = bg
+                    kwargs = {'quality': IMAGE_VARIANT_QUALITY[name], 'optimize': True, 'progressive': True}
+                else:
+                    out = variant.convert('RGBA' if has_alpha else 'RGB')
+                    kwargs = {'quality': IMAGE_VARIANT_QUALITY[name], 'method': 4}
+                target = os.path.join(dest_dir, f'{name}.{ext}')
+                tmp = target + '.part'
+                out.save(tmp, format=fmt, **kwargs)
+                os.replace(tmp, target)
+                written.append(target)
+    return written
+
+
+def _variants_ready(relpath):
+    """True when every variant exists and is newer than the source image."""
+    source = os.path.join(app.config['UPLOAD_FOLDER'], relpath)
+    dest = _variant_dir(relpath)
+    try:
+        src_mtime = os.path.getmtime(source)
+        return all(os.path.getmtime(os.path.join(dest, f'{n}.{e}')) >= src_mtime
+                   for n in IMAGE_VARIANTS for e in IMAGE_VARIANT_FORMATS)
+    except OSError:
+        return False
+
+
+def schedule_image_variants(stored):
+    """Queue derivative generation for a stored image in the background CPU pool.
+    Safe to call repeatedly; in-flight and up-to-date images are skipped."""
+    relpath = media_relpath(stored)
+    if not relpath or Image is None:
+        return
+    source = os.path.join(app.config['UPLOAD_FOLDER'], relpath)
+    if not os.path.isfile(source) or _variants_ready(relpath):
+        return
+    dest = _variant_dir(relpath)
+    with _variants_lock:
+        if relpath in _variants_pending:
+            return
+        _variants_pending.add(relpath)
+
+    def _done(_fut=None):
+        with _variants_lock:
+            _variants_pending.discard(relpath)
+        if _fut is not None and _fut.exception() is not None:
+            print('Image variant generation failed:', relpath, _fut.exception())
+
+    if app.config.get('JOBS_INLINE'):
+        try:
+            build_image_variants(source, dest)
+        except Exception as e:
+            print('Image variant generation failed:', relpath, e)
+        _done()
+        return
+    try:
+        _get_cpu_pool().submit(build_image_variants, source, dest).add_done_callback(_done)
+    except Exception as e:
+        print('Could not queue image variants:', e)
+        _reset_cpu_pool()
+        _done()
+
+
+def media_variant_urls(stored):
+    """URLs for an image's original and derived variants (None when there is no image)."""
+    relpath = media_relpath(stored)
+    if not relpath:
+        return None
+    urls = {'original': url_for('serve_uploads', filename=relpath)}
+    for name in IMAGE_VARIANTS:
+        for ext in IMAGE_VARIANT_FORMATS:
+            key = name if ext == 'jpg' else f'{name}_{ext}'
+            urls[key] = url_for('serve_media_variant', variant=f'{name}.{ext}', filename=relpath)
+    return urls
+
+
+@app.template_filter('media_url')
+def media_url_filter(stored, variant='medium.jpg'):
+    relpath = media_relpath(stored)
+    if not relpath:
+        return ''
+    if variant == 'original':
+        return url_for('serve_uploads', filename=relpath)
+    return url_for('serve_media_variant', variant=variant, filename=relpath)
 
 # Helper to execute raw DDL in a SQLAlchemy-2-compatible way
 def _exec_ddl(sql):
@@ -129,7 +421,7 @@ def _exec_ddl(sql):
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'admin' or 'student'
     full_name = db.Column(db.String(100))
     # Optional gender field for students/admins (e.g. Male/Female/Other)
@@ -152,11 +444,16 @@ class User(db.Model):
     school = db.relationship('School', backref='users')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=password_hash_method(self.role))
     
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        """True when the stored hash was made with a different method/cost than the current policy."""
+        stored_method = (self.password_hash or '').split('$', 1)[0]
+        return stored_method != password_hash_method(self.role)
+
 class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -223,6 +520,179 @@ def set_setting(key, value):
     return False
 
 
+# Password hashing policy
+PASSWORD_HASH_PRESETS = {
+    'high': 'scrypt:32768:8:1',   # werkzeug default, ~32MB and ~130ms per hash
+    'medium': 'scrypt:16384:8:1',
+    'low': 'scrypt:4096:8:1',     # ~4MB and ~15ms per hash
+}
+PASSWORD_POLICY_TTL = 60  # seconds before DB overrides are re-read
+_password_policy_cache = {'loaded_at': None, 'admin': None, 'student': None}
+
+
+def normalize_password_hash_method(value):
+    """Expand a preset name or werkzeug method string to the exact prefix stored in hashes.
+
+    Raises ValueError for anything werkzeug cannot hash with.
+    """
+    v = (value or '').strip().lower()
+    v = PASSWORD_HASH_PRESETS.get(v, v)
+    parts = v.split(':')
+    if parts[0] == 'scrypt':
+        if len(parts) == 1:
+            return PASSWORD_HASH_PRESETS['high']
+        if len(parts) == 4 and all(p.isdigit() and int(p) > 0 for p in parts[1:]):
+            n = int(parts[1])
+            if n & (n - 1):
+                raise ValueError('scrypt cost N must be a power of two')
+            return v
+    elif parts[0] == 'pbkdf2':
+        hash_name = parts[1] if len(parts) > 1 and parts[1] else 'sha256'
+        iterations = parts[2] if len(parts) > 2 else str(DEFAULT_PBKDF2_ITERATIONS)
+        if len(parts) <= 3 and iterations.isdigit() and int(iterations) > 0:
+            return f'pbkdf2:{hash_name}:{int(iterations)}'
+    raise ValueError(f'Unsupported password hash method: {value}')
+
+
+def _load_password_policy():
+    policy = {}
+    for tier in ('admin', 'student'):
+        configured = app.config.get(f'PASSWORD_HASH_{tier.upper()}')
+        try:
+            override = get_setting(f'password_hash_{tier}')
+        except Exception:
+            override = None
+        method = None
+        for candidate in (override, configured):
+            if not candidate:
+                continue
+            try:
+                method = normalize_password_hash_method(candidate)
+                break
+            except ValueError:
+                print(f'Ignoring invalid password hash policy for {tier}:', candidate)
+        policy[tier] = method or PASSWORD_HASH_PRESETS['high']
+    return policy
+
+
+def password_hash_method(role):
+    """Return the werkzeug hash method for an account role ('student' vs everything else)."""
+    tier = 'student' if role == 'student' else 'admin'
+    now = datetime.utcnow()
+    loaded_at = _password_policy_cache.get('loaded_at')
+    if not loaded_at or (now - loaded_at).total_seconds() > PASSWORD_POLICY_TTL:
+        _password_policy_cache.update(_load_password_policy())
+        _password_policy_cache['loaded_at'] = now
+    return _password_policy_cache[tier]
+
+
+def invalidate_password_policy():
+    _password_policy_cache['loaded_at'] = None
+
+
+def _rehash_password_if_needed(user, password):
+    """Transparently upgrade/downgrade a stored hash after a successful login."""
+    try:
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+    except Exception as e:
+        print('Password rehash failed:', e)
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+
+
+# Bulk credential hashing: spread password hashing for imports/resets across all cores.
+HASH_POOL_MIN_BATCH = 32    # below this, dispatching to the pool costs more than it saves
+HASH_CHUNK_SIZE = 1000      # passwords in flight at once (bounds pool queue and result memory)
+HASH_POOL_WORKERS = os.cpu_count() or 1
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def _get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS)
+        return _hash_pool
+
+
+def _reset_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        pool, _hash_pool = _hash_pool, None
+    if pool is not None:
+        try:
+            pool.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            pass
+
+
+# Separate pool for other CPU-bound work (sheet parsing, image variants) so it never queues
+# behind a bulk password hash
+_cpu_pool = None
+
+
+def _get_cpu_pool():
+    global _cpu_pool
+    with _hash_pool_lock:
+        if _cpu_pool is None:
+            _cpu_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+        return _cpu_pool
+
+
+def _reset_cpu_pool():
+    global _cpu_pool
+    with _hash_pool_lock:
+        pool, _cpu_pool = _cpu_pool, None
+    if pool is not None:
+        try:
+            pool.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            pass
+
+
+def hash_passwords_bulk(passwords, role='student', chunk_size=HASH_CHUNK_SIZE):
+    """Hash a batch of passwords with the role's policy across a process pool.
+
+    Returns (hashes, stats) where hashes line up with `passwords` and stats holds
+    count, seconds, per_second and workers for reporting throughput.
+    """
+    passwords = list(passwords)
+    hasher = partial(generate_password_hash, method=password_hash_method(role))
+    started = time.perf_counter()
+    hashes = []
+    workers = 1
+    if len(passwords) >= HASH_POOL_MIN_BATCH:
+        try:
+            pool = _get_hash_pool()
+            workers = HASH_POOL_WORKERS
+            per_task = max(1, chunk_size // (workers * 4))
+            for i in range(0, len(passwords), chunk_size):
+                hashes.extend(pool.map(hasher, passwords[i:i + chunk_size], chunksize=per_task))
+        except Exception as e:
+            # e.g. BrokenProcessPool after a worker was killed; finish the batch inline
+            print('Parallel password hashing failed, continuing inline:', e)
+            _reset_hash_pool()
+            workers = 1
+    hashes.extend(hasher(pw) for pw in passwords[len(hashes):])
+    elapsed = time.perf_counter() - started
+    stats = {
+        'count': len(passwords),
+        'seconds': elapsed,
+        'per_second': (len(passwords) / elapsed) if elapsed > 0 else 0.0,
+        'workers': workers,
+    }
+    return hashes, stats
+
+
+def _hash_stats_summary(stats):
+    return (f"hashed {stats['count']} password(s) in {stats['seconds']:.1f}s "
+            f"({stats['per_second']:.0f}/s on {stats['workers']} worker(s))")
+
 
 # Defensive schema updates for newly added columns (run at import)
 def _ensure_schema():
@@ -325,7 +795,27 @@ class Question(db.Model):
     theory_text = db.Column(db.Text, nullable=True)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
+
+
+class QuestionFingerprint(db.Model):
+    """Duplicate-detection fingerprint of one question: a hash of its normalized text for
+    exact matches and a packed MinHash signature for near matches."""
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    subject_id = db.Column(db.Integer, nullable=False)
+    exact_hash = db.Column(db.String(40), nullable=False)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    __table_args__ = (db.Index('ix_question_fingerprint_exact', 'subject_id', 'exact_hash'),)
+
+
+class QuestionLshBucket(db.Model):
+    """One LSH band of a question's MinHash signature; questions sharing a bucket are near-duplicate candidates."""
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False, index=True)
+    subject_id = db.Column(db.Integer, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+    __table_args__ = (db.Index('ix_question_lsh_bucket', 'subject_id', 'bucket'),)
+
+
 class Exam(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
@@ -356,10 +846,57 @@ class ExamSession(db.Model):
     end_time = db.Column(db.DateTime)
     score = db.Column(db.Float)
     status = db.Column(db.String(20), default='in_progress')  # in_progress, completed, submitted
+    # Set whenever the session is (re)graded; /admin/results/changes pages through it by keyset
+    graded_at = db.Column(db.DateTime)
+    # School and class this session's score is counted under in ExamStats (NULL until counted),
+    # so a regrade withdraws the old score from the right scope after the student moved class
+    stats_school_id = db.Column(db.Integer)
+    stats_class = db.Column(db.String(50))
     
     # Relationships
     exam = db.relationship('Exam', backref='sessions')
     student = db.relationship('User', backref='exam_sessions')
+    # deleting a session takes its graded-script snapshot with it
+    script = db.relationship('ScriptSnapshot', uselist=False, cascade='all, delete-orphan')
+
+
+class ScriptSnapshot(db.Model):
+    """Frozen copy of a graded script (questions, options, selections, marks, timing) as
+    zlib-compressed JSON, so result pages and PDFs read one row instead of re-querying."""
+    exam_session_id = db.Column(db.Integer, db.ForeignKey('exam_session.id'), primary_key=True)
+    student_id = db.Column(db.Integer, nullable=False, index=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def script(self):
+        import zlib
+        return json.loads(zlib.decompress(self.data).decode('utf-8'))
+
+
+class ExamStats(db.Model):
+    """Running score aggregates of one exam for one scope: every school (school_id 0), one
+    school (student_class ''), or one class of a school. Kept current by grade_exam_session."""
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exam.id'), nullable=False)
+    school_id = db.Column(db.Integer, nullable=False, default=0)
+    student_class = db.Column(db.String(50), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+    total_sq = db.Column(db.Float, nullable=False, default=0)
+    min_score = db.Column(db.Float)
+    max_score = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.UniqueConstraint('exam_id', 'school_id', 'student_class', name='uq_exam_stats_scope'),)
+
+
+class ExamStatsBin(db.Model):
+    """Score histogram of an ExamStats scope in EXAM_STATS_BINS equal-width percentage bins;
+    percentiles and ranks are read off it."""
+    stats_id = db.Column(db.Integer, db.ForeignKey('exam_stats.id'), primary_key=True)
+    bin = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
 
 class Answer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -403,6 +940,94 @@ class Recording(db.Model):
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class RecordingUpload(db.Model):
+    """An in-progress chunked recording upload; chunks are appended to uploads/recordings/partial/<id>.part."""
+    id = db.Column(db.String(32), primary_key=True)  # random token handed to the client
+    exam_session_id = db.Column(db.Integer, db.ForeignKey('exam_session.id'), index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    ext = db.Column(db.String(10), default='webm')
+    status = db.Column(db.String(20), default='open')  # open, complete
+    next_index = db.Column(db.Integer, default=0)
+    bytes_received = db.Column(db.BigInteger, default=0)
+    recording_id = db.Column(db.Integer, db.ForeignKey('recording.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'status': self.status,
+            'next_index': self.next_index or 0,
+            'bytes_received': self.bytes_received or 0,
+            'recording_id': self.recording_id,
+        }
+
+
+class RecordingChunk(db.Model):
+    """Checksum of each chunk accepted for a RecordingUpload, so retried chunks can be recognised."""
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(db.String(32), db.ForeignKey('recording_upload.id'), nullable=False)
+    index = db.Column(db.Integer, nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    __table_args__ = (db.UniqueConstraint('upload_id', 'index', name='uq_recording_chunk'),)
+
+
+class Job(db.Model):
+    """A long-running admin operation executed off the request path (see `enqueue_job`)."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False, index=True)
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, completed, failed, cancelled
+    progress_done = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(300))
+    # JSON blobs: handler input, resume position written with each committed chunk, and final output
+    params = db.Column(db.Text)
+    checkpoint = db.Column(db.Text)
+    result = db.Column(db.Text)
+    result_file = db.Column(db.String(300), nullable=True)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def result_data(self):
+        try:
+            return json.loads(self.result) if self.result else None
+        except Exception:
+            return None
+
+    def to_dict(self):
+        percent = None
+        if self.progress_total:
+            percent = min(100, int(100 * (self.progress_done or 0) / self.progress_total))
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'done': self.progress_done or 0,
+            'total': self.progress_total,
+            'percent': percent,
+            'message': self.message,
+            'error': self.error,
+            'attempts': self.attempts or 0,
+            'has_file': bool(self.result_file),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
 def generate_unique_exam_code(attempts=10):
     """Generate a unique six-digit numeric code for an exam."""
     for _ in range(attempts):
@@ -422,6 +1047,331 @@ def generate_unique_access_code(attempts=20):
     # fallback deterministic
     return datetime.utcnow().strftime('%f')[-6:]
 
+# Full-text search over the question bank. On SQLite an FTS5 table indexes the question text,
+# options, explanation and theory prompt as external content of `question`; triggers keep it in
+# step with every insert/update/delete, including bulk Core statements. Other databases fall back
+# to a LIKE scan.
+QUESTION_FTS_COLUMNS = ('question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'option_e',
+                        'explanation', 'theory_text')
+QUESTION_FTS_SNIPPET_MARKS = ('\x02', '\x03')  # highlight delimiters; the page escapes text then swaps these for <mark>
+_question_fts_ready = None
+
+
+def ensure_question_fts():
+    """Create the FTS5 index and its triggers if missing (SQLite only); rebuild it when new."""
+    global _question_fts_ready
+    if db.engine.dialect.name != 'sqlite':
+        _question_fts_ready = False
+        return False
+    from sqlalchemy import text
+    cols = ', '.join(QUESTION_FTS_COLUMNS)
+    new_cols = ', '.join(f'new.{c}' for c in QUESTION_FTS_COLUMNS)
+    old_cols = ', '.join(f'old.{c}' for c in QUESTION_FTS_COLUMNS)
+    with db.engine.begin() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'question_fts'")).first()
+        if not exists:
+            conn.exec_driver_sql(f"CREATE VIRTUAL TABLE question_fts USING fts5({cols}, content='question', "
+                                 f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS question_fts_ai AFTER INSERT ON question BEGIN "
+                             f"INSERT INTO question_fts(rowid, {cols}) VALUES (new.id, {new_cols}); END")
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS question_fts_ad AFTER DELETE ON question BEGIN "
+                             f"INSERT INTO question_fts(question_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END")
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS question_fts_au AFTER UPDATE OF {cols} ON question BEGIN "
+                             f"INSERT INTO question_fts(question_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+                             f"INSERT INTO question_fts(rowid, {cols}) VALUES (new.id, {new_cols}); END")
+        if not exists:
+            conn.exec_driver_sql("INSERT INTO question_fts(question_fts) VALUES ('rebuild')")
+    _question_fts_ready = True
+    return True
+
+
+def question_fts_available():
+    global _question_fts_ready
+    if _question_fts_ready is None:
+        try:
+            from sqlalchemy import text
+            _question_fts_ready = (db.engine.dialect.name == 'sqlite' and db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'question_fts'")).first() is not None)
+        except Exception:
+            _question_fts_ready = False
+    return _question_fts_ready
+
+
+def question_match_expression(q):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix.
+    Words are quoted so user input can never be parsed as FTS syntax."""
+    words = re.findall(r'\w+', q or '', re.UNICODE)[:12]
+    if not words:
+        return None
+    terms = ['"%s"' % w for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+@app.template_filter('search_snippet')
+def search_snippet_filter(snippet):
+    """Escape an FTS snippet and turn its highlight delimiters into <mark> tags."""
+    from markupsafe import Markup, escape
+    start, end = QUESTION_FTS_SNIPPET_MARKS
+    return Markup(str(escape(snippet or '')).replace(start, '<mark>').replace(end, '</mark>'))
+
+# Near-duplicate question detection. Every question gets a fingerprint: a hash of its normalized
+# text and options (exact duplicates) and a MinHash signature over character shingles whose bands are
+# stored as LSH buckets (near duplicates). A lookup only touches the hash/bucket indexes and the few
+# candidates they return, so checking a new question costs the same for a bank of 1k or 1M rows.
+QUESTION_FINGERPRINT_FIELDS = ('question_text', 'theory_text', 'option_a', 'option_b', 'option_c',
+                               'option_d', 'option_e')
+QUESTION_SHINGLE_SIZE = 5
+QUESTION_MINHASH_PERMUTATIONS = 64
+# 16 bands of 4 rows: pairs above ~0.5 similarity almost always share a bucket
+QUESTION_LSH_BANDS = 16
+QUESTION_NEAR_DUPLICATE_THRESHOLD = float(os.environ.get('QUESTION_NEAR_DUPLICATE_THRESHOLD', '0.8'))
+QUESTION_FINGERPRINT_CHUNK = 500
+# a bucket shared by more questions than this is boilerplate ("Which of the following..."), not a
+# duplicate signal; the report skips it rather than comparing every pair inside it
+QUESTION_LSH_MAX_BUCKET = 50
+_MINHASH_PRIME = (1 << 32) - 5
+# fixed seed: signatures must stay comparable across processes and restarts
+_minhash_rng = np.random.RandomState(0x5eed)
+_MINHASH_A = _minhash_rng.randint(1, _MINHASH_PRIME, size=QUESTION_MINHASH_PERMUTATIONS).astype(np.uint64)
+_MINHASH_B = _minhash_rng.randint(0, _MINHASH_PRIME, size=QUESTION_MINHASH_PERMUTATIONS).astype(np.uint64)
+
+
+def normalize_question_text(text):
+    """Lower-case, strip accents and punctuation, collapse whitespace."""
+    import unicodedata
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.findall(r'\w+', text.lower(), re.UNICODE))
+
+
+def question_fingerprint(q):
+    """(exact_hash, minhash signature) of a Question or a question row dict."""
+    import hashlib, zlib
+    get = q.get if isinstance(q, dict) else partial(getattr, q)
+    fields = [normalize_question_text(get(f, None)) for f in QUESTION_FINGERPRINT_FIELDS]
+    exact_hash = hashlib.sha1('\x1f'.join(fields).encode('utf-8')).hexdigest()
+    text = ' '.join(f for f in fields if f)
+    k = QUESTION_SHINGLE_SIZE
+    shingles = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+    signature = ((np.outer(_MINHASH_A, hashes) + _MINHASH_B[:, None]) % _MINHASH_PRIME).min(axis=1)
+    return exact_hash, signature.astype('<u4')
+
+
+def minhash_similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def lsh_buckets(signature):
+    import hashlib
+    rows = len(signature) // QUESTION_LSH_BANDS
+    return [int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * rows:(band + 1) * rows].tobytes(),
+                                           digest_size=8).digest(), 'big', signed=True)
+            for band in range(QUESTION_LSH_BANDS)]
+
+
+def _in_chunks(values, size=QUESTION_FINGERPRINT_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def drop_question_fingerprints(question_ids):
+    """Remove questions from the duplicate index; call alongside any question delete."""
+    for chunk in _in_chunks(question_ids):
+        QuestionFingerprint.query.filter(QuestionFingerprint.question_id.in_(chunk)).delete(synchronize_session=False)
+        QuestionLshBucket.query.filter(QuestionLshBucket.question_id.in_(chunk)).delete(synchronize_session=False)
+
+
+def index_question_fingerprints(questions, fingerprints=None, replace=True):
+    """(Re)index Questions or row dicts carrying `id` and `subject_id`. Pass `fingerprints`
+    when they were already computed, and replace=False for freshly inserted rows. The caller commits."""
+    ids, prints, buckets = [], [], []
+    for i, q in enumerate(questions):
+        get = q.get if isinstance(q, dict) else partial(getattr, q)
+        qid, sid = get('id'), get('subject_id')
+        exact_hash, signature = fingerprints[i] if fingerprints is not None else question_fingerprint(q)
+        ids.append(qid)
+        prints.append({'question_id': qid, 'subject_id': sid, 'exact_hash': exact_hash,
+                       'signature': signature.tobytes()})
+        buckets.extend({'question_id': qid, 'subject_id': sid, 'bucket': b} for b in lsh_buckets(signature))
+    if not ids:
+        return 0
+    if replace:
+        drop_question_fingerprints(ids)
+    db.session.execute(QuestionFingerprint.__table__.insert(), prints)
+    db.session.execute(QuestionLshBucket.__table__.insert(), buckets)
+    return len(ids)
+
+
+def find_question_duplicates(subject_id, fingerprints, exclude_ids=()):
+    """Match fingerprints against the indexed questions of one subject.
+
+    Returns one entry per fingerprint: None, or (question_id, similarity, 'exact'|'near') for
+    an identical question or the most similar one at or above the near-duplicate threshold.
+    """
+    exclude_ids = set(exclude_ids)
+    results = [None] * len(fingerprints)
+    exact = {}
+    for chunk in _in_chunks({h for h, _ in fingerprints}):
+        for qid, h in (db.session.query(QuestionFingerprint.question_id, QuestionFingerprint.exact_hash)
+                       .filter(QuestionFingerprint.subject_id == subject_id, QuestionFingerprint.exact_hash.in_(chunk))):
+            if qid not in exclude_ids:
+                exact.setdefault(h, qid)
+    pending = []
+    for i, (h, signature) in enumerate(fingerprints):
+        if h in exact:
+            results[i] = (exact[h], 1.0, 'exact')
+        else:
+            pending.append((i, signature, lsh_buckets(signature)))
+    if not pending:
+        return results
+
+    owners = {}
+    for chunk in _in_chunks({b for _, _, bs in pending for b in bs}):
+        for bucket, qid in (db.session.query(QuestionLshBucket.bucket, QuestionLshBucket.question_id)
+                            .filter(QuestionLshBucket.subject_id == subject_id, QuestionLshBucket.bucket.in_(chunk))):
+            if qid not in exclude_ids:
+                owners.setdefault(bucket, set()).add(qid)
+    signatures = {}
+    for chunk in _in_chunks({qid for qids in owners.values() for qid in qids}):
+        for qid, sig in db.session.query(QuestionFingerprint.question_id, QuestionFingerprint.signature) \
+                .filter(QuestionFingerprint.question_id.in_(chunk)):
+            signatures[qid] = np.frombuffer(sig, dtype='<u4')
+    for i, signature, bs in pending:
+        candidates = set().union(*(owners.get(b, ()) for b in bs
+                                   if len(owners.get(b, ())) <= QUESTION_LSH_MAX_BUCKET))
+        scored = [(qid, minhash_similarity(signature, signatures[qid])) for qid in candidates if qid in signatures]
+        best = max(scored, key=lambda t: (t[1], -t[0]), default=None)
+        if best and best[1] >= QUESTION_NEAR_DUPLICATE_THRESHOLD:
+            results[i] = (best[0], best[1], 'near')
+    return results
+
+
+def screen_question_duplicates(rows, duplicates=None):
+    """Drop rows that repeat an existing question (or an earlier row) of the same subject
+    word for word; near duplicates are kept but counted in `duplicates`.
+    Returns (kept_rows, their_fingerprints)."""
+    fingerprints = [question_fingerprint(r) for r in rows]
+    by_subject = {}
+    for i, r in enumerate(rows):
+        by_subject.setdefault(r['subject_id'], []).append(i)
+    skip = set()
+    near = 0
+    for sid, idx in by_subject.items():
+        seen = set()
+        for i, match in zip(idx, find_question_duplicates(sid, [fingerprints[i] for i in idx])):
+            h = fingerprints[i][0]
+            if h in seen or (match and match[2] == 'exact'):
+                skip.add(i)
+            elif match:
+                near += 1
+            seen.add(h)
+    if duplicates is not None:
+        duplicates['exact'] = duplicates.get('exact', 0) + len(skip)
+        duplicates['near'] = duplicates.get('near', 0) + near
+    keep = [i for i in range(len(rows)) if i not in skip]
+    return [rows[i] for i in keep], [fingerprints[i] for i in keep]
+
+
+def duplicate_summary(duplicates):
+    """Flash/job-message suffix for the counts collected by screen_question_duplicates."""
+    parts = []
+    if duplicates.get('exact'):
+        parts.append(f"{duplicates['exact']} duplicate(s) skipped")
+    if duplicates.get('near'):
+        parts.append(f"{duplicates['near']} near-duplicate(s) flagged for review")
+    return (', ' + ', '.join(parts)) if parts else ''
+
+
+def question_duplicate_clusters(subject_ids=None, limit=200):
+    """Group indexed questions into clusters of exact and near duplicates.
+
+    Candidate pairs come from shared exact hashes and shared LSH buckets (one GROUP BY each),
+    are verified against the threshold, then merged with union-find. Returns a list of
+    {'subject_id', 'question_ids', 'similarity'} dicts, largest clusters first.
+    """
+    pairs = {}
+
+    def scoped(q, model):
+        return q.filter(model.subject_id.in_(subject_ids)) if subject_ids is not None else q
+
+    groups = []
+    for model, key in ((QuestionFingerprint, QuestionFingerprint.exact_hash), (QuestionLshBucket, QuestionLshBucket.bucket)):
+        shared = scoped(db.session.query(model.subject_id, key.label('k')), model) \
+            .group_by(model.subject_id, key).having(func.count() > 1).subquery()
+        q = db.session.query(model.subject_id, key, model.question_id) \
+            .join(shared, (shared.c.subject_id == model.subject_id) & (shared.c.k == key))
+        members = {}
+        for sid, k, qid in q:
+            members.setdefault((sid, k), []).append(qid)
+        groups.append(members.values())
+    exact_groups, bucket_groups = groups
+    for qids in exact_groups:
+        qids = sorted(qids)
+        for other in qids[1:]:
+            pairs[(qids[0], other)] = 1.0
+    candidate_pairs = set()
+    for qids in bucket_groups:
+        qids = sorted(set(qids))
+        if len(qids) > QUESTION_LSH_MAX_BUCKET:
+            continue
+        candidate_pairs.update((a, b) for n, a in enumerate(qids) for b in qids[n + 1:] if (a, b) not in pairs)
+    signatures = {}
+    for chunk in _in_chunks({qid for pair in candidate_pairs for qid in pair}):
+        for qid, sig in db.session.query(QuestionFingerprint.question_id, QuestionFingerprint.signature) \
+                .filter(QuestionFingerprint.question_id.in_(chunk)):
+            signatures[qid] = np.frombuffer(sig, dtype='<u4')
+    for a, b in candidate_pairs:
+        if a in signatures and b in signatures:
+            sim = minhash_similarity(signatures[a], signatures[b])
+            if sim >= QUESTION_NEAR_DUPLICATE_THRESHOLD:
+                pairs[(a, b)] = sim
+
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    clusters = {}
+    for (a, b), sim in pairs.items():
+        c = clusters.setdefault(find(a), {'question_ids': set(), 'similarity': 1.0})
+        c['question_ids'].update((a, b))
+        c['similarity'] = min(c['similarity'], sim)
+    subject_of = {}
+    for chunk in _in_chunks(clusters):
+        subject_of.update(db.session.query(QuestionFingerprint.question_id, QuestionFingerprint.subject_id)
+                          .filter(QuestionFingerprint.question_id.in_(chunk)))
+    result = [{'subject_id': subject_of.get(root), 'question_ids': sorted(c['question_ids']),
+               'similarity': round(c['similarity'], 2)} for root, c in clusters.items()]
+    result.sort(key=lambda c: (-len(c['question_ids']), -c['similarity'], c['question_ids'][0]))
+    return result[:limit], len(result)
+
+
+def backfill_question_fingerprints(batch=2000, progress=None):
+    """Fingerprint questions that are not indexed yet (existing banks, or rows written by older code)."""
+    done = 0
+    while True:
+        missing = Question.query.outerjoin(QuestionFingerprint, QuestionFingerprint.question_id == Question.id) \
+            .filter(QuestionFingerprint.question_id.is_(None)).order_by(Question.id).limit(batch).all()
+        if not missing:
+            return done
+        index_question_fingerprints(missing)
+        done += len(missing)
+        if progress:
+            progress(done)
+        else:
+            db.session.commit()
+
 # Create database tables (moved to init function to avoid running on import)
 def init_db():
     with app.app_context():
@@ -467,6 +1417,35 @@ def init_db():
                             pass
         except Exception:
             pass
+        # Ensure exam_session has graded_at (the results change feed cursor) with its keyset index
+        try:
+            from sqlalchemy import inspect
+            inspector = inspect(db.engine)
+            if 'exam_session' in inspector.get_table_names():
+                es_cols = [c['name'] for c in inspector.get_columns('exam_session')]
+                if 'graded_at' not in es_cols:
+                    _exec_ddl("ALTER TABLE exam_session ADD COLUMN graded_at DATETIME")
+                    from sqlalchemy import text
+                    db.session.execute(text("UPDATE exam_session SET graded_at = COALESCE(end_time, start_time) WHERE status = 'completed'"))
+                    db.session.commit()
+                    print('Added graded_at to exam_session table')
+                _exec_ddl("CREATE INDEX IF NOT EXISTS ix_exam_session_graded_at_id ON exam_session (graded_at, id)")
+                if 'stats_class' not in es_cols:
+                    _exec_ddl("ALTER TABLE exam_session ADD COLUMN stats_school_id INTEGER")
+                    _exec_ddl("ALTER TABLE exam_session ADD COLUMN stats_class VARCHAR(50)")
+                    # stats built before sessions recorded their scope are rebuilt on next read
+                    from sqlalchemy import text
+                    db.session.execute(text("DELETE FROM exam_stats_bin"))
+                    db.session.execute(text("DELETE FROM exam_stats"))
+                    db.session.commit()
+                    print('Added stats scope columns to exam_session table')
+        except Exception:
+            pass
+        # Full-text index over the question bank (SQLite FTS5)
+        try:
+            ensure_question_fts()
+        except Exception as e:
+            print('Question search index unavailable:', e)
         # Ensure exam table has exam_image column
         try:
             from sqlalchemy import inspect
@@ -676,14 +1655,17 @@ def init_db():
             if existing_students < 50:
                 needed = 50 - existing_students
                 code_base = 100000
+                seeded = []
                 for i in range(needed):
                     code_candidate = '{:06d}'.format(code_base + existing_students + i + 1)
                     if not User.query.filter_by(username=code_candidate).first():
                         name_index = existing_students + i
                         full_name = STUDENT_SEED_NAMES[name_index] if name_index < len(STUDENT_SEED_NAMES) else f"Student {existing_students + i + 1}"
-                        student = User(username=code_candidate, role='student', full_name=full_name)
-                        student.set_password(code_candidate)
-                        db.session.add(student)
+                        seeded.append(User(username=code_candidate, role='student', full_name=full_name))
+                hashes, _ = hash_passwords_bulk([st.username for st in seeded], role='student')
+                for student, pw_hash in zip(seeded, hashes):
+                    student.password_hash = pw_hash
+                    db.session.add(student)
                 db.session.commit()
                 print(f"Seeded {needed} students with six-digit codes.")
 
@@ -865,6 +1847,500 @@ def init_db():
         except Exception as _e:
             # If any DB schema differences cause failures during seeding, skip seeding to avoid import-time crash.
             print('Seeding skipped due to error:', str(_e))
+        # Fingerprint any questions the duplicate index hasn't seen (existing banks, seeded rows)
+        try:
+            indexed = backfill_question_fingerprints()
+            if indexed:
+                print(f'Indexed {indexed} question(s) for duplicate detection')
+        except Exception as e:
+            db.session.rollback()
+            print('Question duplicate index backfill skipped:', e)
+# Background jobs: long admin operations (imports, bulk deletes, AI generation, exports)
+# run on a small in-process thread pool instead of inside the request. Progress,
+# checkpoints and results live on the Job row so any worker process can report on them.
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', '2'))
+# Run jobs synchronously inside the request (useful for tests and single-threaded dev servers)
+app.config['JOBS_INLINE'] = os.environ.get('JOBS_INLINE', '').lower() in ('1', 'true', 'yes')
+JOB_STALE_SECONDS = 300
+# a running job's heartbeat is refreshed this often by a side thread, independent of how long
+# the handler goes between progress reports, so only jobs of dead workers ever look stale
+JOB_HEARTBEAT_SECONDS = 60
+JOB_HANDLERS = {}
+_job_executor = None
+_job_lock = threading.Lock()
+_jobs_recovered = False
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    """Raised by a handler to fail its job while still recording `result` (e.g. the rows that
+    made an import fail); the message becomes the job's message and error."""
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+def job_handler(kind):
+    """Register `fn(ctx)` as the handler for jobs of `kind`; its return value becomes the job result."""
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def job_workdir(job_id):
+    path = os.path.join(app.config.get('PRIVATE_FOLDER', 'private'), 'jobs', str(job_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class JobContext:
+    """Handed to a job handler: its params, last checkpoint and progress reporting."""
+
+    def __init__(self, job):
+        self.job = job
+        self.params = json.loads(job.params or '{}')
+        self.checkpoint = json.loads(job.checkpoint or '{}')
+
+    @property
+    def workdir(self):
+        return job_workdir(self.job.id)
+
+    def progress(self, done, total=None, message=None, checkpoint=None):
+        """Record progress and commit. Pending handler writes are committed together with the
+        checkpoint, so a restarted job resumes exactly after the last committed chunk."""
+        job = self.job
+        job.progress_done = done
+        if total is not None:
+            job.progress_total = total
+        if message is not None:
+            job.message = message[:300]
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+            job.checkpoint = json.dumps(checkpoint)
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+        if db.session.query(Job.cancel_requested).filter(Job.id == job.id).scalar():
+            raise JobCancelled()
+
+    def set_result_file(self, path):
+        self.job.result_file = path
+
+
+def _finish_job(job_id, **values):
+    values.setdefault('finished_at', datetime.utcnow())
+    try:
+        db.session.rollback()
+    except Exception:
+        pass
+    Job.query.filter_by(id=job_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def _job_heartbeat(job_id, stop):
+    """Stamp heartbeat_at every JOB_HEARTBEAT_SECONDS until `stop` is set."""
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        with app.app_context():
+            try:
+                Job.query.filter_by(id=job_id, status='running').update(
+                    {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print('Job heartbeat failed:', job_id, e)
+            finally:
+                db.session.remove()
+
+
+def _run_job(job_id):
+    """Claim a queued job and run its handler; failures are recorded on the job only."""
+    stop_heartbeat = threading.Event()
+    with app.app_context():
+        try:
+            now = datetime.utcnow()
+            claimed = Job.query.filter_by(id=job_id, status='queued').update({
+                'status': 'running', 'started_at': now, 'heartbeat_at': now, 'finished_at': None,
+                'error': None, 'attempts': Job.attempts + 1,
+            }, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                return
+            threading.Thread(target=_job_heartbeat, args=(job_id, stop_heartbeat),
+                             name=f'job-{job_id}-heartbeat', daemon=True).start()
+            job = Job.query.get(job_id)
+            handler = JOB_HANDLERS.get(job.kind)
+            if not handler:
+                raise ValueError(f'No handler registered for job kind "{job.kind}"')
+            result = handler(JobContext(job))
+            job.status = 'completed'
+            job.result = json.dumps(result) if result is not None else None
+            job.finished_at = datetime.utcnow()
+            if job.progress_total is not None:
+                job.progress_done = job.progress_total
+            db.session.commit()
+        except JobCancelled:
+            _finish_job(job_id, status='cancelled', message='Cancelled')
+        except JobFailed as e:
+            _finish_job(job_id, status='failed', message=str(e), error=str(e)[:2000],
+                        result=json.dumps(e.result) if e.result is not None else None)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            try:
+                _finish_job(job_id, status='failed', error=str(e)[:2000])
+            except Exception as _e:
+                print('Failed to record job failure:', job_id, _e)
+        finally:
+            stop_heartbeat.set()
+            db.session.remove()
+
+
+def _get_job_executor():
+    global _job_executor
+    with _job_lock:
+        if _job_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _job_executor = ThreadPoolExecutor(max_workers=max(1, app.config['JOB_WORKERS']), thread_name_prefix='job')
+    return _job_executor
+
+
+def _submit_job(job_id):
+    _recover_stale_jobs()
+    if app.config.get('JOBS_INLINE'):
+        _run_job(job_id)
+    else:
+        _get_job_executor().submit(_run_job, job_id)
+
+
+def _recover_stale_jobs():
+    """Once per process: requeue jobs left 'running' by a worker that died (no heartbeat
+    for JOB_STALE_SECONDS) and resubmit queued ones that nobody picked up."""
+    global _jobs_recovered
+    with _job_lock:
+        if _jobs_recovered:
+            return
+        _jobs_recovered = True
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        Job.query.filter(Job.status == 'running', Job.heartbeat_at < cutoff).update(
+            {'status': 'queued', 'message': 'Requeued after worker restart'}, synchronize_session=False)
+        db.session.commit()
+        stale = [jid for (jid,) in db.session.query(Job.id).filter(Job.status == 'queued', Job.created_at < cutoff)]
+    except Exception as e:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        print('Job recovery skipped:', e)
+        return
+    for jid in stale:
+        if app.config.get('JOBS_INLINE'):
+            _run_job(jid)
+        else:
+            _get_job_executor().submit(_run_job, jid)
+
+
+def enqueue_job(kind, params=None, files=None, total=None, message='Queued'):
+    """Create a Job for the current admin, store any uploaded `files` ({param_name: FileStorage})
+    in the job's work directory, and hand it to the worker pool. Returns the Job."""
+    job = Job(kind=kind, status='queued', params=json.dumps(params or {}), progress_total=total,
+              message=message, created_by=session.get('user_id'), school_id=_get_effective_school_id())
+    db.session.add(job)
+    db.session.commit()
+    if files:
+        stored = dict(params or {})
+        for name, f in files.items():
+            path = os.path.join(job_workdir(job.id), secure_filename(f.filename or name) or name)
+            f.save(path)
+            stored[name] = path
+        job.params = json.dumps(stored)
+        db.session.commit()
+    job_id = job.id
+    _submit_job(job_id)
+    return Job.query.get(job_id)
+
+
+def _job_started_response(job):
+    """JSON for API callers, otherwise redirect to the job's progress page."""
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return {'job_id': job.id, 'status': job.status,
+                'status_url': url_for('admin_job_status', job_id=job.id),
+                'page_url': url_for('admin_job', job_id=job.id)}, 202
+    return redirect(url_for('admin_job', job_id=job.id))
+
+# Export engine: every export pulls its rows from one joined query (no lazy relationship loads)
+# with yield_per, and writes them incrementally, either as a streamed CSV response or into an
+# openpyxl write_only workbook spooled to a temp file, so memory stays flat however many rows.
+EXPORT_YIELD_PER = 1000
+EXPORT_CSV_FLUSH_ROWS = 500
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def iter_query_rows(query, row_fn=None):
+    """Yield each row of `query` (optionally mapped through `row_fn`) in EXPORT_YIELD_PER batches."""
+    for row in query.yield_per(EXPORT_YIELD_PER):
+        yield row_fn(row) if row_fn else row
+
+
+def csv_export_response(filename, header, rows):
+    """Stream `rows` (an iterable of sequences) as a CSV download without building it in memory."""
+    import csv
+    from flask import stream_with_context
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(header)
+        pending = 0
+        for row in rows:
+            writer.writerow(['' if v is None else v for v in row])
+            pending += 1
+            if pending >= EXPORT_CSV_FLUSH_ROWS:
+                yield buf.getvalue().encode('utf-8')
+                buf.seek(0)
+                buf.truncate()
+                pending = 0
+        yield buf.getvalue().encode('utf-8')
+
+    return Response(stream_with_context(generate()), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+
+def write_xlsx_rows(target, sheet_title, header, rows, progress=None):
+    """Write `rows` into a write_only workbook saved to `target` (path or binary file). Returns the row count.
+    `progress(count)` is called every EXPORT_YIELD_PER rows."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet((sheet_title or 'Sheet1')[:31])
+    ws.append(header)
+    count = 0
+    for row in rows:
+        ws.append(['' if v is None else v for v in row])
+        count += 1
+        if progress and count % EXPORT_YIELD_PER == 0:
+            progress(count)
+    wb.save(target)
+    return count
+
+
+def xlsx_export_response(filename, sheet_title, header, rows):
+    """Build the workbook into a temp file (xlsx is a zip, so it cannot be sent before it is finished)."""
+    import tempfile
+    fh = tempfile.TemporaryFile()
+    write_xlsx_rows(fh, sheet_title, header, rows)
+    fh.seek(0)
+    return send_file(fh, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
+
+
+def export_response(fmt, basename, sheet_title, header, rows):
+    """CSV (default) or XLSX download of `rows`."""
+    if fmt == 'xlsx':
+        return xlsx_export_response(f'{basename}.xlsx', sheet_title, header, rows)
+    return csv_export_response(f'{basename}.csv', header, rows)
+
+
+def student_export_query(school_id=None, student_class=None):
+    """username, full_name, student_class, gender, temp_password, school name for students."""
+    q = (db.session.query(User.username, User.full_name, User.student_class, User.gender,
+                          User.temp_password, School.name)
+         .outerjoin(School, User.school_id == School.id)
+         .filter(User.role == 'student'))
+    if school_id:
+        q = q.filter(User.school_id == school_id)
+    if student_class:
+        q = q.filter(User.student_class == student_class)
+    return q.order_by(User.created_at.desc(), User.id.desc())
+
+
+def class_export_query(school_id=None):
+    """name, school name for a school's classes plus the global ones (all classes when school_id is None)."""
+    q = db.session.query(StudentClass.name, School.name).outerjoin(School, StudentClass.school_id == School.id)
+    if school_id:
+        q = q.filter((StudentClass.school_id == None) | (StudentClass.school_id == school_id))
+    return q.order_by(StudentClass.name, StudentClass.id)
+
+
+def exam_code_export_query(exam_id):
+    """username, full_name, code, created_at for an exam's access codes."""
+    return (db.session.query(User.username, User.full_name, ExamAccessCode.code, ExamAccessCode.created_at)
+            .outerjoin(User, ExamAccessCode.student_id == User.id)
+            .filter(ExamAccessCode.exam_id == exam_id)
+            .order_by(ExamAccessCode.id))
+
+
+def result_export_query(subject_id, school_id=None):
+    """name, subject, class, score, exam title for a subject's completed sessions, scoped to a school."""
+    from sqlalchemy.orm import aliased
+    Student = aliased(User)
+    Creator = aliased(User)
+    q = (db.session.query(func.coalesce(func.nullif(Student.full_name, ''), Student.username), Subject.name,
+                          func.coalesce(func.nullif(Exam.subject_class, ''), Subject.subject_class, ''),
+                          func.coalesce(ExamSession.score, 0), func.coalesce(Exam.title, ''))
+         .join(Exam, ExamSession.exam_id == Exam.id)
+         .join(Subject, Exam.subject_id == Subject.id)
+         .join(Student, ExamSession.student_id == Student.id)
+         .filter(Exam.subject_id == subject_id, ExamSession.status == 'completed'))
+    if school_id is not None:
+        # student must belong to current school and exam must belong to school
+        q = (q.join(Creator, Exam.created_by == Creator.id)
+             .filter(Student.school_id == school_id, Creator.school_id == school_id))
+    return q.order_by(ExamSession.id)
+
+
+RESULT_EXPORT_HEADER = ['NAME', 'SUBJECT', 'CLASS', 'SCORE', 'EXAM']
+STUDENT_EXPORT_HEADER = ['username', 'full_name', 'student_class', 'gender', 'temp_password', 'school']
+
+# Admin list views page newest-first by primary key (a stable, indexed keyset: ?after=<last id>)
+# over column-only projections, and show a total that is cached for LIST_COUNT_TTL seconds rather
+# than recounted on every page. The templates fetch further pages from the JSON endpoints as the
+# user scrolls.
+LIST_PAGE_SIZE = 100
+LIST_PAGE_MAX = 500
+LIST_COUNT_TTL = 60
+_list_counts = {}
+_list_counts_lock = threading.Lock()
+
+
+def list_page_args():
+    """(after, limit) from the request's ?after=&limit=."""
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int) or LIST_PAGE_SIZE
+    return after, max(1, min(limit, LIST_PAGE_MAX))
+
+
+def keyset_page(query, id_col, after=None, limit=LIST_PAGE_SIZE):
+    """One page of `query` ordered by `id_col` descending, starting below `after`.
+    Returns (rows, next_after) where next_after is None on the last page."""
+    if after:
+        query = query.filter(id_col < after)
+    rows = query.order_by(id_col.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def cached_count(key, query):
+    """Row count of `query`, reused for LIST_COUNT_TTL seconds per `key`."""
+    now = time.monotonic()
+    with _list_counts_lock:
+        hit = _list_counts.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+    total = query.order_by(None).count()
+    with _list_counts_lock:
+        if len(_list_counts) > 1000:
+            _list_counts.clear()
+        _list_counts[key] = (now + LIST_COUNT_TTL, total)
+    return total
+
+
+def rows_to_json(rows):
+    return [{k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row._asdict().items()} for row in rows]
+
+
+def question_list_query(subject_ids=None):
+    """Columns shown in the question list; `subject_ids` None means every subject."""
+    q = (db.session.query(Question.id, func.substr(Question.question_text, 1, 200).label('question_text'),
+                          func.substr(Question.explanation, 1, 160).label('explanation'), Question.marks,
+                          Question.created_at,
+                          func.coalesce(func.nullif(Question.subject_class, ''), Subject.subject_class).label('subject_class'),
+                          Subject.name.label('subject_name'), Subject.code.label('subject_code'))
+         .join(Subject, Question.subject_id == Subject.id))
+    if subject_ids is not None:
+        q = q.filter(Question.subject_id.in_(subject_ids))
+    return q
+
+
+def question_search_page(q, subject_ids=None, offset=0, limit=LIST_PAGE_SIZE):
+    """Ranked search of the question bank. Returns (rows, next_offset, total); rows carry the
+    question_list_query columns plus `snippet`. Best matches (bm25) come first."""
+    from sqlalchemy import table, column, literal_column
+    base = question_list_query(subject_ids)
+    if question_fts_available():
+        match = question_match_expression(q)
+        if not match:
+            return [], None, 0
+        fts = table('question_fts', column('rowid'))
+        start, end = QUESTION_FTS_SNIPPET_MARKS
+        query = (base.join(fts, fts.c.rowid == Question.id)
+                 .filter(literal_column('question_fts').op('MATCH')(match))
+                 .add_columns(func.snippet(literal_column('question_fts'), -1, start, end, '…', 16).label('snippet')))
+        order = (literal_column('question_fts.rank'), Question.id)
+    else:
+        like = f'%{q.strip()}%'
+        query = base.filter(Question.question_text.ilike(like) | Question.explanation.ilike(like)
+                            | Question.option_a.ilike(like) | Question.option_b.ilike(like)
+                            | Question.option_c.ilike(like) | Question.option_d.ilike(like)
+                            | Question.option_e.ilike(like))
+        query = query.add_columns(literal_column("''").label('snippet'))
+        order = (Question.id.desc(),)
+    total = cached_count(('question_search', q.strip().lower(), tuple(subject_ids) if subject_ids is not None else None), query)
+    rows = query.order_by(*order).offset(offset).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], offset + limit, total
+    return rows, None, total
+
+
+def student_list_query(school_id=None, student_class=None, search=None):
+    q = (db.session.query(User.id, User.username, User.full_name, User.student_class, User.gender,
+                          User.temp_password, User.created_at)
+         .filter(User.role == 'student'))
+    if school_id:
+        q = q.filter(User.school_id == school_id)
+    if student_class:
+        q = q.filter(User.student_class == student_class)
+    if search:
+        like = f'%{search}%'
+        q = q.filter((User.username.ilike(like)) | (User.full_name.ilike(like)))
+    return q
+
+
+# Score bands used wherever a result is coloured or described: (minimum percent, band, bootstrap colour)
+RESULT_BANDS = ((80, 'excellent', 'success'), (50, 'good', 'warning'), (0, 'needs_improvement', 'danger'))
+
+
+def score_percent(score, total_marks):
+    return round((score or 0) / total_marks * 100, 1) if total_marks else 0.0
+
+
+def result_band(percent):
+    """(band, bootstrap colour) for a percentage."""
+    for minimum, band, colour in RESULT_BANDS:
+        if percent >= minimum:
+            return band, colour
+    return RESULT_BANDS[-1][1:]
+
+
+def result_row(row):
+    """Flatten a result_list_query row into the dict the results table and its JSON feed use,
+    with duration, percentage and band worked out once on the server."""
+    item = rows_to_json([row])[0]
+    item['duration_minutes'] = (round((row.end_time - row.start_time).total_seconds() / 60)
+                                if row.end_time and row.start_time else None)
+    item['percent'] = score_percent(row.score, row.total_marks)
+    item['band'], item['band_colour'] = result_band(item['percent'])
+    return item
+
+
+def result_list_query(school_id=None):
+    """Completed sessions with the student, exam and subject columns the results table shows."""
+    from sqlalchemy.orm import aliased
+    Student = aliased(User)
+    q = (db.session.query(ExamSession.id, ExamSession.score, ExamSession.start_time, ExamSession.end_time,
+                          Exam.title.label('exam_title'), Exam.total_marks, Subject.name.label('subject_name'),
+                          Student.username, Student.full_name)
+         .join(Exam, ExamSession.exam_id == Exam.id)
+         .outerjoin(Subject, Exam.subject_id == Subject.id)
+         .join(Student, ExamSession.student_id == Student.id)
+         .filter(ExamSession.status == 'completed'))
+    if school_id is not None:
+        q = q.filter(Student.school_id == school_id)
+    return q
+
 # Routes 
 @app.route('/')
 def index():
@@ -935,6 +2411,8 @@ def login():
                 except Exception:
                     sel_school_id = None
 
+            _rehash_password_if_needed(user, password)
+
             session['user_id'] = user.id
             session['username'] = user.username
             session['role'] = user.role
@@ -1016,49 +2494,18 @@ def register():
         user.set_password(password)
         if student_class:
             user.student_class = student_class.strip()
-        # handle passport upload during registration (file upload or camera data URI)
-        passport_saved = False
-        if 'passport' in request.files:
-            pf = request.files['passport']
-            if pf and pf.filename:
-                try:
-                    pfn = secure_filename(pf.filename)
-                    dest = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
-                    os.makedirs(dest, exist_ok=True)
-                    ppath = os.path.join(dest, pfn)
-                    pf.save(ppath)
-                    user.passport_filename = os.path.relpath(ppath)
-                    passport_saved = True
-                except Exception:
-                    pass
-        # support camera-captured image sent as data URI in form field `passport_data`
-        if not passport_saved and request.form.get('passport_data'):
-            try:
-                data_uri = request.form.get('passport_data')
-                header, encoded = data_uri.split(',', 1)
-                import base64
-                data = base64.b64decode(encoded)
-                # choose filename from username + timestamp
-                ts = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                pfn = f"{username}_{ts}.jpg"
-                dest = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
-                os.makedirs(dest, exist_ok=True)
-                ppath = os.path.join(dest, pfn)
-                # process and save bytes (validate/resize)
-                try:
-                    rel = _process_and_save_image_bytes(data, f"{username}_{ts}")
-                    user.passport_filename = rel
-                except Exception:
-                    # fall back to raw save
-                    with open(ppath, 'wb') as fh:
-                        fh.write(data)
-                    user.passport_filename = os.path.relpath(ppath)
-            except Exception:
-                pass
+        # passport upload during registration (file upload or camera data URI); stored raw and resized in the background
+        passport_raw = None
+        try:
+            passport_raw = save_passport_from_request(user, username)
+        except Exception:
+            pass
         if school:
             user.school_id = school.id
         db.session.add(user)
         db.session.commit()
+        if passport_raw:
+            schedule_passport_processing(user.id, passport_raw)
 
         flash('Registration successful! Please login.', 'success')
         return redirect(url_for('login'))
@@ -1111,8 +2558,7 @@ def admin_dashboard():
                     student = None
                     if sess:
                         student = User.query.get(sess.student_id)
-                        import ntpath
-                        basename = ntpath.basename(rec.filename or '')
+                        basename = _recording_media_name(rec.filename)
                         recordings.append({
                             'id': rec.id,
                             'filename': rec.filename,
@@ -1382,37 +2828,15 @@ def admin_export_classes():
     if 'user_id' not in session or session.get('role') != 'admin':
         flash('Access denied', 'danger')
         return redirect(url_for('login'))
-    try:
-        admin_school_id = None
-        if not session.get('is_superadmin'):
-            try:
-                admin_user = User.query.get(session.get('user_id'))
-                admin_school_id = admin_user.school_id if admin_user else None
-            except Exception:
-                admin_school_id = None
-        if admin_school_id:
-            rows = StudentClass.query.filter((StudentClass.school_id == None) | (StudentClass.school_id == admin_school_id)).order_by(StudentClass.name).all()
-        else:
-            rows = StudentClass.query.order_by(StudentClass.name).all()
-    except Exception:
-        rows = []
-    # build CSV
-    import csv
-    from io import StringIO, BytesIO
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['name','school'])
-    for r in rows:
-        school_name = ''
+    admin_school_id = None
+    if not session.get('is_superadmin'):
         try:
-            school_name = r.school.name if r.school else ''
+            admin_user = User.query.get(session.get('user_id'))
+            admin_school_id = admin_user.school_id if admin_user else None
         except Exception:
-            school_name = ''
-        writer.writerow([r.name or '', school_name])
-    output = si.getvalue().encode('utf-8')
-    return Response(output, mimetype='text/csv', headers={
-        'Content-Disposition': 'attachment; filename=classes.csv'
-    })
+            admin_school_id = None
+    return export_response('csv', 'classes', 'Classes', ['name', 'school'],
+                           iter_query_rows(class_export_query(admin_school_id)))
 
 
 @app.route('/admin/classes/import', methods=['POST'])
@@ -1548,36 +2972,15 @@ def admin_export_classes_xlsx():
     if 'user_id' not in session or session.get('role') != 'admin':
         flash('Access denied', 'danger')
         return redirect(url_for('login'))
-    try:
-        admin_school_id = None
-        if not session.get('is_superadmin'):
-            try:
-                admin_user = User.query.get(session.get('user_id'))
-                admin_school_id = admin_user.school_id if admin_user else None
-            except Exception:
-                admin_school_id = None
-        if admin_school_id:
-            rows = StudentClass.query.filter((StudentClass.school_id == None) | (StudentClass.school_id == admin_school_id)).order_by(StudentClass.name).all()
-        else:
-            rows = StudentClass.query.order_by(StudentClass.name).all()
-    except Exception:
-        rows = []
-    from openpyxl import Workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.append(['name','school'])
-    for r in rows:
+    admin_school_id = None
+    if not session.get('is_superadmin'):
         try:
-            school_name = r.school.name if r.school else ''
+            admin_user = User.query.get(session.get('user_id'))
+            admin_school_id = admin_user.school_id if admin_user else None
         except Exception:
-            school_name = ''
-        ws.append([r.name or '', school_name])
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-    return Response(bio.read(), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={
-        'Content-Disposition': 'attachment; filename=classes.xlsx'
-    })
+            admin_school_id = None
+    return export_response('xlsx', 'classes', 'Classes', ['name', 'school'],
+                           iter_query_rows(class_export_query(admin_school_id)))
 
 
 @app.route('/admin/classes/delete_selected', methods=['POST'])
@@ -1777,6 +3180,7 @@ def admin_delete_selected_subjects():
                 except Exception:
                     pass
                 try:
+                    drop_question_fingerprints(q_ids)
                     Question.query.filter(Question.id.in_(q_ids)).delete(synchronize_session=False)
                 except Exception:
                     pass
@@ -1845,49 +3249,48 @@ def admin_students():
         classes = []
 
     selected_class = request.args.get('class')
-    students = []
+    students, next_after, total = [], None, 0
     if selected_class:
         try:
-            # If 'ALL' selected, return all students for the school (or all if superadmin)
-            if selected_class == 'ALL':
-                students = students_for_current_user()
-            else:
-                # Filter by selected class
-                if session.get('is_superadmin'):
-                    students = User.query.filter_by(role='student', student_class=selected_class).order_by(User.created_at.desc()).all()
-                else:
-                    if school_id:
-                        students = User.query.filter_by(role='student', school_id=school_id, student_class=selected_class).order_by(User.created_at.desc()).all()
-                    else:
-                        students = []
+            students, next_after, total = _admin_student_page(selected_class)
         except Exception:
             students = []
 
-    return render_template('admin/students.html', students=students, classes=classes, selected_class=selected_class)
+    return render_template('admin/students.html', students=students, classes=classes, selected_class=selected_class,
+                           next_after=next_after, total=total)
 
 
-@app.route('/admin/students/json')
-def admin_students_json():
-    """Return JSON list of students for the given class (used by AJAX)."""
-    if 'user_id' not in session or session.get('role') != 'admin':
-        return {'error': 'access denied'}, 403
-    cls = request.args.get('class')
+def _admin_student_page(cls):
+    """Keyset page of students in class `cls` ('ALL' or empty for every class) for the current admin.
+    Admins without a school see no students; ?q= filters by username or full name."""
     school_id = None
     try:
         school_id = _get_effective_school_id()
     except Exception:
         school_id = None
-    students = []
+    if not session.get('is_superadmin'):
+        if not school_id:
+            return [], None, 0
+    else:
+        school_id = None
+    cls = None if (not cls or cls == 'ALL') else cls
+    search = (request.args.get('q') or '').strip() or None
+    after, limit = list_page_args()
+    q = student_list_query(school_id, cls, search)
+    rows, next_after = keyset_page(q, User.id, after, limit)
+    total = cached_count(('students', school_id, cls, search), q)
+    return rows, next_after, total
+
+
+@app.route('/admin/students/json')
+def admin_students_json():
+    """Return JSON list of students for the given class (used by AJAX), one keyset page at a time."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'access denied'}, 403
     try:
-        if not cls or cls == 'ALL':
-            students = students_for_current_user()
-        else:
-            if session.get('is_superadmin') or not school_id:
-                students = User.query.filter_by(role='student', student_class=cls).order_by(User.created_at.desc()).all()
-            else:
-                students = User.query.filter_by(role='student', school_id=school_id, student_class=cls).order_by(User.created_at.desc()).all()
+        rows, next_after, total = _admin_student_page(request.args.get('class'))
         out = []
-        for s in students:
+        for s in rows:
             out.append({
                 'id': s.id,
                 'username': s.username,
@@ -1897,7 +3300,7 @@ def admin_students_json():
                 'temp_password': s.temp_password or '',
                 'created_at': s.created_at.isoformat() if s.created_at else ''
             })
-        return {'students': out}
+        return {'students': out, 'next_after': next_after, 'total': total}
     except Exception as e:
         return {'error': str(e)}, 500
 
@@ -1919,7 +3322,43 @@ def superadmin_dashboard():
         schools = School.query.order_by(School.name).all()
     except Exception:
         schools = []
-    return render_template('admin/superadmin.html', admins=admins, schools=schools)
+    password_policy = {
+        'admin': password_hash_method('admin'),
+        'student': password_hash_method('student'),
+    }
+    return render_template('admin/superadmin.html', admins=admins, schools=schools,
+                           password_policy=password_policy, password_presets=PASSWORD_HASH_PRESETS)
+
+
+@app.route('/6869/password_policy', methods=['POST'])
+def superadmin_set_password_policy():
+    sa_id = session.get('superadmin_user_id') or session.get('user_id')
+    if not sa_id:
+        return redirect(url_for('superadmin_login'))
+    sa = User.query.get(sa_id)
+    if not sa or not getattr(sa, 'is_superadmin', False):
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+
+    updates = {}
+    for tier in ('admin', 'student'):
+        raw = (request.form.get(f'{tier}_policy') or '').strip()
+        if not raw:
+            continue
+        try:
+            updates[tier] = normalize_password_hash_method(raw)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('superadmin_dashboard'))
+    if not updates:
+        flash('No password policy provided', 'warning')
+        return redirect(url_for('superadmin_dashboard'))
+    for tier, method in updates.items():
+        app.config[f'PASSWORD_HASH_{tier.upper()}'] = method
+        set_setting(f'password_hash_{tier}', method)
+    invalidate_password_policy()
+    flash('Password policy updated. Existing hashes are migrated on each user\'s next login.', 'success')
+    return redirect(url_for('superadmin_dashboard'))
 
 
 @app.route('/6869/add', methods=['POST'])
@@ -1975,6 +3414,8 @@ def superadmin_login():
         flash('Invalid superadmin credentials', 'danger')
         return redirect(url_for('superadmin_login'))
 
+    _rehash_password_if_needed(user, password)
+
     # Mark superadmin session flag — keep user_id as well so other admin actions work
     session['superadmin_user_id'] = user.id
     session['user_id'] = user.id
@@ -2252,42 +3693,11 @@ def admin_add_student():
         if student_class:
             user.student_class = student_class.strip()
         # handle file upload or camera data URI for admin add
-        passport_saved = False
-        if 'passport' in request.files:
-            pf = request.files['passport']
-            if pf and pf.filename:
-                try:
-                    pfn = secure_filename(pf.filename)
-                    dest = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
-                    os.makedirs(dest, exist_ok=True)
-                    ppath = os.path.join(dest, pfn)
-                    pf.save(ppath)
-                    user.passport_filename = os.path.relpath(ppath)
-                    passport_saved = True
-                except Exception:
-                    pass
-        if not passport_saved and request.form.get('passport_data'):
-            try:
-                data_uri = request.form.get('passport_data')
-                header, encoded = data_uri.split(',', 1)
-                import base64
-                data = base64.b64decode(encoded)
-                ts = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                pfn = f"{username}_{ts}.jpg"
-                dest = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
-                os.makedirs(dest, exist_ok=True)
-                ppath = os.path.join(dest, pfn)
-                # process and save bytes (validate/resize)
-                try:
-                    rel = _process_and_save_image_bytes(data, f"{username}_{ts}")
-                    user.passport_filename = rel
-                except Exception:
-                    # fall back to raw save
-                    with open(ppath, 'wb') as fh:
-                        fh.write(data)
-                    user.passport_filename = os.path.relpath(ppath)
-            except Exception:
-                pass
+        passport_raw = None
+        try:
+            passport_raw = save_passport_from_request(user, username)
+        except Exception:
+            pass
         # Assign the student to the admin's school (superadmin may provide explicit school_id)
         try:
             if session.get('is_superadmin'):
@@ -2314,6 +3724,8 @@ def admin_add_student():
             db.session.rollback()
             flash('Failed to save student', 'danger')
             return render_template('admin/add_student.html', classes=classes)
+        if passport_raw:
+            schedule_passport_processing(user.id, passport_raw)
 
         flash(f'Student {username} created successfully', 'success')
         return redirect(url_for('admin_students'))
@@ -2398,6 +3810,70 @@ def admin_reset_student_password(user_id):
     return redirect(url_for('admin_students'))
 
 
+@app.route('/admin/students/reset_passwords', methods=['POST'])
+def admin_reset_class_passwords():
+    """Reset passwords for the selected students, or for a whole class, in one parallel batch.
+    Always scoped to the active school; resetting every class ('ALL') needs confirm_all=ALL."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+
+    cls = (request.form.get('class') or '').strip()
+    ids_raw = (request.form.get('user_ids') or '').strip()
+    query = User.query.filter_by(role='student')
+    school_id = _get_effective_school_id()
+    if school_id:
+        query = query.filter(User.school_id == school_id)
+    elif not session.get('is_superadmin'):
+        flash('Your account is not associated with a school.', 'danger')
+        return redirect(url_for('admin_students'))
+    elif not ids_raw:
+        flash('Choose a school before resetting a whole class', 'warning')
+        return redirect(url_for('admin_students'))
+    if ids_raw:
+        ids = [int(x) for x in ids_raw.split(',') if x.strip().isdigit()]
+        query = query.filter(User.id.in_(ids))
+    elif cls == 'ALL':
+        if request.form.get('confirm_all') != 'ALL':
+            flash('Type ALL to confirm resetting the passwords of every student in the school', 'warning')
+            return redirect(url_for('admin_students', **{'class': cls}))
+    elif cls:
+        query = query.filter(User.student_class == cls)
+    else:
+        flash('Select a class or students to reset', 'warning')
+        return redirect(url_for('admin_students'))
+
+    import string
+    import secrets
+    alphabet = string.ascii_letters + string.digits
+    student_ids = [r[0] for r in query.with_entities(User.id).all()]
+    total = {'count': 0, 'seconds': 0.0, 'workers': 1}
+    try:
+        for i in range(0, len(student_ids), HASH_CHUNK_SIZE):
+            chunk = student_ids[i:i + HASH_CHUNK_SIZE]
+            passwords = [''.join(secrets.choice(alphabet) for _ in range(8)) for _ in chunk]
+            hashes, stats = hash_passwords_bulk(passwords, role='student')
+            db.session.bulk_update_mappings(User, [
+                {'id': uid, 'password_hash': pw_hash, 'temp_password': pw}
+                for uid, pw_hash, pw in zip(chunk, hashes, passwords)
+            ])
+            total['count'] += stats['count']
+            total['seconds'] += stats['seconds']
+            total['workers'] = max(total['workers'], stats['workers'])
+        db.session.commit()
+    except Exception as e:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        flash('Failed to reset passwords: ' + str(e), 'danger')
+        return redirect(url_for('admin_students', **({'class': cls} if cls else {})))
+    total['per_second'] = (total['count'] / total['seconds']) if total['seconds'] > 0 else 0.0
+    flash(f"Reset passwords for {len(student_ids)} student(s); {_hash_stats_summary(total)}. "
+          f"New temporary passwords are listed below and in the export.", 'success')
+    return redirect(url_for('admin_students', **({'class': cls} if cls else {})))
+
+
 @app.route('/admin/student/<int:user_id>/edit', methods=['GET', 'POST'])
 def admin_edit_student(user_id):
     if 'user_id' not in session or session.get('role') != 'admin':
@@ -2437,44 +3913,16 @@ def admin_edit_student(user_id):
             user.gender = gender
 
         # handle passport upload (file or camera data URI)
-        passport_saved = False
-        if 'passport' in request.files:
-            pf = request.files['passport']
-            if pf and pf.filename:
-                try:
-                    pfn = secure_filename(pf.filename)
-                    dest = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
-                    os.makedirs(dest, exist_ok=True)
-                    ppath = os.path.join(dest, pfn)
-                    pf.save(ppath)
-                    user.passport_filename = os.path.relpath(ppath)
-                    passport_saved = True
-                except Exception as e:
-                    flash('Failed to save passport: ' + str(e), 'warning')
-        if not passport_saved and request.form.get('passport_data'):
-            try:
-                data_uri = request.form.get('passport_data')
-                header, encoded = data_uri.split(',', 1)
-                import base64
-                data = base64.b64decode(encoded)
-                ts = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-                pfn = f"student_{user.id if user.id else 'new'}_{ts}.jpg"
-                dest = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
-                os.makedirs(dest, exist_ok=True)
-                ppath = os.path.join(dest, pfn)
-                # process and save bytes (validate/resize)
-                try:
-                    rel = _process_and_save_image_bytes(data, f"student_{user.id if user.id else 'new'}_{ts}")
-                    user.passport_filename = rel
-                except Exception:
-                    with open(ppath, 'wb') as fh:
-                        fh.write(data)
-                    user.passport_filename = os.path.relpath(ppath)
-            except Exception as e:
-                flash('Failed to save passport: ' + str(e), 'warning')
+        passport_raw = None
+        try:
+            passport_raw = save_passport_from_request(user, f"student_{user.id if user.id else 'new'}")
+        except Exception as e:
+            flash('Failed to save passport: ' + str(e), 'warning')
 
         try:
             db.session.commit()
+            if passport_raw:
+                schedule_passport_processing(user.id, passport_raw)
             flash('Student updated', 'success')
         except Exception as e:
             try:
@@ -2571,33 +4019,16 @@ def admin_export_students():
         school_id = _get_effective_school_id()
     except Exception:
         school_id = None
-    try:
-        if cls and cls != 'ALL':
-            if session.get('is_superadmin') or not school_id:
-                students = User.query.filter_by(role='student', student_class=cls).order_by(User.created_at.desc()).all()
-            else:
-                students = User.query.filter_by(role='student', school_id=school_id, student_class=cls).order_by(User.created_at.desc()).all()
-        else:
-            students = students_for_current_user()
-    except Exception:
-        students = []
-
-    import csv
-    from io import StringIO
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['username','full_name','student_class','gender','temp_password','school'])
-    for s in students:
-        school_name = ''
-        try:
-            school_name = s.school.name if s.school else ''
-        except Exception:
-            school_name = ''
-        writer.writerow([s.username or '', s.full_name or '', s.student_class or '', s.gender or '', s.temp_password or '', school_name])
-    output = si.getvalue().encode('utf-8')
-    return Response(output, mimetype='text/csv', headers={
-        'Content-Disposition': 'attachment; filename=students.csv'
-    })
+    if cls and cls != 'ALL':
+        scope = None if session.get('is_superadmin') else school_id
+    elif session.get('is_superadmin'):
+        cls, scope = None, None
+    elif school_id:
+        cls, scope = None, school_id
+    else:
+        return export_response('csv', 'students', 'Students', STUDENT_EXPORT_HEADER, [])
+    return export_response('csv', 'students', 'Students', STUDENT_EXPORT_HEADER,
+                           iter_query_rows(student_export_query(scope, cls)))
 
 
 @app.route('/admin/students/export.xlsx')
@@ -2611,33 +4042,16 @@ def admin_export_students_xlsx():
         school_id = _get_effective_school_id()
     except Exception:
         school_id = None
-    try:
-        if cls and cls != 'ALL':
-            if session.get('is_superadmin') or not school_id:
-                students = User.query.filter_by(role='student', student_class=cls).order_by(User.created_at.desc()).all()
-            else:
-                students = User.query.filter_by(role='student', school_id=school_id, student_class=cls).order_by(User.created_at.desc()).all()
-        else:
-            students = students_for_current_user()
-    except Exception:
-        students = []
-
-    from openpyxl import Workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.append(['username','full_name','student_class','gender','temp_password','school'])
-    for s in students:
-        try:
-            school_name = s.school.name if s.school else ''
-        except Exception:
-            school_name = ''
-        ws.append([s.username or '', s.full_name or '', s.student_class or '', s.gender or '', s.temp_password or '', school_name])
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-    return Response(bio.read(), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={
-        'Content-Disposition': 'attachment; filename=students.xlsx'
-    })
+    if cls and cls != 'ALL':
+        scope = None if session.get('is_superadmin') else school_id
+    elif session.get('is_superadmin'):
+        cls, scope = None, None
+    elif school_id:
+        cls, scope = None, school_id
+    else:
+        return export_response('xlsx', 'students', 'Students', STUDENT_EXPORT_HEADER, [])
+    return export_response('xlsx', 'students', 'Students', STUDENT_EXPORT_HEADER,
+                           iter_query_rows(student_export_query(scope, cls)))
 
 
 @app.route('/admin/students/template')
@@ -2677,89 +4091,236 @@ def admin_students_template_xlsx():
     })
 
 
-@app.route('/admin/students/import', methods=['POST'])
-def admin_import_students():
-    if 'user_id' not in session or session.get('role') != 'admin':
-        flash('Access denied', 'danger')
-        return redirect(url_for('login'))
-    f = request.files.get('file')
-    if not f:
-        flash('No file uploaded', 'warning')
-        return redirect(url_for('admin_students'))
+# Set-based student import pipeline
+STUDENT_IMPORT_CHUNK = 2000
+
+
+def _normalize_student_row(raw):
+    # normalize keys to lowercase for flexible headers; extra CSV cells land under a None key
+    return {(k or '').strip().lower(): ('' if v is None else str(v).strip()) for k, v in raw.items() if k}
+
+
+def iter_student_rows_csv(stream):
+    """Yield (row_number, row) from an uploaded CSV stream one line at a time."""
     import csv
     from io import TextIOWrapper
-    created = 0
-    skipped = 0
-    errors = []
-    details = []
-    class_from_form = (request.form.get('class') or '').strip()
-    try:
-        stream = TextIOWrapper(f.stream, encoding='utf-8')
-        reader = csv.DictReader(stream)
-        for i, raw_row in enumerate(reader, start=2):
-            # normalize keys to lowercase for flexible headers
-            try:
-                row = { (k or '').strip().lower(): (v or '').strip() for k, v in raw_row.items() }
-            except Exception:
-                row = { }
-            username = (row.get('username') or row.get('email') or row.get('user') or '').strip()
-            full_name = (row.get('full_name') or row.get('name') or '').strip()
-            student_class = (row.get('student_class') or row.get('class') or '').strip()
-            gender = (row.get('gender') or row.get('sex') or '').strip()
-            temp_pw = (row.get('temp_password') or row.get('password') or '').strip()
-            school_key = (row.get('school') or row.get('school_name') or row.get('schoolcode') or '').strip()
-
-            if not username:
-                skipped += 1
-                details.append(f'Row {i}: missing username')
-                continue
-            if User.query.filter_by(username=username).first():
-                skipped += 1
-                details.append(f'Row {i}: username {username} already exists')
-                continue
+    reader = csv.DictReader(TextIOWrapper(stream, encoding='utf-8-sig'))
+    for i, raw_row in enumerate(reader, start=2):
+        yield i, _normalize_student_row(raw_row)
 
-            # prefer class passed from UI when row doesn't include it
-            if not student_class and class_from_form:
-                student_class = class_from_form
 
-            school_obj = None
-            if school_key:
-                school_obj = School.query.filter((School.name == school_key) | (School.code == school_key)).first()
-            if not session.get('is_superadmin') and not school_obj:
+def iter_student_rows_xlsx(fileobj):
+    """Open an .xlsx in read-only mode and return a (row_number, row) iterator over the active sheet.
+
+    Raises ValueError up front when the sheet has no `username` header.
+    """
+    wb = load_workbook(filename=fileobj, read_only=True)
+    rows = wb.active.iter_rows(values_only=True)
+    headers = [str(h).strip().lower() if h is not None else '' for h in next(rows, ())]
+    if 'username' not in headers:
+        wb.close()
+        raise ValueError('header "username" not found')
+
+    def _rows():
+        try:
+            for i, values in enumerate(rows, start=2):
+                if not values or all(v is None for v in values):
+                    continue
+                yield i, _normalize_student_row(dict(zip(headers, values)))
+        finally:
+            wb.close()
+    return _rows()
+
+
+def _first_value(row, keys):
+    for k in keys:
+        if row.get(k):
+            return row[k]
+    return ''
+
+
+def import_students(rows, default_class='', default_gender='', fallback_school_id=None,
+                    chunk_size=STUDENT_IMPORT_CHUNK, progress=None):
+    """Validate and insert student rows in chunks with set-based lookups.
+
+    `rows` yields (row_number, normalized_row). Each chunk costs one IN query for
+    existing usernames, at most one for unseen school names/codes, one parallel
+    password-hash batch and one bulk INSERT followed by a commit. Returns a report
+    dict with counts and a per-row list of statuses.
+    """
+    started = time.perf_counter()
+    report = {'created': 0, 'skipped': 0, 'errors': 0, 'rows': [], 'hash_seconds': 0.0, 'chunks': 0, 'last_row': 1}
+    seen_usernames = set()
+    school_ids = {}  # school name/code -> id (None when unknown)
+
+    def flush(chunk):
+        if not chunk:
+            return
+        # one query for usernames that already exist
+        names = [r['username'] for _, r in chunk]
+        existing = {u for (u,) in db.session.query(User.username).filter(User.username.in_(names))}
+        # one query for school keys not yet resolved
+        keys = {r['school_key'] for _, r in chunk if r['school_key'] and r['school_key'] not in school_ids}
+        if keys:
+            for sid, sname, scode in db.session.query(School.id, School.name, School.code).filter(
+                    (School.name.in_(keys)) | (School.code.in_(keys))):
+                school_ids[sname] = sid
+                if scode:
+                    school_ids[scode] = sid
+            for k in keys:
+                school_ids.setdefault(k, None)
+
+        mappings = []
+        for row_no, r in chunk:
+            if r['username'] in existing:
+                report['skipped'] += 1
+                report['rows'].append({'row': row_no, 'username': r['username'], 'status': 'skipped',
+                                       'reason': f"username {r['username']} already exists"})
+                continue
+            school_id = school_ids.get(r['school_key']) if r['school_key'] else None
+            mappings.append({
+                'row': row_no,
+                'username': r['username'],
+                'full_name': r['full_name'],
+                'role': 'student',
+                'gender': r['gender'] or None,
+                'student_class': r['student_class'] or None,
+                'temp_password': r['password'],
+                'school_id': school_id if school_id else fallback_school_id,
+            })
+        if mappings:
+            hashes, stats = hash_passwords_bulk([m['temp_password'] for m in mappings], role='student')
+            report['hash_seconds'] += stats['seconds']
+            for m, pw_hash in zip(mappings, hashes):
+                m['password_hash'] = pw_hash
+            try:
+                db.session.execute(User.__table__.insert(), [
+                    {k: v for k, v in m.items() if k != 'row'} for m in mappings
+                ])
+                db.session.commit()
+                report['created'] += len(mappings)
+                for m in mappings:
+                    report['rows'].append({'row': m['row'], 'username': m['username'], 'status': 'created'})
+            except Exception as e:
                 try:
-                    admin_user = User.query.get(session.get('user_id'))
-                    school_obj = School.query.get(admin_user.school_id) if admin_user and admin_user.school_id else None
+                    db.session.rollback()
                 except Exception:
-                    school_obj = None
+                    pass
+                report['errors'] += len(mappings)
+                for m in mappings:
+                    report['rows'].append({'row': m['row'], 'username': m['username'], 'status': 'error',
+                                           'reason': f'chunk insert failed ({e})'})
+        report['chunks'] += 1
+        report['last_row'] = chunk[-1][0]
+        if progress:
+            progress(report)
+
+    chunk = []
+    for row_no, row in rows:
+        username = _first_value(row, ('username', 'email', 'user'))
+        if not username:
+            report['skipped'] += 1
+            report['rows'].append({'row': row_no, 'username': '', 'status': 'skipped', 'reason': 'missing username'})
+            continue
+        if username in seen_usernames:
+            report['skipped'] += 1
+            report['rows'].append({'row': row_no, 'username': username, 'status': 'skipped',
+                                   'reason': f'username {username} repeated in file'})
+            continue
+        seen_usernames.add(username)
+        chunk.append((row_no, {
+            'username': username,
+            'full_name': _first_value(row, ('full_name', 'name')),
+            # prefer class/gender passed from the UI when the row doesn't include them
+            'student_class': _first_value(row, ('student_class', 'class')) or default_class,
+            'gender': _first_value(row, ('gender', 'sex')) or default_gender,
+            'password': _first_value(row, ('temp_password', 'password')) or username,
+            'school_key': _first_value(row, ('school', 'school_name', 'schoolcode')),
+        }))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+    report['rows'].sort(key=lambda r: r['row'])
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def _student_import_fallback_school():
+    """School assigned to imported rows that don't name a known school (admin's own school)."""
+    if session.get('is_superadmin'):
+        return None
+    try:
+        admin_user = User.query.get(session.get('user_id'))
+        return admin_user.school_id if admin_user and admin_user.school_id else None
+    except Exception:
+        return None
 
-            try:
-                user = User(username=username, full_name=full_name, role='student')
-                if gender:
-                    user.gender = gender
-                pw = temp_pw if temp_pw else username
-                user.set_password(pw)
-                user.temp_password = pw
-                if student_class:
-                    user.student_class = student_class
-                user.school_id = school_obj.id if school_obj else None
-                db.session.add(user)
-                created += 1
-            except Exception as er:
-                skipped += 1
-                details.append(f'Row {i}: failed to create {username} ({er})')
-        db.session.commit()
-        msg = f'Imported {created} students, skipped {skipped}'
-        if details:
-            msg += '. ' + '; '.join(details[:5])
-        flash(msg, 'success' if not details else 'warning')
-    except Exception as e:
+
+@job_handler('import_students')
+def _job_import_students(ctx):
+    """Run import_students over a stored CSV/XLSX, checkpointing the last committed row."""
+    p = ctx.params
+    start_after = int(ctx.checkpoint.get('row', 1))
+    previous = {k: int(ctx.checkpoint.get(k, 0)) for k in ('created', 'skipped', 'errors')}
+    fh = None
+    if p.get('format') == 'xlsx':
+        rows = iter_student_rows_xlsx(p['file'])
         try:
-            db.session.rollback()
+            total = max(0, load_workbook(p['file'], read_only=True).active.max_row - 1)
         except Exception:
-            pass
-        errors.append(str(e))
-        flash('Import failed: ' + '; '.join(errors), 'danger')
-    return redirect(url_for('admin_students'))
+            total = None
+    else:
+        with open(p['file'], 'rb') as counter:
+            total = max(0, sum(1 for _ in counter) - 1)
+        fh = open(p['file'], 'rb')
+        rows = iter_student_rows_csv(fh)
+
+    def progress(report):
+        counts = {k: previous[k] + report[k] for k in previous}
+        ctx.progress(report['last_row'] - 1, total,
+                     message=f"{counts['created']} created, {counts['skipped']} skipped",
+                     checkpoint=dict(counts, row=report['last_row']))
+
+    try:
+        report = import_students(
+            ((n, r) for n, r in rows if n > start_after),
+            default_class=p.get('default_class', ''),
+            default_gender=p.get('default_gender', ''),
+            fallback_school_id=p.get('fallback_school_id'),
+            progress=progress,
+        )
+    finally:
+        if fh:
+            fh.close()
+    counts = {k: previous[k] + report[k] for k in previous}
+    ctx.job.message = (f"Imported {counts['created']} students, skipped {counts['skipped']}"
+                       + (f", {counts['errors']} failed" if counts['errors'] else ''))
+    problems = [r for r in report['rows'] if r['status'] != 'created']
+    return dict(counts, seconds=round(report['seconds'], 2), hash_seconds=round(report['hash_seconds'], 2),
+                problems=problems[:1000], problems_truncated=len(problems) > 1000)
+
+
+def _enqueue_student_import(fmt):
+    f = request.files.get('file')
+    if not f or not f.filename:
+        flash('No file uploaded', 'warning')
+        return redirect(url_for('admin_students'))
+    job = enqueue_job('import_students', params={
+        'format': fmt,
+        'default_class': (request.form.get('class') or '').strip(),
+        'default_gender': (request.form.get('gender') or '').strip(),
+        'fallback_school_id': _student_import_fallback_school(),
+    }, files={'file': f}, message='Waiting to import students')
+    return _job_started_response(job)
+
+
+@app.route('/admin/students/import', methods=['POST'])
+def admin_import_students():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    return _enqueue_student_import('csv')
 
 
 @app.route('/admin/students/import_xlsx', methods=['POST'])
@@ -2767,104 +4328,131 @@ def admin_import_students_xlsx():
     if 'user_id' not in session or session.get('role') != 'admin':
         flash('Access denied', 'danger')
         return redirect(url_for('login'))
-    f = request.files.get('file')
-    if not f:
-        flash('No file uploaded', 'warning')
-        return redirect(url_for('admin_students'))
-    from openpyxl import load_workbook
-    created = 0
-    skipped = 0
-    errors = []
-    try:
-        data = f.read()
-        from io import BytesIO as _BytesIO
-        wb = load_workbook(filename=_BytesIO(data), read_only=True)
-        ws = wb.active
-        headers = [str(cell.value).strip().lower() if cell.value else '' for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-        # map columns
-        idx = {h:i for i,h in enumerate(headers)}
-        if 'username' not in idx:
-            flash('Excel import failed: header "username" not found', 'danger')
-            return redirect(url_for('admin_students'))
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2), start=2):
+    return _enqueue_student_import('xlsx')
+
+
+PASSPORT_ZIP_MAX_MEMBER_BYTES = 20 * 1024 * 1024
+
+
+@job_handler('import_passports')
+def _job_import_passports(ctx):
+    """Attach passports from a .zip whose images are named after usernames (e.g. STU001.jpg).
+
+    Images are unpacked to the job directory and resized across the CPU pool; each finished
+    image is assigned to its student as it completes. Students are limited to the job's school.
+    """
+    import shutil
+    import uuid
+    import zipfile
+    from concurrent.futures import as_completed
+    p = ctx.params
+    problems = []
+    images = 0
+    with zipfile.ZipFile(p['file']) as zf:
+        members = {}
+        for info in zf.infolist():
+            name = info.filename.rsplit('/', 1)[-1]
+            if info.is_dir() or info.filename.startswith('__MACOSX/') or name.startswith('.') or '.' not in name:
+                continue
+            stem, ext = name.rsplit('.', 1)
+            if ext.lower() not in PASSPORT_RAW_EXTS:
+                continue
+            images += 1
+            if info.file_size > PASSPORT_ZIP_MAX_MEMBER_BYTES:
+                problems.append({'row': info.filename, 'username': stem, 'reason': 'image too large'})
+                continue
+            members.setdefault(stem.strip().lower(), info)
+        users = {}
+        stems = list(members)
+        for i in range(0, len(stems), 500):
+            q = User.query.filter(User.role == 'student', func.lower(User.username).in_(stems[i:i + 500]))
+            if ctx.job.school_id:
+                q = q.filter(User.school_id == ctx.job.school_id)
+            for uid, username in q.with_entities(User.id, User.username):
+                users[username.lower()] = (uid, username)
+        for stem, info in members.items():
+            if stem not in users:
+                problems.append({'row': info.filename, 'username': stem, 'reason': 'no matching student'})
+        total = len(users)
+        ctx.progress(0, total, message=f'Resizing {total} passport(s)')
+
+        dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
+        os.makedirs(dest_dir, exist_ok=True)
+        tasks = []
+        for stem, (uid, username) in users.items():
+            info = members[stem]
+            raw = os.path.join(ctx.workdir, f'{uid}.{info.filename.rsplit(".", 1)[1].lower()}')
+            with zf.open(info) as src, open(raw, 'wb') as out:
+                shutil.copyfileobj(src, out, 64 * 1024)
+            target = os.path.join(dest_dir, f"{secure_filename(username) or uid}_{uuid.uuid4().hex[:12]}.jpg")
+            tasks.append((uid, raw, target, info.filename))
+
+    def finished(results):
+        """Yield (task, error) as images complete, in the pool when possible."""
+        if not app.config.get('JOBS_INLINE') and len(results) > 1:
             try:
-                def cell_val(key_names):
-                    for kn in key_names:
-                        if kn in idx:
-                            v = row[idx.get(kn)].value
-                            if v is not None:
-                                return str(v).strip()
-                    return ''
-
-                username = cell_val(['username','email','user'])
-                if not username:
-                    skipped += 1
-                    errors.append(f'Row {row_idx}: missing username')
-                    continue
-                if User.query.filter_by(username=username).first():
-                    skipped += 1
-                    errors.append(f'Row {row_idx}: username {username} exists')
-                    continue
-                full_name = cell_val(['full_name','name'])
-                student_class = cell_val(['student_class','class'])
-                gender = cell_val(['gender','sex'])
-                temp_pw = cell_val(['temp_password','password'])
-                school_key = cell_val(['school','school_name','schoolcode'])
-
-                # respect class selected in form when absent from row
-                form_cls = (request.form.get('class') or '').strip()
-                if not student_class and form_cls:
-                    student_class = form_cls
-                # respect form gender if missing in row (unlikely)
-                form_gender = (request.form.get('gender') or '').strip()
-                if not gender and form_gender:
-                    gender = form_gender
-                school_obj = None
-                if school_key:
-                    school_obj = School.query.filter((School.name == school_key) | (School.code == school_key)).first()
-                if not session.get('is_superadmin') and not school_obj:
-                    try:
-                        admin_user = User.query.get(session.get('user_id'))
-                        school_obj = School.query.get(admin_user.school_id) if admin_user and admin_user.school_id else None
-                    except Exception:
-                        school_obj = None
-                user = User(username=username, full_name=full_name, role='student')
-                if gender:
-                    user.gender = gender
-                pw = temp_pw if temp_pw else username
-                user.set_password(pw)
-                user.temp_password = pw
-                if student_class:
-                    user.student_class = student_class
-                user.school_id = school_obj.id if school_obj else None
-                db.session.add(user)
-                created += 1
-            except Exception as erow:
-                errors.append(f'Row {row_idx}: {erow}')
-        db.session.commit()
-        msg = f'Imported {created} students, skipped {skipped}'
-        if errors:
-            msg += '. Errors: ' + '; '.join(errors[:5])
-        flash(msg, 'success' if not errors else 'warning')
-    except Exception as e:
-        try:
-            db.session.rollback()
-        except Exception:
-            pass
-        flash('Excel import failed: ' + str(e), 'danger')
-    return redirect(url_for('admin_students'))
+                pool = _get_cpu_pool()
+                futures = {pool.submit(process_passport_image, raw, target): (uid, raw, target, name)
+                           for uid, raw, target, name in results}
+            except Exception as e:
+                print('Passport pool unavailable, resizing inline:', e)
+                _reset_cpu_pool()
+            else:
+                try:
+                    for fut in as_completed(futures):
+                        yield futures[fut], fut.exception()
+                finally:
+                    for fut in futures:
+                        fut.cancel()
+                return
+        for task in results:
+            try:
+                process_passport_image(task[1], task[2])
+                yield task, None
+            except Exception as e:
+                yield task, e
+
+    attached = done = 0
+    window = max(1, (os.cpu_count() or 1) * 8)
+    for start in range(0, len(tasks), window):
+        for (uid, raw, target, name), error in finished(tasks[start:start + window]):
+            done += 1
+            if error is not None:
+                problems.append({'row': name, 'username': name.rsplit('/', 1)[-1].rsplit('.', 1)[0],
+                                 'reason': f'invalid image: {error}'})
+            else:
+                User.query.filter_by(id=uid).update({'passport_filename': os.path.relpath(target)},
+                                                    synchronize_session=False)
+                attached += 1
+            try:
+                os.remove(raw)
+            except OSError:
+                pass
+        ctx.progress(done, total, message=f'{attached} passport(s) attached')
+    ctx.job.message = f'Attached {attached} passport(s)' + (f', {len(problems)} not imported' if problems else '')
+    return {'attached': attached, 'images': images,
+            'problems': problems[:1000], 'problems_truncated': len(problems) > 1000}
 
-@app.route('/admin/questions')
-def admin_questions():
-    if 'user_id' not in session or session['role'] != 'admin':
+
+@app.route('/admin/students/import_passports', methods=['POST'])
+def admin_import_passports():
+    if 'user_id' not in session or session.get('role') != 'admin':
         flash('Access denied', 'danger')
         return redirect(url_for('login'))
+    # the archive is streamed to the job directory, so allow more than MAX_CONTENT_LENGTH
+    request.max_content_length = app.config['QUESTION_UPLOAD_MAX_BYTES']
+    f = request.files.get('file')
+    if not f or not f.filename or not f.filename.lower().endswith('.zip'):
+        flash('Upload a .zip of passport images named after student usernames', 'warning')
+        return redirect(url_for('admin_students'))
+    job = enqueue_job('import_passports', files={'file': f}, message='Waiting to import passports')
+    return _job_started_response(job)
 
+def _admin_question_scope():
+    """Subject ids the question list covers (None = all) and the subject picked by the filters."""
     # Filtering by subject code and/or subject class (both optional)
     subject_code = (request.args.get('subject_code') or '').strip()
     subject_class = (request.args.get('subject_class') or '').strip()
-
-    selected_subject = None
     # If either filter provided, attempt to resolve a single subject matching both (if both provided)
     if subject_code or subject_class:
         q = Subject.query
@@ -2873,25 +4461,72 @@ def admin_questions():
         if subject_class:
             q = q.filter(func.upper(Subject.subject_class) == subject_class.upper())
         subj = q.first()
-        if subj:
-            questions = Question.query.filter_by(subject_id=subj.id).all()
-            selected_subject = subj.id
-        else:
-            questions = []
-            selected_subject = None
-    else:
-        # No filters — show questions only for the current user's school (unless superadmin)
-        if session.get('is_superadmin'):
-            questions = Question.query.all()
-        else:
-            subj_ids = [s.id for s in subjects_for_current_user()]
-            if not subj_ids:
-                questions = []
-            else:
-                questions = Question.query.filter(Question.subject_id.in_(subj_ids)).all()
+        return ([subj.id], subj.id) if subj else ([], None)
+    # No filters — show questions only for the current user's school (unless superadmin)
+    if session.get('is_superadmin'):
+        return None, None
+    return [s.id for s in subjects_for_current_user()], None
+
+
+def _admin_question_page():
+    """One page of the question list. With ?q= it is a ranked search and the
+    page cursor (`after`) is the number of results already shown."""
+    subject_ids, selected_subject = _admin_question_scope()
+    after, limit = list_page_args()
+    if subject_ids == []:
+        return [], None, 0, selected_subject
+    search = (request.args.get('q') or '').strip()
+    if search:
+        rows, next_after, total = question_search_page(search, subject_ids, after or 0, limit)
+        return rows, next_after, total, selected_subject
+    q = question_list_query(subject_ids)
+    rows, next_after = keyset_page(q, Question.id, after, limit)
+    total = cached_count(('questions', tuple(subject_ids) if subject_ids is not None else None), q)
+    return rows, next_after, total, selected_subject
+
 
+@app.route('/admin/questions')
+def admin_questions():
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    questions, next_after, total, selected_subject = _admin_question_page()
     subjects = subjects_for_current_user()
-    return render_template('admin/questions.html', questions=questions, subjects=subjects, selected_subject=selected_subject)
+    return render_template('admin/questions.html', questions=questions, subjects=subjects, selected_subject=selected_subject,
+                           total=total, next_after=next_after)
+
+
+@app.route('/admin/questions/json')
+def admin_questions_json():
+    """Next page of the question list: ?after=<last id>&limit=N plus the page's filters."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'access denied'}, 403
+    rows, next_after, total, _ = _admin_question_page()
+    return {'questions': rows_to_json(rows), 'next_after': next_after, 'total': total}
+
+
+@app.route('/admin/questions/search')
+def admin_questions_search():
+    """Ranked full-text search: ?q=words&subject_id=N&offset=&limit=, scoped to the admin's school."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'access denied'}, 403
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return {'error': 'q is required'}, 400
+    subject_ids = None if session.get('is_superadmin') else [s.id for s in subjects_for_current_user()]
+    subject_id = request.args.get('subject_id', type=int)
+    if subject_id:
+        if subject_ids is not None and subject_id not in subject_ids:
+            return {'error': 'access denied'}, 403
+        subject_ids = [subject_id]
+    if subject_ids == []:
+        return {'questions': [], 'next_offset': None, 'total': 0}
+    offset = max(0, request.args.get('offset', type=int) or 0)
+    limit = max(1, min(request.args.get('limit', type=int) or LIST_PAGE_SIZE, LIST_PAGE_MAX))
+    started = time.perf_counter()
+    rows, next_offset, total = question_search_page(q, subject_ids, offset, limit)
+    return {'questions': rows_to_json(rows), 'next_offset': next_offset, 'total': total,
+            'ms': round((time.perf_counter() - started) * 1000, 1)}
 
 @app.route('/admin/question/add', methods=['GET', 'POST'])
 def add_question():
@@ -2998,19 +4633,24 @@ def add_question():
             qf = request.files['question_image']
             if qf and qf.filename:
                 try:
-                    qfn = secure_filename(qf.filename)
-                    dest = os.path.join(app.config['UPLOAD_FOLDER'], 'question_images')
-                    os.makedirs(dest, exist_ok=True)
-                    qpath = os.path.join(dest, qfn)
-                    qf.save(qpath)
-                    question.question_image = os.path.relpath(qpath)
+                    ext = qf.filename.rsplit('.', 1)[-1] if '.' in qf.filename else ''
+                    qpath, _, _ = store_content_addressed(qf.stream, 'question_images', ext)
+                    question.question_image = qpath
+                    schedule_image_variants(qpath)
                 except Exception:
                     pass
         
         db.session.add(question)
+        db.session.flush()
+        fingerprint = question_fingerprint(question)
+        match = find_question_duplicates(subject_id, [fingerprint])[0]
+        index_question_fingerprints([question], [fingerprint], replace=False)
         db.session.commit()
         
         flash('Question added successfully', 'success')
+        if match:
+            kind = 'identical to' if match[2] == 'exact' else f'{int(match[1] * 100)}% similar to'
+            flash(f'This question is {kind} question #{match[0]}; review it under Duplicate Questions', 'warning')
         return redirect(url_for('admin_questions'))
     
     return render_template('admin/add_question.html', subjects=subjects)
@@ -3021,6 +4661,463 @@ def add_question_alias():
     # Backwards-compatible alias for older URLs/users
     return redirect(url_for('add_question'))
 
+# Workbooks up to this size are validated and inserted inside the request; larger ones go to a job
+app.config['QUESTION_UPLOAD_INLINE_BYTES'] = int(os.environ.get('QUESTION_UPLOAD_INLINE_BYTES', str(2 * 1024 * 1024)))
+THEORY_TRUE_VALUES = ['1', 'true', 'yes', 'y', 't']
+
+
+def _question_import_school_id():
+    """School whose subjects a question upload may name: None (every school) only for a
+    superadmin with no active school; 0 (no subjects) for an admin without a school."""
+    school_id = _get_effective_school_id()
+    if school_id is None and not session.get('is_superadmin'):
+        return 0
+    return school_id
+
+
+def _question_subject_maps(school_id=None):
+    """One query for the subjects of `school_id` (every school when None):
+    (code.upper() -> id, name.lower() -> id, id -> subject_class)."""
+    by_code, by_name, classes = {}, {}, {}
+    q = db.session.query(Subject.id, Subject.code, Subject.name, Subject.subject_class)
+    if school_id is not None:
+        q = q.join(User, Subject.created_by == User.id).filter(User.school_id == school_id)
+    for sid, code, name, sclass in q.order_by(Subject.id):
+        if code:
+            by_code.setdefault(code.strip().upper(), sid)
+        if name:
+            by_name.setdefault(name.strip().lower(), sid)
+        classes[sid] = sclass
+    return by_code, by_name, classes
+
+
+def validate_question_frame(df, subject_id, subject_maps, row_offset=2):
+    """Validate a question sheet with column operations.
+
+    Returns (rows, errors, new_subject_names): `rows` are insert-ready dicts for
+    the valid rows (subject names not yet in the DB are left as `subject_name`),
+    `errors` is a list of (sheet_row, reason) using the first rule each row breaks.
+    """
+    by_code, by_name, _ = subject_maps
+    # Normalize whitespace-only cells to NA and drop fully-empty rows (Excel often
+    # contains a trailing empty row).
+    with pd.option_context('future.no_silent_downcasting', True):
+        df = df.replace(r'^\s*$', pd.NA, regex=True).dropna(how='all')
+    if df.empty:
+        return [], [], []
+    sheet_rows = (pd.Series(df.index, index=df.index).astype(int) + row_offset)
+
+    def text(name):
+        if name not in df.columns:
+            return pd.Series(pd.NA, index=df.index, dtype='string')
+        return df[name].astype('string')
+
+    question = text('Question').str.strip()
+    if 'Is Theory' in df.columns and pd.api.types.is_numeric_dtype(df['Is Theory']):
+        # a column of 1/blank cells is read back as floats
+        is_theory = df['Is Theory'].fillna(0) != 0
+    else:
+        is_theory = text('Is Theory').str.strip().str.lower().isin(THEORY_TRUE_VALUES).fillna(False).astype(bool)
+    # publishers often write the key as "OPTION D"
+    correct = text('Correct Answer').str.strip().str.replace(r'(?i)^option\s*', '', regex=True)
+    marks_raw = df['Mark'] if 'Mark' in df.columns else pd.Series(pd.NA, index=df.index)
+    marks = pd.to_numeric(marks_raw, errors='coerce')
+
+    # Subject: explicit code wins, then name (created on insert if unknown), else the chosen subject
+    code = text('Subject Code').str.strip()
+    name = text('Subject').str.strip()
+    by_code_ids = code.str.upper().map(by_code)
+    by_name_ids = name.str.lower().map(by_name)
+    has_code = code.notna()
+    has_name = ~has_code & name.notna()
+
+    checks = [
+        (question.isna() | (question == ''), 'Missing question text'),
+        (is_theory & (text('Theory').str.strip().fillna('') == ''), 'Theory question missing Theory text'),
+        (~is_theory & (text('Option A').isna() | text('Option B').isna()), 'Missing Option A or Option B'),
+        (~is_theory & (correct.isna() | (correct == '')), 'Missing Correct Answer'),
+        (marks_raw.notna() & marks.isna(), 'Invalid Mark value'),
+        (has_code & by_code_ids.isna(), 'Unknown Subject Code: ' + code.fillna('')),
+    ]
+    reason = pd.Series(pd.NA, index=df.index, dtype='object')
+    for mask, msg in checks:
+        reason = reason.mask(reason.isna() & mask.fillna(False).astype(bool), msg)
+    bad = reason.notna()
+    errors = list(zip(sheet_rows[bad].tolist(), reason[bad].tolist()))
+
+    ok = ~bad
+    subject_ids = pd.Series(subject_id, index=df.index, dtype='object')
+    subject_ids = subject_ids.mask(has_code, by_code_ids).mask(has_name & by_name_ids.notna(), by_name_ids)
+    new_names = has_name & by_name_ids.isna()
+    new_subject_names = list({n.lower(): n for n in reversed(name[ok & new_names].tolist())}.values())
+
+    def plain(name):
+        return text(name)[ok].fillna('').tolist()
+
+    pending_names = [n if flag else None for n, flag in zip(name[ok].tolist(), new_names[ok].tolist())]
+    rows = []
+    for sid, new_name, q, th, theory, a, b, c, d, e, ca, img, expl, mk in zip(
+            subject_ids[ok].tolist(), pending_names, question[ok].tolist(), is_theory[ok].tolist(),
+            plain('Theory'), plain('Option A'), plain('Option B'), plain('Option C'), plain('Option D'),
+            plain('Option E'), correct[ok].fillna('').str.upper().tolist(), plain('Image Filename'),
+            plain('Explanation'), marks[ok].tolist()):
+        rows.append({
+            'subject_id': None if new_name else int(sid),
+            'subject_name': new_name,
+            'question_text': q,
+            'is_theory': th,
+            'theory_text': theory or None,
+            'option_a': a, 'option_b': b, 'option_c': c, 'option_d': d, 'option_e': e,
+            'correct_answer': '' if th else ca,
+            'question_image': img,
+            'explanation': expl,
+            'marks': 1 if pd.isna(mk) else int(mk),
+        })
+    return rows, errors, new_subject_names
+
+
+def insert_question_rows(rows, subject_id, subject_class, uploaded_images, created_by, subject_maps,
+                         new_subject_names=(), commit=True, update_subject_class=True, duplicates=None):
+    """Create any missing subjects in one batch, then insert all rows with a single executemany.
+    Exact duplicates of the bank are skipped and near duplicates counted (see screen_question_duplicates)."""
+    _, by_name, classes = subject_maps
+    created = [Subject(name=n, code=None, created_by=created_by) for n in new_subject_names
+               if n.lower() not in by_name]
+    if created:
+        db.session.add_all(created)
+        db.session.flush()
+        for subj in created:
+            by_name[subj.name.lower()] = subj.id
+            classes[subj.id] = None
+    # If a subject_class was selected, update the Subject record
+    if subject_class and update_subject_class:
+        Subject.query.filter_by(id=subject_id).update({'subject_class': subject_class}, synchronize_session=False)
+    for r in rows:
+        if r['subject_id'] is None:
+            r['subject_id'] = by_name[r['subject_name'].lower()]
+        r.pop('subject_name', None)
+        # prefer upload `subject_class`, else inherit from Subject
+        r['subject_class'] = subject_class or classes.get(r['subject_id'])
+        # Map any referenced image filename to the stored path if uploaded
+        qref = r['question_image']
+        if qref:
+            stored = [uploaded_images[k] for k in _image_ref_keys(qref) if k in uploaded_images]
+            r['question_image'] = stored[0] if stored else qref
+        else:
+            r['question_image'] = None
+        r['created_by'] = created_by
+    rows, fingerprints = screen_question_duplicates(rows, duplicates)
+    if rows:
+        ids = db.session.execute(Question.__table__.insert().returning(Question.id, sort_by_parameter_order=True),
+                                 rows).scalars().all()
+        for r, qid in zip(rows, ids):
+            r['id'] = qid
+        index_question_fingerprints(rows, fingerprints, replace=False)
+    if commit:
+        db.session.commit()
+    return len(rows)
+
+
+def import_question_frame(df, subject_id, subject_class, uploaded_images, created_by, duplicates=None,
+                          school_id=None):
+    """Validate the whole sheet first (fail-fast); insert only when every row is valid.
+    Subject names and codes in the sheet are matched within `school_id`. Returns (added_count, errors)."""
+    required_cols = ['Question', 'Option A', 'Option B', 'Correct Answer']
+    if not all(col in df.columns for col in required_cols):
+        raise ValueError('Excel file missing required columns (Question, Option A, Option B, Correct Answer)')
+    subject_maps = _question_subject_maps(school_id)
+    rows, errors, new_subject_names = validate_question_frame(df, subject_id, subject_maps)
+    if errors:
+        return 0, errors
+    try:
+        return insert_question_rows(rows, subject_id, subject_class, uploaded_images, created_by,
+                                    subject_maps, new_subject_names, duplicates=duplicates), []
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+SHEET_CLASS_RE = re.compile(r'^(.*?)[\s_\-]*((?:JSS|SSS|SS|BASIC|PRIMARY|PRY)\s*\d)$', re.IGNORECASE)
+
+
+def match_sheet_subject(sheet_name, subject_maps):
+    """Map a sheet title like "CIVIC EDU", "MTH" or "Mathematics JSS2" to (subject_id, class).
+    Returns (None, class) when the title names no known subject."""
+    by_code, by_name, _ = subject_maps
+    title = sheet_name.strip()
+    sheet_class = None
+    m = SHEET_CLASS_RE.match(title)
+    candidates = [title]
+    if m and m.group(1).strip():
+        sheet_class = re.sub(r'\s+', '', m.group(2)).upper()
+        candidates.append(m.group(1).strip())
+    for cand in candidates:
+        sid = by_code.get(cand.upper()) or by_name.get(cand.lower())
+        if sid:
+            return sid, sheet_class
+    return None, sheet_class
+
+
+def _parse_question_sheet(path, sheet_name, subject_id, subject_maps):
+    """Process-pool worker: read one sheet and validate it. Touches no database."""
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    df.columns = [str(c).strip() for c in df.columns]
+    required_cols = ['Question', 'Option A', 'Option B', 'Correct Answer']
+    missing = [col for col in required_cols if col not in df.columns]
+    if missing:
+        if df.dropna(how='all').empty:
+            return sheet_name, [], []
+        return sheet_name, [], [(1, 'Missing column(s): ' + ', '.join(missing))]
+    rows, errors, _ = validate_question_frame(df, subject_id, subject_maps)
+    return sheet_name, rows, errors
+
+
+@job_handler('import_question_workbook')
+def _job_import_question_workbook(ctx):
+    """Import every sheet of a workbook: sheets are parsed and validated in parallel
+    worker processes, then this thread writes all rows in one transaction."""
+    from concurrent.futures import as_completed
+    p = ctx.params
+    path = p['file']
+    wb = load_workbook(path, read_only=True)
+    sheet_names = list(wb.sheetnames)
+    wb.close()
+    # sheet titles only match subjects of the uploading admin's school
+    subject_maps = _question_subject_maps(p.get('school_id'))
+    # Sheets that name no subject fall back to the subject picked on the form
+    plan = {}
+    for name in sheet_names:
+        sid, sheet_class = match_sheet_subject(name, subject_maps)
+        plan[name] = {'subject_id': sid or p['subject_id'], 'matched': bool(sid),
+                      'subject_class': sheet_class or p.get('subject_class') or ''}
+    # only plain dicts cross the process boundary
+    worker_maps = (subject_maps[0], subject_maps[1], {})
+    ctx.progress(0, len(sheet_names), message=f'Parsing {len(sheet_names)} sheet(s)')
+
+    parsed = {}
+    try:
+        pool = _get_cpu_pool()
+        futures = [pool.submit(_parse_question_sheet, path, name, plan[name]['subject_id'], worker_maps)
+                   for name in sheet_names]
+        for fut in as_completed(futures):
+            name, rows, errors = fut.result()
+            parsed[name] = (rows, errors)
+            ctx.progress(len(parsed), message=f'Parsed {len(parsed)} of {len(sheet_names)} sheet(s)')
+    except JobCancelled:
+        raise
+    except Exception as e:
+        # e.g. BrokenProcessPool; parse whatever is left in this thread
+        print('Parallel sheet parsing failed, continuing inline:', e)
+        _reset_cpu_pool()
+    for name in sheet_names:
+        if name not in parsed:
+            parsed[name] = _parse_question_sheet(path, name, plan[name]['subject_id'], worker_maps)[1:]
+            ctx.progress(len(parsed), message=f'Parsed {len(parsed)} of {len(sheet_names)} sheet(s)')
+
+    sheets = []
+    problems = []
+    for name in sheet_names:
+        rows, errors = parsed[name]
+        problems.extend({'row': f'{name}!{r}', 'reason': reason} for r, reason in errors)
+        sheets.append({'sheet': name, 'subject_id': plan[name]['subject_id'], 'matched': plan[name]['matched'],
+                       'subject_class': plan[name]['subject_class'], 'rows': len(rows), 'invalid': len(errors)})
+    if problems:
+        raise JobFailed(f'No questions imported: {len(problems)} invalid row(s)',
+                        {'added': 0, 'sheets': sheets, 'problems': problems[:1000],
+                         'problems_truncated': len(problems) > 1000})
+
+    # single writer: every sheet goes in through one transaction
+    added = 0
+    duplicates = {}
+    try:
+        for name in sheet_names:
+            rows = parsed[name][0]
+            new_names = list({r['subject_name'].lower(): r['subject_name'] for r in rows if r['subject_name']}.values())
+            added += insert_question_rows(rows, plan[name]['subject_id'], plan[name]['subject_class'],
+                                          p.get('images') or {}, ctx.job.created_by, subject_maps, new_names,
+                                          commit=False, update_subject_class=False, duplicates=duplicates)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    ctx.job.message = f'{added} questions imported from {len(sheet_names)} sheet(s)' + duplicate_summary(duplicates)
+    return {'added': added, 'sheets': sheets, 'duplicates': duplicates}
+
+
+@job_handler('upload_questions')
+def _job_upload_questions(ctx):
+    """Validate a stored question workbook in full, then insert every row (all-or-nothing)."""
+    p = ctx.params
+    with open(p['file'], 'rb') as fh:
+        df = pd.read_excel(BytesIO(fh.read()))
+    ctx.progress(0, len(df), message='Validating rows')
+    duplicates = {}
+    added_count, errors = import_question_frame(df, p['subject_id'], p.get('subject_class') or '',
+                                                p.get('images') or {}, ctx.job.created_by, duplicates,
+                                                school_id=p.get('school_id'))
+    if errors:
+        # Fail the whole upload and report the exact rows and reasons so admin can fix the file
+        raise JobFailed(f'No questions imported: {len(errors)} invalid row(s)',
+                        {'added': 0, 'problems': [{'row': r, 'reason': reason} for r, reason in errors]})
+    ctx.progress(len(df), message=f'{added_count} questions uploaded successfully' + duplicate_summary(duplicates))
+    try:
+        os.remove(p['file'])
+    except Exception:
+        pass
+    return {'added': added_count, 'duplicates': duplicates}
+
+
+QUESTION_CSV_CHUNK = 5000
+# Question banks delivered as CSV/TSV or .zip bundles may be far larger than the global upload limit
+app.config['QUESTION_UPLOAD_MAX_BYTES'] = int(os.environ.get('QUESTION_UPLOAD_MAX_BYTES', str(256 * 1024 * 1024)))
+
+
+def _is_delimited_question_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ('csv', 'tsv')
+
+
+@job_handler('import_questions_csv')
+def _job_import_questions_csv(ctx):
+    """Stream a CSV/TSV question bank in fixed-size chunks, committing valid rows per chunk.
+
+    Unlike workbook uploads this is not all-or-nothing: invalid rows are reported and
+    skipped so a 100k-row bank doesn't have to be re-sent for one bad line. The checkpoint
+    is the number of data rows already consumed, so a restart skips straight past them.
+    """
+    p = ctx.params
+    path = p['file']
+    sep = '\t' if path.lower().endswith('.tsv') else ','
+    done = int(ctx.checkpoint.get('rows', 0))
+    # the chunk index continues across chunks but restarts after `skiprows`
+    row_offset = 2 + done
+    added = int(ctx.checkpoint.get('added', 0))
+    invalid = int(ctx.checkpoint.get('invalid', 0))
+    duplicates = dict(ctx.checkpoint.get('duplicates') or {})
+    problems = list(ctx.checkpoint.get('problems') or [])
+    with open(path, 'rb') as fh:
+        total = max(0, sum(1 for _ in fh) - 1)
+    subject_maps = _question_subject_maps(p.get('school_id'))
+    reader = pd.read_csv(path, sep=sep, dtype=str, keep_default_na=False, na_values=[''],
+                         chunksize=QUESTION_CSV_CHUNK, skiprows=range(1, done + 1), encoding='utf-8-sig')
+    ctx.progress(done, total, message='Reading question file')
+    required_cols = ['Question', 'Option A', 'Option B', 'Correct Answer']
+    for chunk in reader:
+        chunk.columns = [str(c).strip() for c in chunk.columns]
+        if not all(col in chunk.columns for col in required_cols):
+            raise ValueError('File missing required columns (Question, Option A, Option B, Correct Answer)')
+        rows, errors, new_subject_names = validate_question_frame(chunk, p['subject_id'], subject_maps,
+                                                                  row_offset=row_offset)
+        added += insert_question_rows(rows, p['subject_id'], p.get('subject_class') or '', p.get('images') or {},
+                                      ctx.job.created_by, subject_maps, new_subject_names, commit=False,
+                                      duplicates=duplicates)
+        invalid += len(errors)
+        problems.extend({'row': r, 'reason': reason} for r, reason in errors[:1000 - len(problems)])
+        done += len(chunk)
+        # the chunk's rows and its checkpoint are committed together
+        ctx.progress(done, total, message=f'{added} imported, {invalid} invalid row(s) skipped' + duplicate_summary(duplicates),
+                     checkpoint={'rows': done, 'added': added, 'invalid': invalid, 'duplicates': duplicates,
+                                 'problems': problems})
+    ctx.job.message = (f'{added} questions imported' + (f', {invalid} invalid row(s) skipped' if invalid else '')
+                       + duplicate_summary(duplicates))
+    return {'added': added, 'invalid': invalid, 'duplicates': duplicates, 'problems': problems,
+            'problems_truncated': invalid > len(problems)}
+
+
+QUESTION_IMAGE_EXTS = ('png', 'jpg', 'jpeg', 'gif', 'webp')
+QUESTION_SHEET_EXTS = ('xlsx', 'xls', 'csv', 'tsv')
+# refuse bundles that would expand beyond this (zip bombs)
+BUNDLE_MAX_UNCOMPRESSED = 2 * 1024 * 1024 * 1024
+
+
+def _image_ref_keys(name):
+    """Keys an "Image Filename" cell may use for a stored image: its path and bare filename."""
+    norm = name.replace('\\', '/').lstrip('./')
+    base = norm.rsplit('/', 1)[-1]
+    return [norm, base, secure_filename(base)]
+
+
+def _save_question_images(files):
+    """Store uploaded question images by content hash; return a filename -> stored path map."""
+    uploaded_images = {}
+    try:
+        for img in files:
+            if img and img.filename:
+                ext = img.filename.rsplit('.', 1)[-1] if '.' in img.filename else ''
+                path, _, _ = store_content_addressed(img.stream, 'question_images', ext)
+                schedule_image_variants(path)
+                for key in _image_ref_keys(img.filename):
+                    uploaded_images.setdefault(key, path)
+    except Exception:
+        uploaded_images = {}
+    return uploaded_images
+
+
+def _is_question_bundle(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'zip'
+
+
+@job_handler('import_question_bundle')
+def _job_import_question_bundle(ctx):
+    """Import a .zip holding one question sheet plus its images.
+
+    Members are read straight out of the archive: each image is streamed through
+    sha256 into the content-addressed store (duplicates are written once) and the
+    sheet is parsed from memory, so nothing is unpacked to a scratch directory.
+    """
+    import zipfile
+    p = ctx.params
+    with zipfile.ZipFile(p['file']) as zf:
+        members = [i for i in zf.infolist()
+                   if not i.is_dir() and not i.filename.startswith('__MACOSX/')
+                   and not i.filename.rsplit('/', 1)[-1].startswith('.')]
+        if sum(i.file_size for i in members) > BUNDLE_MAX_UNCOMPRESSED:
+            raise ValueError('Bundle expands beyond the allowed size')
+        ext_of = lambda i: i.filename.rsplit('.', 1)[-1].lower() if '.' in i.filename else ''
+        sheets = [i for i in members if ext_of(i) in QUESTION_SHEET_EXTS]
+        images = [i for i in members if ext_of(i) in QUESTION_IMAGE_EXTS]
+        if len(sheets) != 1:
+            raise ValueError(f'Bundle must contain exactly one question sheet (.xlsx/.xls/.csv/.tsv); found {len(sheets)}')
+        sheet = sheets[0]
+        sheet_dir = sheet.filename.rsplit('/', 1)[0] + '/' if '/' in sheet.filename else ''
+
+        ctx.progress(0, len(images) + 1, message=f'Storing {len(images)} image(s)')
+        image_map = {}
+        stored = duplicates = 0
+        for n, info in enumerate(images, start=1):
+            with zf.open(info) as src:
+                path, _, created = store_content_addressed(src, 'question_images', ext_of(info))
+            schedule_image_variants(path)
+            stored += created
+            duplicates += not created
+            # rows may reference the image relative to the sheet, by full path, or by bare name
+            keys = _image_ref_keys(info.filename)
+            if sheet_dir and info.filename.startswith(sheet_dir):
+                keys.insert(0, info.filename[len(sheet_dir):])
+            for key in keys:
+                image_map.setdefault(key, path)
+            if n % 200 == 0:
+                ctx.progress(n, message=f'Stored {n} of {len(images)} image(s)')
+
+        data = zf.read(sheet)
+    if ext_of(sheet) in ('csv', 'tsv'):
+        df = pd.read_csv(BytesIO(data), sep='\t' if ext_of(sheet) == 'tsv' else ',', dtype=str,
+                         keep_default_na=False, na_values=[''], encoding='utf-8-sig')
+    else:
+        df = pd.read_excel(BytesIO(data))
+    df.columns = [str(c).strip() for c in df.columns]
+    ctx.progress(len(images), message='Validating question sheet')
+    dup_questions = {}
+    added, errors = import_question_frame(df, p['subject_id'], p.get('subject_class') or '', image_map,
+                                          ctx.job.created_by, dup_questions, school_id=p.get('school_id'))
+    summary = {'images': len(images), 'images_stored': stored, 'images_deduplicated': duplicates}
+    if errors:
+        raise JobFailed(f'No questions imported: {len(errors)} invalid row(s)',
+                        dict(summary, added=0, problems=[{'row': r, 'reason': reason} for r, reason in errors]))
+    ctx.job.message = (f'{added} questions imported, {stored} new image(s) ({duplicates} duplicate(s) skipped)'
+                       + duplicate_summary(dup_questions).replace('duplicate(s)', 'duplicate question(s)'))
+    return dict(summary, added=added, duplicates=dup_questions)
+
+
 @app.route('/admin/question/upload', methods=['GET', 'POST'])
 def upload_questions():
     if 'user_id' not in session or session['role'] != 'admin':
@@ -3028,8 +5125,13 @@ def upload_questions():
         return redirect(url_for('login'))
     
     subjects = subjects_for_current_user()
+    upload_errors = None
     
     if request.method == 'POST':
+        # CSV/TSV banks and zip bundles are streamed to disk and imported by a job, so the form may be
+        # larger than MAX_CONTENT_LENGTH; werkzeug spools big file parts to a temp file, not memory.
+        # Workbooks are held to MAX_CONTENT_LENGTH once the file type is known (below).
+        request.max_content_length = app.config['QUESTION_UPLOAD_MAX_BYTES']
         if 'file' not in request.files:
             flash('No file selected', 'danger')
             return redirect(request.url)
@@ -3037,218 +5139,74 @@ def upload_questions():
         file = request.files['file']
         subject_id = int(request.form['subject_id'])
         subject_class = (request.form.get('subject_class') or '').strip()
+        school_id = _question_import_school_id()
         
         if file.filename == '':
             flash('No file selected', 'danger')
             return redirect(request.url)
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+        if file and (allowed_file(file.filename) or _is_delimited_question_file(file.filename)
+                     or _is_question_bundle(file.filename)):
+            streamed = _is_delimited_question_file(file.filename) or _is_question_bundle(file.filename)
+            # size the part from its spooled stream without reading it into memory
+            file.stream.seek(0, os.SEEK_END)
+            size = file.stream.tell()
+            file.stream.seek(0)
+            if not streamed and max(request.content_length or 0, size) > app.config['MAX_CONTENT_LENGTH']:
+                limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+                flash(f'Excel uploads are limited to {limit_mb}MB; upload large banks as CSV/TSV or a .zip bundle',
+                      'danger')
+                return redirect(request.url)
             # Save any uploaded image files and build filename->path map
-            uploaded_images = {}
+            images = request.files.getlist('images') if 'images' in request.files else []
+            uploaded_images = _save_question_images(images)
+            if _is_question_bundle(file.filename):
+                job = enqueue_job('import_question_bundle', params={
+                    'subject_id': subject_id,
+                    'subject_class': subject_class,
+                    'school_id': school_id,
+                }, files={'file': file}, message='Waiting to import question bundle')
+                return _job_started_response(job)
+            if request.form.get('all_sheets') and not _is_delimited_question_file(file.filename):
+                job = enqueue_job('import_question_workbook', params={
+                    'subject_id': subject_id,
+                    'subject_class': subject_class,
+                    'school_id': school_id,
+                    'images': uploaded_images,
+                }, files={'file': file}, message='Waiting to import workbook sheets')
+                return _job_started_response(job)
+            if _is_delimited_question_file(file.filename):
+                job = enqueue_job('import_questions_csv', params={
+                    'subject_id': subject_id,
+                    'subject_class': subject_class,
+                    'school_id': school_id,
+                    'images': uploaded_images,
+                }, files={'file': file}, message='Waiting to stream question file')
+                return _job_started_response(job)
+            if size > app.config['QUESTION_UPLOAD_INLINE_BYTES']:
+                job = enqueue_job('upload_questions', params={
+                    'subject_id': subject_id,
+                    'subject_class': subject_class,
+                    'school_id': school_id,
+                    'images': uploaded_images,
+                }, files={'file': file}, message='Waiting to process question file')
+                return _job_started_response(job)
+
+            # Small workbooks are parsed straight from the upload and inserted in one statement
             try:
-                images = request.files.getlist('images') if 'images' in request.files else []
-                img_dest = os.path.join(app.config['UPLOAD_FOLDER'], 'question_images')
-                os.makedirs(img_dest, exist_ok=True)
-                for img in images:
-                    if img and img.filename:
-                        img_name = secure_filename(img.filename)
-                        img_path = os.path.join(img_dest, img_name)
-                        img.save(img_path)
-                        uploaded_images[img_name] = os.path.relpath(img_path)
-            except Exception:
-                uploaded_images = {}
-            
-            try:
-                df = pd.read_excel(filepath)
-
-                # Normalize whitespace-only cells to NA and drop fully-empty rows.
-                # This avoids false validation failures caused by an extra blank row at the end
-                # of the sheet (Excel often contains a trailing empty row).
-                try:
-                    df = df.replace(r'^\s*$', pd.NA, regex=True)
-                except Exception:
-                    # If regex replacement fails for any reason, continue with original df
-                    pass
-
-                # Drop rows where all columns are NA/empty
-                df.dropna(how='all', inplace=True)
-
-                # Validate required columns once
-                required_cols = ['Question', 'Option A', 'Option B', 'Correct Answer']
-                if not all(col in df.columns for col in required_cols):
-                    flash('Excel file missing required columns (Question, Option A, Option B, Correct Answer)', 'danger')
-                    return redirect(request.url)
-
-                # Perform full-file validation first (fail-fast behavior)
-                errors = []
-                rows_to_insert = []
-
-                def safe_val(col_name, row):
-                    v = row.get(col_name)
-                    return '' if pd.isna(v) else str(v)
-
-                for row_idx, row in df.iterrows():
-                    excel_row = int(row_idx) + 2
-
-                    # Validate required fields (either MCQ or Theory)
-                    q_text = row.get('Question')
-                    if pd.isna(q_text) or str(q_text).strip() == '':
-                        errors.append((excel_row, 'Missing question text'))
-                        continue
-
-                    is_theory = False
-                    try:
-                        it = row.get('Is Theory')
-                        if not pd.isna(it) and str(it).strip().lower() in ['1','true','yes','y','t']:
-                            is_theory = True
-                    except Exception:
-                        is_theory = False
-
-                    if is_theory:
-                        if pd.isna(row.get('Theory')) or str(row.get('Theory')).strip() == '':
-                            errors.append((excel_row, 'Theory question missing Theory text'))
-                            continue
-                    else:
-                        if pd.isna(row.get('Option A')) or pd.isna(row.get('Option B')):
-                            errors.append((excel_row, 'Missing Option A or Option B'))
-                            continue
-                        if pd.isna(row.get('Correct Answer')) or str(row.get('Correct Answer')).strip() == '':
-                            errors.append((excel_row, 'Missing Correct Answer'))
-                            continue
-
-                    # Parse marks
-                    marks_val = 1
-                    try:
-                        mv = row.get('Mark')
-                        if not pd.isna(mv):
-                            marks_val = int(mv)
-                    except Exception:
-                        errors.append((excel_row, 'Invalid Mark value'))
-                        continue
-
-                    # If we reach here, row is valid — prepare cleaned data
-                    # Determine subject for this row: prefer 'Subject Code' column if present
-                    subject_for_row = subject_id
-                    try:
-                        # Prefer explicit Subject Code column if present
-                        if 'Subject Code' in df.columns and not pd.isna(row.get('Subject Code')):
-                            sc = str(row.get('Subject Code')).strip()
-                            subj = Subject.query.filter(func.upper(Subject.code) == sc.upper()).first()
-                            if subj:
-                                subject_for_row = subj.id
-                            else:
-                                errors.append((excel_row, f'Unknown Subject Code: {sc}'))
-                                continue
-                        # If 'Subject' (name) column present, try to resolve by name (create if missing)
-                        elif 'Subject' in df.columns and not pd.isna(row.get('Subject')):
-                            sname = str(row.get('Subject')).strip()
-                            subj = Subject.query.filter(func.lower(Subject.name) == sname.lower()).first()
-                            if not subj:
-                                # create new subject record so uploaded questions attach properly
-                                subj = Subject(name=sname, code=None, created_by=session.get('user_id'))
-                                db.session.add(subj)
-                                db.session.commit()
-                            subject_for_row = subj.id
-                    except Exception:
-                        pass
-
-                    rows_to_insert.append({
-                        'subject_id': subject_for_row,
-                        'question_text': str(q_text).strip(),
-                        'is_theory': is_theory,
-                        'theory_text': safe_val('Theory', row),
-                        'option_a': safe_val('Option A', row),
-                        'option_b': safe_val('Option B', row),
-                        'option_c': safe_val('Option C', row),
-                        'option_d': safe_val('Option D', row),
-                        'option_e': safe_val('Option E', row),
-                        'correct_answer': (str(row.get('Correct Answer')).upper().strip() if not is_theory else ''),
-                        'question_image': safe_val('Image Filename', row),
-                        'explanation': safe_val('Explanation', row),
-                        'marks': marks_val
-                    })
-
-                if errors:
-                    # Fail the whole upload and report errors — render the upload page with details
-                    print('Validation errors during Excel upload:')
-                    for r, reason in errors:
-                        print(f' - Excel row {r}: {reason}')
-                    # Clean up uploaded file before returning
-                    if os.path.exists(filepath):
-                        os.remove(filepath)
-                    # Return the upload page showing the exact rows and reasons so admin can fix the file
-                    return render_template('admin/upload_questions.html', subjects=subjects, upload_errors=errors, classes=classes)
-
-                # All rows valid — insert into database
-                # If a subject_class was selected, update the Subject record
-                try:
-                    if subject_class:
-                        subj_to_update = Subject.query.get(subject_id)
-                        if subj_to_update:
-                            subj_to_update.subject_class = subject_class
-                            db.session.commit()
-                except Exception:
-                    try:
-                        db.session.rollback()
-                    except Exception:
-                        pass
-                added_count = 0
-                for rdata in rows_to_insert:
-                    # determine class for this question: prefer upload `subject_class`, else inherit from Subject
-                    sid = rdata.get('subject_id', subject_id)
-                    sc = subject_class or None
-                    try:
-                        if not sc:
-                            subj_obj = Subject.query.get(sid)
-                            sc = getattr(subj_obj, 'subject_class', None) if subj_obj else None
-                    except Exception:
-                        sc = subject_class or None
-
-                    # Map any referenced image filename to the stored path if uploaded
-                    q_image = None
-                    try:
-                        qref = rdata.get('question_image') or ''
-                        if qref:
-                            # Prefer exact filename match from uploaded images
-                            q_image = uploaded_images.get(os.path.basename(qref)) or qref
-                    except Exception:
-                        q_image = rdata.get('question_image') or None
-
-                    question = Question(
-                        subject_id=sid,
-                        question_text=rdata['question_text'],
-                        option_a=rdata.get('option_a',''),
-                        option_b=rdata.get('option_b',''),
-                        option_c=rdata.get('option_c',''),
-                        option_d=rdata.get('option_d',''),
-                        option_e=rdata.get('option_e',''),
-                        correct_answer=rdata.get('correct_answer',''),
-                        explanation=rdata.get('explanation',''),
-                        marks=rdata.get('marks',1),
-                        subject_class=sc,
-                        is_theory=bool(rdata.get('is_theory', False)),
-                        theory_text=rdata.get('theory_text') or None,
-                        question_image=q_image,
-                        created_by=session['user_id']
-                    )
-                    db.session.add(question)
-                    added_count += 1
-
-                db.session.commit()
-                flash(f'{added_count} questions uploaded successfully', 'success')
-                
+                duplicates = {}
+                added_count, upload_errors = import_question_frame(
+                    pd.read_excel(file.stream), subject_id, subject_class, uploaded_images, session['user_id'],
+                    duplicates, school_id=school_id)
+                if not upload_errors:
+                    flash(f'{added_count} questions uploaded successfully' + duplicate_summary(duplicates), 'success')
             except Exception as e:
                 flash(f'Error processing file: {str(e)}', 'danger')
-            
-            # Clean up uploaded file
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            
-            return redirect(url_for('admin_questions'))
-    
+            if not upload_errors:
+                return redirect(url_for('admin_questions'))
+            # Return the upload page showing the exact rows and reasons so admin can fix the file
+            print(f'Validation errors during Excel upload: {len(upload_errors)} row(s)')
+
     # Ensure `classes` exists in case earlier code paths didn't define it
     try:
         existing_classes = [s.subject_class for s in subjects if getattr(s, 'subject_class', None)]
@@ -3264,19 +5222,106 @@ def upload_questions():
         if c and c not in classes:
             classes.append(c)
 
-    return render_template('admin/upload_questions.html', subjects=subjects, classes=classes)
+    return render_template('admin/upload_questions.html', subjects=subjects, classes=classes,
+                           upload_errors=upload_errors)
+
+
+# Media serving. With a front proxy, set MEDIA_OFFLOAD so the proxy streams the bytes and the
+# worker only authorises the request:
+#   MEDIA_OFFLOAD=x-accel-redirect (nginx):
+#       location /_protected_uploads/ { internal; alias /path/to/uploads/; }
+#   MEDIA_OFFLOAD=x-sendfile (Apache mod_xsendfile, lighttpd)
+# Without one, files are sent with ETag/Last-Modified (304s) and Range support.
+app.config['MEDIA_OFFLOAD'] = (os.environ.get('MEDIA_OFFLOAD') or '').lower()
+app.config['MEDIA_ACCEL_PREFIX'] = os.environ.get('MEDIA_ACCEL_PREFIX') or '/_protected_uploads/'
+app.config['USE_X_SENDFILE'] = app.config['MEDIA_OFFLOAD'] == 'x-sendfile'
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+_CONTENT_HASH_RE = re.compile(r'[0-9a-f]{64}')
+
+
+def is_content_addressed(relpath):
+    """Content-addressed files (named by their sha256) never change, so they can be cached forever."""
+    stem = os.path.splitext(os.path.basename(relpath))[0]
+    return bool(_CONTENT_HASH_RE.fullmatch(stem))
+
+
+def send_media(relpath, mimetype=None, max_age=None, immutable=None):
+    """Send a file under UPLOAD_FOLDER, via the front proxy when MEDIA_OFFLOAD is set."""
+    from flask import send_from_directory
+    from werkzeug.utils import safe_join
+    from urllib.parse import quote
+    base = os.path.abspath(app.config.get('UPLOAD_FOLDER', 'uploads'))
+    if immutable is None:
+        immutable = is_content_addressed(relpath)
+    if immutable:
+        max_age = MEDIA_IMMUTABLE_MAX_AGE
+    if app.config.get('MEDIA_OFFLOAD') == 'x-accel-redirect':
+        full = safe_join(base, relpath)
+        if not full:
+            return 'Access denied', 403
+        if not os.path.isfile(full):
+            return 'Not found', 404
+        import mimetypes
+        resp = Response(mimetype=mimetype or mimetypes.guess_type(full)[0] or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = app.config['MEDIA_ACCEL_PREFIX'].rstrip('/') + '/' + quote(relpath)
+        if max_age is not None:
+            resp.cache_control.max_age = max_age
+            resp.cache_control.public = True
+    else:
+        # conditional=True gives ETag/Last-Modified/304 and Range (206) handling;
+        # with USE_X_SENDFILE the body is left to the web server.
+        resp = send_from_directory(base, relpath, mimetype=mimetype, max_age=max_age, conditional=True, etag=True)
+    if immutable:
+        resp.cache_control.immutable = True
+    return resp
+
+
+# UPLOAD_FOLDER subdirectories that held private files in older layouts; never served publicly
+PRIVATE_UPLOAD_DIRS = {'jobs', 'result_pdfs'}
+
+
+def public_media_relpath(filename):
+    """Normalised path under UPLOAD_FOLDER that may be served publicly, or None."""
+    import posixpath
+    relpath = media_relpath(filename)
+    relpath = posixpath.normpath(relpath) if relpath else None
+    if not relpath or relpath.split('/', 1)[0] in PRIVATE_UPLOAD_DIRS | {'.', '..'}:
+        return None
+    return relpath
 
 
 @app.route('/uploads/<path:filename>')
 def serve_uploads(filename):
-    # Serve any uploaded file under the uploads directory. Use safe path join.
-    base = os.path.abspath(app.config.get('UPLOAD_FOLDER', 'uploads'))
-    target = os.path.abspath(os.path.join(base, filename))
-    if not target.startswith(base):
-        return 'Access denied', 403
-    if not os.path.exists(target):
+    # Serve any uploaded file under the uploads directory (send_from_directory joins safely).
+    relpath = public_media_relpath(filename)
+    if not relpath:
+        return 'Not found', 404
+    return send_media(relpath)
+
+
+@app.route('/media/v/<variant>/<path:filename>')
+def serve_media_variant(variant, filename):
+    """Serve a size/format variant of an uploaded image, e.g. /media/v/thumb.webp/question_images/ab/<sha>.png.
+    Until the variant has been built the original is returned and generation is queued."""
+    name, _, ext = variant.partition('.')
+    if name not in IMAGE_VARIANTS or ext not in IMAGE_VARIANT_FORMATS:
         return 'Not found', 404
-    return send_file(target)
+    relpath = public_media_relpath(filename)
+    if not relpath or relpath.rsplit('.', 1)[-1].lower() not in IMAGE_VARIANT_SOURCE_EXTS:
+        return 'Not found', 404
+    source = os.path.join(app.config['UPLOAD_FOLDER'], relpath)
+    target = os.path.join(_variant_dir(relpath), variant)
+    immutable = is_content_addressed(relpath)
+    try:
+        # a content-addressed source can't change, so its variants are never stale
+        if (immutable and os.path.exists(target)) or os.path.getmtime(target) >= os.path.getmtime(source):
+            return send_media(os.path.relpath(target, app.config['UPLOAD_FOLDER']),
+                              mimetype=IMAGE_VARIANT_FORMATS[ext][1], max_age=86400, immutable=immutable)
+    except OSError:
+        pass
+    schedule_image_variants(relpath)
+    # stand-in response: must not be cached under the variant URL
+    return send_media(relpath, max_age=0, immutable=False)
 
 
 @app.route('/media/passports/<path:filename>')
@@ -3318,6 +5363,7 @@ def admin_delete_question(question_id):
     except Exception:
         pass
 
+    drop_question_fingerprints([question_id])
     db.session.delete(question)
     db.session.commit()
 
@@ -3325,6 +5371,33 @@ def admin_delete_question(question_id):
     return redirect(url_for('admin_questions'))
 
 
+QUESTION_DELETE_CHUNK = 500
+
+
+@job_handler('delete_questions')
+def _job_delete_questions(ctx):
+    """Delete questions (and their answers) in committed chunks; safe to restart at any point."""
+    subject_ids = ctx.params.get('subject_ids')  # None means every question (superadmin)
+    q = db.session.query(Question.id)
+    if subject_ids is not None:
+        q = q.filter(Question.subject_id.in_(subject_ids))
+    done = int(ctx.checkpoint.get('deleted', 0))
+    total = done + q.count()
+    ctx.progress(done, total, message='Deleting questions')
+    while True:
+        q_ids = [qid for (qid,) in q.order_by(Question.id).limit(QUESTION_DELETE_CHUNK)]
+        if not q_ids:
+            break
+        # Delete related answers first to avoid FK issues
+        Answer.query.filter(Answer.question_id.in_(q_ids)).delete(synchronize_session=False)
+        drop_question_fingerprints(q_ids)
+        Question.query.filter(Question.id.in_(q_ids)).delete(synchronize_session=False)
+        done += len(q_ids)
+        ctx.progress(done, total, message=f'Deleted {done} of {total} question(s)', checkpoint={'deleted': done})
+    ctx.job.message = f'Deleted {done} question(s) successfully'
+    return {'deleted': done}
+
+
 @app.route('/admin/questions/delete_all', methods=['POST'])
 def admin_delete_all_questions():
     if 'user_id' not in session or session.get('role') != 'admin':
@@ -3335,41 +5408,24 @@ def admin_delete_all_questions():
     subject_id = request.form.get('subject_id', type=int)
 
     if subject_id:
-        questions = Question.query.filter_by(subject_id=subject_id).all()
+        subject_ids = [subject_id]
+    elif session.get('is_superadmin'):
+        subject_ids = None
     else:
-        # Only include questions from subjects belonging to this admin's school (unless superadmin)
-        if session.get('is_superadmin'):
-            questions = Question.query.all()
-        else:
-            subj_ids = [s.id for s in subjects_for_current_user()]
-            if not subj_ids:
-                questions = []
-            else:
-                questions = Question.query.filter(Question.subject_id.in_(subj_ids)).all()
-
-    q_ids = [q.id for q in questions]
+        # Only include questions from subjects belonging to this admin's school
+        subject_ids = [s.id for s in subjects_for_current_user()]
 
-    if not q_ids:
+    if subject_ids is None:
+        total = Question.query.count()
+    else:
+        total = Question.query.filter(Question.subject_id.in_(subject_ids)).count() if subject_ids else 0
+    if not total:
         flash('No questions found to delete', 'info')
         return redirect(url_for('admin_questions'))
 
-    try:
-        # Delete related answers first to avoid FK issues
-        Answer.query.filter(Answer.question_id.in_(q_ids)).delete(synchronize_session=False)
-    except Exception:
-        # Fallback: attempt to delete via loop
-        for qid in q_ids:
-            try:
-                Answer.query.filter_by(question_id=qid).delete()
-            except Exception:
-                pass
-
-    # Delete questions
-    Question.query.filter(Question.id.in_(q_ids)).delete(synchronize_session=False)
-    db.session.commit()
-
-    flash(f'Deleted {len(q_ids)} question(s) successfully', 'success')
-    return redirect(url_for('admin_questions'))
+    job = enqueue_job('delete_questions', params={'subject_ids': subject_ids}, total=total,
+                      message=f'Waiting to delete {total} question(s)')
+    return _job_started_response(job)
 
 
 @app.route('/admin/questions/delete_selected', methods=['POST'])
@@ -3411,6 +5467,7 @@ def admin_delete_selected_questions():
                 pass
 
     try:
+        drop_question_fingerprints(allowed)
         Question.query.filter(Question.id.in_(allowed)).delete(synchronize_session=False)
         db.session.commit()
         flash(f'Deleted {len(allowed)} question(s) successfully', 'success')
@@ -3424,6 +5481,162 @@ def admin_delete_selected_questions():
     return redirect(url_for('admin_questions'))
 
 
+def _duplicate_scope():
+    """Subject ids the duplicate report covers (None = every subject, for superadmins)."""
+    scope = None if session.get('is_superadmin') else [s.id for s in subjects_for_current_user()]
+    subject_id = request.values.get('subject_id', type=int)
+    if subject_id:
+        return [subject_id] if scope is None or subject_id in scope else []
+    return scope
+
+
+@app.route('/admin/questions/duplicates')
+def admin_question_duplicates():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+
+    subject_ids = _duplicate_scope()
+    clusters, total = question_duplicate_clusters(subject_ids) if subject_ids != [] else ([], 0)
+    ids = {qid for c in clusters for qid in c['question_ids']}
+    questions, answer_counts = {}, {}
+    for chunk in _in_chunks(ids):
+        questions.update({q.id: q for q in Question.query.filter(Question.id.in_(chunk))})
+        answer_counts.update(db.session.query(Answer.question_id, func.count(Answer.id))
+                             .filter(Answer.question_id.in_(chunk)).group_by(Answer.question_id))
+    for c in clusters:
+        c['questions'] = [questions[qid] for qid in c['question_ids'] if qid in questions]
+    clusters = [c for c in clusters if len(c['questions']) > 1]
+
+    unindexed = Question.query.outerjoin(QuestionFingerprint, QuestionFingerprint.question_id == Question.id) \
+        .filter(QuestionFingerprint.question_id.is_(None))
+    if subject_ids is not None:
+        unindexed = unindexed.filter(Question.subject_id.in_(subject_ids or [0]))
+    subjects = subjects_for_current_user()
+    return render_template('admin/question_duplicates.html', clusters=clusters, total=total,
+                           answer_counts=answer_counts, unindexed=unindexed.count(), subjects=subjects,
+                           subject_names={s.id: s.name for s in subjects},
+                           threshold=QUESTION_NEAR_DUPLICATE_THRESHOLD)
+
+
+def option_letter_map(src, dst):
+    """{letter of src: letter of dst} pairing options with the same text (case and spacing
+    ignored). Letters whose option has no counterpart in `dst` are left out."""
+    def text(q, letter):
+        return ' '.join(str(getattr(q, f'option_{letter.lower()}') or '').split()).casefold()
+    dst_letters = {}
+    for letter in 'ABCDE':
+        if text(dst, letter):
+            dst_letters.setdefault(text(dst, letter), letter)
+    return {letter: dst_letters[text(src, letter)] for letter in 'ABCDE'
+            if text(src, letter) and text(src, letter) in dst_letters}
+
+
+@app.route('/admin/questions/duplicates/merge', methods=['POST'])
+def admin_merge_duplicate_questions():
+    """Fold duplicates into the question kept: answers move over, re-lettered to the kept
+    question's options, the sessions concerned are regraded and the duplicates are deleted."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+
+    keep_id = request.form.get('keep_id', type=int)
+    merge_ids = {int(x) for x in request.form.getlist('ids') if str(x).isdigit()} - {keep_id}
+    keep = Question.query.get(keep_id) if keep_id else None
+    if not keep or not merge_ids:
+        flash('Choose the question to keep and at least one duplicate', 'warning')
+        return redirect(url_for('admin_question_duplicates'))
+    dups = Question.query.filter(Question.id.in_(merge_ids), Question.subject_id == keep.subject_id).all()
+    if not session.get('is_superadmin'):
+        my_school = _get_session_school_id()
+        if not question_belongs_to_school(keep.id, my_school):
+            flash('Access denied', 'danger')
+            return redirect(url_for('admin_question_duplicates'))
+    if len(dups) != len(merge_ids):
+        flash('Duplicates can only be merged within the same subject', 'danger')
+        return redirect(url_for('admin_question_duplicates'))
+
+    # answers are stored as option letters, so they can only move where every chosen option
+    # exists, word for word, in the kept question (its letter may differ)
+    letter_maps = {}
+    for dup in dups:
+        mapping = option_letter_map(dup, keep)
+        chosen = {(x or '').strip().upper() for (x,) in db.session.query(Answer.selected_answer)
+                  .filter(Answer.question_id == dup.id).distinct()} - {''}
+        missing = sorted(chosen - set(mapping))
+        if missing:
+            flash(f'Question #{dup.id} was answered with option(s) {", ".join(missing)} that question #{keep.id} '
+                  'does not have; edit the options to match before merging', 'danger')
+            return redirect(url_for('admin_question_duplicates', subject_id=request.form.get('subject_id') or None))
+        letter_maps[dup.id] = mapping
+
+    try:
+        moved = 0
+        affected = {sid for (sid,) in db.session.query(Answer.exam_session_id)
+                    .filter(Answer.question_id.in_([d.id for d in dups])).distinct()}
+        for dup in dups:
+            # a session that saw both copies keeps the answer it gave to the surviving question
+            answered_keep = db.session.query(Answer.exam_session_id).filter(Answer.question_id == keep.id)
+            Answer.query.filter(Answer.question_id == dup.id, Answer.exam_session_id.in_(answered_keep)) \
+                .delete(synchronize_session=False)
+            relettered = db.case(letter_maps[dup.id], value=func.upper(func.trim(Answer.selected_answer)),
+                                 else_=Answer.selected_answer) if letter_maps[dup.id] else Answer.selected_answer
+            moved += Answer.query.filter(Answer.question_id == dup.id) \
+                .update({'question_id': keep.id, 'selected_answer': relettered}, synchronize_session=False)
+        drop_question_fingerprints([d.id for d in dups])
+        Question.query.filter(Question.id.in_([d.id for d in dups])).delete(synchronize_session=False)
+        regraded = 0
+        for chunk in _in_chunks(sorted(affected), REGRADE_CHUNK):
+            for es in ExamSession.query.filter(ExamSession.id.in_(chunk), ExamSession.status == 'completed'):
+                grade_exam_session(es)
+                regraded += 1
+        db.session.commit()
+        flash(f'Merged {len(dups)} duplicate(s) into question #{keep.id} ({moved} answer(s) moved, '
+              f'{regraded} script(s) regraded)', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error merging questions: {e}', 'danger')
+    return redirect(url_for('admin_question_duplicates', subject_id=request.form.get('subject_id') or None))
+
+
+@job_handler('index_question_fingerprints')
+def _job_index_question_fingerprints(ctx):
+    """Recompute duplicate fingerprints for every question in scope, in committed chunks."""
+    subject_ids = ctx.params.get('subject_ids')
+    q = Question.query
+    if subject_ids is not None:
+        q = q.filter(Question.subject_id.in_(subject_ids))
+    last_id = int(ctx.checkpoint.get('question_id', 0))
+    total = q.count()
+    done = q.filter(Question.id <= last_id).count()
+    ctx.progress(done, total, message='Indexing questions')
+    while True:
+        batch = q.filter(Question.id > last_id).order_by(Question.id).limit(QUESTION_FINGERPRINT_CHUNK).all()
+        if not batch:
+            break
+        index_question_fingerprints(batch)
+        last_id = batch[-1].id
+        done += len(batch)
+        ctx.progress(done, total, message=f'Indexed {done} of {total} question(s)', checkpoint={'question_id': last_id})
+    ctx.job.message = f'Indexed {done} question(s) for duplicate detection'
+    return {'indexed': done}
+
+
+@app.route('/admin/questions/duplicates/reindex', methods=['POST'])
+def admin_reindex_duplicate_questions():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+
+    subject_ids = _duplicate_scope()
+    if subject_ids == []:
+        flash('No questions to index', 'info')
+        return redirect(url_for('admin_question_duplicates'))
+    job = enqueue_job('index_question_fingerprints', params={'subject_ids': subject_ids},
+                      message='Waiting to index questions')
+    return _job_started_response(job)
+
+
 @app.route('/admin/question/template')
 def download_question_template():
     # Only admin can download template
@@ -3455,39 +5668,8 @@ def download_question_template():
     )
 
 
-@app.route('/admin/question/generate', methods=['GET', 'POST'])
-def generate_questions():
-    # Admin-only
-    if 'user_id' not in session or session.get('role') != 'admin':
-        flash('Access denied', 'danger')
-        return redirect(url_for('login'))
-
-    subjects = subjects_for_current_user()
-
-    if request.method == 'GET':
-        return render_template('admin/generate_questions.html', subjects=subjects)
-
-    # POST: handle generation
-    try:
-        subject_id = int(request.form.get('subject_id'))
-        class_level = request.form.get('class_level', '').strip()
-        topics_raw = request.form.get('topics', '').strip()
-        # Normalize topics into a list (comma, newline separated)
-        topics = [t.strip() for t in re.split('[,\n;]+', topics_raw) if t.strip()]
-        total_q = int(request.form.get('total_questions', 0))
-    except Exception:
-        flash('Invalid input', 'danger')
-        return redirect(url_for('generate_questions'))
-
-    if total_q <= 0 or total_q > 200:
-        flash('Total questions must be between 1 and 200', 'danger')
-        return redirect(url_for('generate_questions'))
-
-    subject = Subject.query.get(subject_id)
-    if not subject:
-        flash('Selected subject not found', 'danger')
-        return redirect(url_for('generate_questions'))
-
+def generate_questions_ai(subject, class_level, topics, total_q):
+    """Generate `total_q` MCQs for `subject` with OpenAI, or template questions when unavailable."""
     # Try to use OpenAI API if API key provided in app config or environment
     OPENAI_KEY = app.config.get('OPENAI_API_KEY') or os.getenv('OPENAI_API_KEY')
     generated = []
@@ -3667,6 +5849,77 @@ def generate_questions():
                 'marks': 1
             })
 
+    return generated
+
+
+@job_handler('generate_questions')
+def _job_generate_questions(ctx):
+    p = ctx.params
+    subject = Subject.query.get(p['subject_id'])
+    if not subject:
+        raise ValueError('Selected subject not found')
+    ctx.progress(0, p['total_questions'], message='Generating questions')
+    generated = generate_questions_ai(subject, p.get('class_level', ''), p.get('topics') or [], p['total_questions'])
+    ctx.job.message = f'Generated {len(generated)} question(s) for review'
+    return {'subject_id': subject.id, 'class_level': p.get('class_level', ''), 'generated': generated}
+
+
+@app.route('/admin/question/generate', methods=['GET', 'POST'])
+def generate_questions():
+    # Admin-only
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+
+    subjects = subjects_for_current_user()
+
+    if request.method == 'GET':
+        return render_template('admin/generate_questions.html', subjects=subjects)
+
+    # POST: handle generation
+    try:
+        subject_id = int(request.form.get('subject_id'))
+        class_level = request.form.get('class_level', '').strip()
+        topics_raw = request.form.get('topics', '').strip()
+        # Normalize topics into a list (comma, newline separated)
+        topics = [t.strip() for t in re.split('[,\n;]+', topics_raw) if t.strip()]
+        total_q = int(request.form.get('total_questions', 0))
+    except Exception:
+        flash('Invalid input', 'danger')
+        return redirect(url_for('generate_questions'))
+
+    if total_q <= 0 or total_q > 200:
+        flash('Total questions must be between 1 and 200', 'danger')
+        return redirect(url_for('generate_questions'))
+
+    subject = Subject.query.get(subject_id)
+    if not subject:
+        flash('Selected subject not found', 'danger')
+        return redirect(url_for('generate_questions'))
+
+    job = enqueue_job('generate_questions', params={
+        'subject_id': subject.id,
+        'class_level': class_level,
+        'topics': topics,
+        'total_questions': total_q,
+    }, total=total_q, message=f'Waiting to generate {total_q} question(s)')
+    return _job_started_response(job)
+
+
+@app.route('/admin/question/generate/preview/<int:job_id>')
+def generate_questions_preview(job_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    job = _job_for_current_admin(job_id)
+    data = job.result_data() if job and job.kind == 'generate_questions' and job.status == 'completed' else None
+    subject = Subject.query.get(data['subject_id']) if data else None
+    if not subject:
+        flash('Generated questions not available', 'warning')
+        return redirect(url_for('generate_questions'))
+    generated = data.get('generated') or []
+    class_level = data.get('class_level', '')
+
     # Instead of inserting immediately, render a preview page where admin can review
     # Convert generated data to JSON for embedding in the preview form
     try:
@@ -3719,11 +5972,17 @@ def commit_generated_questions():
             'question_image': (it.get('question_image') or None), 'explanation': (it.get('explanation') or '')[:1000], 'marks': marks
         }
 
+    rows = []
     for item in items:
+        clean = _clean_item(item)
+        if clean:
+            rows.append(dict(clean, subject_id=subject_id))
+    # the generator often repeats itself or the existing bank: skip exact repeats, count near ones
+    duplicates = {}
+    rows, _ = screen_question_duplicates(rows, duplicates)
+    saved = []
+    for clean in rows:
         try:
-            clean = _clean_item(item)
-            if not clean:
-                continue
             q = Question(
                 subject_id=subject_id,
                 question_text=clean['question_text'],
@@ -3741,12 +6000,15 @@ def commit_generated_questions():
                 created_by=session['user_id']
             )
             db.session.add(q)
+            saved.append(q)
             added += 1
         except Exception as e:
             print('Failed to save generated question:', e)
 
+    db.session.flush()
+    index_question_fingerprints(saved, replace=False)
     db.session.commit()
-    flash(f'Saved {added} generated questions', 'success')
+    flash(f'Saved {added} generated questions' + duplicate_summary(duplicates), 'success')
     return redirect(url_for('admin_questions'))
 
 
@@ -3808,15 +6070,12 @@ def upload_passport():
     if not allowed_file(f.filename):
         flash('Unsupported file type', 'danger')
         return redirect(request.referrer or url_for('student_dashboard'))
-    fn = secure_filename(f.filename)
-    dest = os.path.join(app.config['UPLOAD_FOLDER'], 'passports')
-    os.makedirs(dest, exist_ok=True)
-    path = os.path.join(dest, fn)
-    f.save(path)
     try:
         user = User.query.get(session['user_id'])
-        user.passport_filename = os.path.relpath(path)
+        rel = store_raw_passport(f.stream, user.username, f.filename.rsplit('.', 1)[1] if '.' in f.filename else 'jpg')
+        user.passport_filename = rel
         db.session.commit()
+        schedule_passport_processing(user.id, rel)
         flash('Passport uploaded', 'success')
     except Exception:
         try:
@@ -3827,24 +6086,113 @@ def upload_passport():
     return redirect(request.referrer or url_for('student_dashboard'))
 
 
-@app.route('/admin/upload_recording/<int:session_id>', methods=['POST'])
-def admin_upload_recording(session_id):
-    if 'user_id' not in session or session.get('role') != 'admin':
-        return {'error':'Access denied'}, 403
+# Proctoring recordings. Files are stored content-addressed under uploads/recordings/<aa>/<sha256>.<ext>
+# so a client-supplied filename can never overwrite another recording. The browser streams its recorder
+# output with the chunked protocol below (init, PUT chunk N, complete); the single-request routes remain
+# for small files and older clients.
+RECORDING_EXTS = {'webm', 'mp4', 'ogg', 'ogv', 'mkv', 'mov'}
+RECORDING_MIME_EXTS = {'video/webm': 'webm', 'audio/webm': 'webm', 'video/mp4': 'mp4', 'video/ogg': 'ogv',
+                       'audio/ogg': 'ogg', 'video/x-matroska': 'mkv', 'video/quicktime': 'mov'}
+app.config['RECORDING_CHUNK_MAX_BYTES'] = int(os.environ.get('RECORDING_CHUNK_MAX_BYTES', str(8 * 1024 * 1024)))
+app.config['RECORDING_UPLOAD_MAX_BYTES'] = int(os.environ.get('RECORDING_UPLOAD_MAX_BYTES', str(4 * 1024 * 1024 * 1024)))
+# open uploads idle this long are discarded with their partial file
+RECORDING_UPLOAD_EXPIRE_SECONDS = 24 * 3600
+RECORDING_UPLOAD_PRUNE_INTERVAL = 600
+_recording_upload_locks = {}
+_recording_upload_locks_guard = threading.Lock()
+_recording_uploads_pruned_at = 0.0
+
+
+def _recording_ext(filename=None, content_type=None):
+    ext = ''
+    if filename and '.' in filename:
+        ext = filename.rsplit('.', 1)[1].lower()
+    if ext not in RECORDING_EXTS:
+        ext = RECORDING_MIME_EXTS.get((content_type or '').split(';')[0].strip().lower(), 'webm')
+    return ext
+
+
+def _recording_media_name(stored):
+    """Path of a stored recording relative to uploads/recordings, as used by `serve_recording`."""
+    relpath = media_relpath(stored) or ''
+    if relpath.startswith('recordings/'):
+        return relpath[len('recordings/'):]
+    return relpath.rsplit('/', 1)[-1]
+
+
+def _recording_session_allowed(exam_session):
+    """Admins may attach recordings to any session; students only to their own."""
+    if 'user_id' not in session or not exam_session:
+        return False
+    if session.get('role') == 'admin':
+        return True
+    return exam_session.student_id == session['user_id']
+
+
+def _recording_partial_path(upload_id):
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'recordings', 'partial', f'{upload_id}.part')
+
+
+def _recording_upload_lock(upload_id):
+    with _recording_upload_locks_guard:
+        lock = _recording_upload_locks.get(upload_id)
+        if lock is None:
+            lock = _recording_upload_locks[upload_id] = threading.Lock()
+        return lock
+
+
+def prune_recording_uploads():
+    """Drop open uploads idle for RECORDING_UPLOAD_EXPIRE_SECONDS: rows, chunks, partial files and
+    their in-process locks. Runs at most once per RECORDING_UPLOAD_PRUNE_INTERVAL per process."""
+    global _recording_uploads_pruned_at
+    now = time.monotonic()
+    with _recording_upload_locks_guard:
+        if now - _recording_uploads_pruned_at < RECORDING_UPLOAD_PRUNE_INTERVAL:
+            return
+        _recording_uploads_pruned_at = now
+    cutoff = datetime.utcnow() - timedelta(seconds=RECORDING_UPLOAD_EXPIRE_SECONDS)
+    try:
+        expired = [uid for (uid,) in db.session.query(RecordingUpload.id).filter(
+            RecordingUpload.status == 'open', RecordingUpload.updated_at < cutoff)]
+        for chunk in _in_chunks(expired, 500):
+            RecordingChunk.query.filter(RecordingChunk.upload_id.in_(chunk)).delete(synchronize_session=False)
+            RecordingUpload.query.filter(RecordingUpload.id.in_(chunk), RecordingUpload.status == 'open').delete(
+                synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print('Recording upload pruning skipped:', e)
+        return
+    for upload_id in expired:
+        try:
+            os.remove(_recording_partial_path(upload_id))
+        except OSError:
+            pass
+    with _recording_upload_locks_guard:
+        for upload_id in expired:
+            _recording_upload_locks.pop(upload_id, None)
+
+
+def _save_recording(session_id, fileobj, ext, commit=True):
+    """Store a finished recording and add its Recording row. Returns the Recording."""
+    relpath, _sha, _created = store_content_addressed(fileobj, 'recordings', ext)
+    rec = Recording(exam_session_id=session_id, filename=relpath)
+    db.session.add(rec)
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+    return rec
+
+
+def _upload_recording_file(session_id):
     if 'recording' not in request.files:
         return {'error':'No file'}, 400
     f = request.files['recording']
     if f.filename == '':
         return {'error':'No filename'}, 400
-    fn = secure_filename(f.filename)
-    dest = os.path.join(app.config['UPLOAD_FOLDER'], 'recordings')
-    os.makedirs(dest, exist_ok=True)
-    path = os.path.join(dest, fn)
-    f.save(path)
     try:
-        rec = Recording(exam_session_id=session_id, filename=os.path.relpath(path))
-        db.session.add(rec)
-        db.session.commit()
+        rec = _save_recording(session_id, f.stream, _recording_ext(f.filename, f.mimetype))
         return {'status':'ok','recording_id':rec.id}
     except Exception as e:
         try:
@@ -3854,6 +6202,13 @@ def admin_upload_recording(session_id):
         return {'error':str(e)}, 500
 
 
+@app.route('/admin/upload_recording/<int:session_id>', methods=['POST'])
+def admin_upload_recording(session_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error':'Access denied'}, 403
+    return _upload_recording_file(session_id)
+
+
 @app.route('/student/upload_recording/<int:session_id>', methods=['POST'])
 def student_upload_recording(session_id):
     if 'user_id' not in session:
@@ -3861,27 +6216,191 @@ def student_upload_recording(session_id):
     exam_session = ExamSession.query.get(session_id)
     if not exam_session or exam_session.student_id != session['user_id']:
         return {'error':'Access denied'}, 403
-    if 'recording' not in request.files:
-        return {'error':'No file'}, 400
-    f = request.files['recording']
-    if f.filename == '':
-        return {'error':'No filename'}, 400
-    fn = secure_filename(f.filename)
-    dest = os.path.join(app.config['UPLOAD_FOLDER'], 'recordings')
-    os.makedirs(dest, exist_ok=True)
-    path = os.path.join(dest, fn)
-    f.save(path)
+    return _upload_recording_file(session_id)
+
+
+@app.route('/recording/upload/init/<int:session_id>', methods=['POST'])
+def recording_upload_init(session_id):
+    """Start a chunked upload. Body (JSON, optional): {"filename": ..., "content_type": ...}."""
+    exam_session = ExamSession.query.get(session_id)
+    if not _recording_session_allowed(exam_session):
+        return {'error':'Access denied'}, 403
+    prune_recording_uploads()
+    data = request.get_json(silent=True) or {}
+    import uuid
+    upload = RecordingUpload(id=uuid.uuid4().hex, exam_session_id=session_id, created_by=session['user_id'],
+                             ext=_recording_ext(data.get('filename'), data.get('content_type')))
     try:
-        rec = Recording(exam_session_id=session_id, filename=os.path.relpath(path))
-        db.session.add(rec)
+        path = _recording_partial_path(upload.id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+        db.session.add(upload)
         db.session.commit()
-        return {'status':'ok','recording_id':rec.id}
     except Exception as e:
         try:
             db.session.rollback()
         except Exception:
             pass
         return {'error':str(e)}, 500
+    result = upload.to_dict()
+    result['chunk_max_bytes'] = app.config['RECORDING_CHUNK_MAX_BYTES']
+    return result, 201
+
+
+def _get_recording_upload(upload_id):
+    """Return (upload, None) or (None, error response) for the current user."""
+    upload = RecordingUpload.query.get(upload_id)
+    if not upload:
+        return None, ({'error':'Unknown upload'}, 404)
+    if not _recording_session_allowed(ExamSession.query.get(upload.exam_session_id)):
+        return None, ({'error':'Access denied'}, 403)
+    return upload, None
+
+
+@app.route('/recording/upload/<upload_id>', methods=['GET'])
+def recording_upload_status(upload_id):
+    """Resume point for a client that lost its connection: the next chunk index the server expects."""
+    upload, error = _get_recording_upload(upload_id)
+    if error:
+        return error
+    return upload.to_dict()
+
+
+@app.route('/recording/upload/<upload_id>/chunk/<int:index>', methods=['PUT'])
+def recording_upload_chunk(upload_id, index):
+    """Append chunk `index` (raw request body) to the upload.
+
+    Chunks must arrive in order. An X-Chunk-SHA256 header is checked against the body; re-sending
+    an already accepted chunk with the same checksum is acknowledged without writing it again.
+    """
+    import hashlib
+    upload, error = _get_recording_upload(upload_id)
+    if error:
+        return error
+    if upload.status != 'open':
+        return {'error':'Upload already completed', **upload.to_dict()}, 409
+    max_chunk = app.config['RECORDING_CHUNK_MAX_BYTES']
+    if (request.content_length or 0) > max_chunk:
+        return {'error':f'Chunk larger than {max_chunk} bytes'}, 413
+    body = request.get_data(cache=False)
+    if not body:
+        return {'error':'Empty chunk'}, 400
+    sha = hashlib.sha256(body).hexdigest()
+    claimed = (request.headers.get('X-Chunk-SHA256') or '').strip().lower()
+    if claimed and claimed != sha:
+        return {'error':'Checksum mismatch', 'sha256': sha, **upload.to_dict()}, 422
+
+    with _recording_upload_lock(upload_id):
+        db.session.refresh(upload)
+        next_index = upload.next_index or 0
+        offset = upload.bytes_received or 0
+        if index < next_index:
+            done = RecordingChunk.query.filter_by(upload_id=upload_id, index=index).first()
+            if done and done.sha256 == sha:
+                return {'chunk':'duplicate', **upload.to_dict()}
+            return {'error':'Chunk already received with different content', **upload.to_dict()}, 409
+        if index > next_index:
+            return {'error':'Chunk out of order', **upload.to_dict()}, 409
+        if offset + len(body) > app.config['RECORDING_UPLOAD_MAX_BYTES']:
+            return {'error':'Recording too large'}, 413
+        # Write the bytes durably before recording the chunk as received, so a worker dying in
+        # between leaves the slot open for the client's retry instead of a hole in the file.
+        try:
+            with open(_recording_partial_path(upload_id), 'r+b') as out:
+                out.seek(offset)
+                out.write(body)
+                out.flush()
+                os.fsync(out.fileno())
+        except Exception as e:
+            return {'error':str(e)}, 500
+        try:
+            # The conditional update fails if another worker already took the slot.
+            db.session.add(RecordingChunk(upload_id=upload_id, index=index, offset=offset, size=len(body), sha256=sha))
+            claimed_rows = RecordingUpload.query.filter_by(id=upload_id, next_index=next_index, status='open').update(
+                {'next_index': next_index + 1, 'bytes_received': offset + len(body), 'updated_at': datetime.utcnow()},
+                synchronize_session=False)
+            if claimed_rows != 1:
+                db.session.rollback()
+                db.session.refresh(upload)
+                return {'error':'Chunk out of order', **upload.to_dict()}, 409
+            db.session.commit()
+        except Exception:
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            db.session.refresh(upload)
+            return {'error':'Chunk out of order', **upload.to_dict()}, 409
+        db.session.refresh(upload)
+        return {'chunk':'stored', 'sha256': sha, **upload.to_dict()}
+
+
+def _first_bad_recording_chunk(upload_id, path):
+    """The first accepted chunk whose bytes in the partial file no longer match its checksum
+    (missing or overwritten by a racing retry), or None."""
+    import hashlib
+    chunks = RecordingChunk.query.filter_by(upload_id=upload_id).order_by(RecordingChunk.index).all()
+    try:
+        with open(path, 'rb') as part:
+            for chunk in chunks:
+                part.seek(chunk.offset)
+                data = part.read(chunk.size)
+                if len(data) != chunk.size or hashlib.sha256(data).hexdigest() != chunk.sha256:
+                    return chunk
+    except OSError:
+        return chunks[0] if chunks else None
+    return None
+
+
+@app.route('/recording/upload/<upload_id>/complete', methods=['POST'])
+def recording_upload_complete(upload_id):
+    """Finish an upload. Body (JSON, optional): {"chunks": N} to confirm the client's chunk count."""
+    upload, error = _get_recording_upload(upload_id)
+    if error:
+        return error
+    if upload.status == 'complete':
+        return upload.to_dict()
+    data = request.get_json(silent=True) or {}
+    with _recording_upload_lock(upload_id):
+        db.session.refresh(upload)
+        if data.get('chunks') is not None and int(data['chunks']) != (upload.next_index or 0):
+            return {'error':'Missing chunks', **upload.to_dict()}, 409
+        if not upload.bytes_received:
+            return {'error':'Nothing uploaded', **upload.to_dict()}, 400
+        path = _recording_partial_path(upload_id)
+        bad = _first_bad_recording_chunk(upload_id, path)
+        if bad is not None:
+            # rewind to the damaged chunk so the client resends from there
+            RecordingChunk.query.filter(RecordingChunk.upload_id == upload_id,
+                                        RecordingChunk.index >= bad.index).delete(synchronize_session=False)
+            upload.next_index = bad.index
+            upload.bytes_received = bad.offset
+            upload.updated_at = datetime.utcnow()
+            db.session.commit()
+            return {'error':'Chunk damaged, resend from next_index', **upload.to_dict()}, 409
+        try:
+            with open(path, 'r+b') as part:
+                part.truncate(upload.bytes_received)
+                part.seek(0)
+                rec = _save_recording(upload.exam_session_id, part, upload.ext, commit=False)
+            upload.status = 'complete'
+            upload.recording_id = rec.id
+            upload.updated_at = datetime.utcnow()
+            RecordingChunk.query.filter_by(upload_id=upload_id).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            try:
+                db.session.rollback()
+            except Exception:
+                pass
+            return {'error':str(e)}, 500
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        with _recording_upload_locks_guard:
+            _recording_upload_locks.pop(upload_id, None)
+        return upload.to_dict()
 
 
 @app.route('/admin/note', methods=['POST'])
@@ -3966,8 +6485,7 @@ def admin_view_exam(exam_id):
                 student = None
                 if sess:
                     student = User.query.get(sess.student_id)
-                import ntpath
-                basename = ntpath.basename(rec.filename or '')
+                basename = _recording_media_name(rec.filename)
                 recordings.append({
                     'id': rec.id,
                     'filename': rec.filename,
@@ -3980,7 +6498,31 @@ def admin_view_exam(exam_id):
     except Exception:
         recordings = []
 
-    return render_template('admin/exam_detail.html', exam=exam, questions=questions, recordings=recordings)
+    stats_school = None if session.get('is_superadmin') else _get_effective_school_id()
+    if not session.get('is_superadmin') and not stats_school:
+        flash('Access denied to that exam', 'danger')
+        return redirect(url_for('admin_exams'))
+    stats = exam_stats(exam.id, stats_school or 0)
+    class_stats = [r for r in exam_stats_scopes(exam.id, stats_school) if r['student_class']]
+    item_analysis = exam_item_analysis(exam.id) if stats['count'] else None
+
+    return render_template('admin/exam_detail.html', exam=exam, questions=questions, recordings=recordings,
+                           stats=stats, class_stats=class_stats, item_analysis=item_analysis)
+
+
+@app.route('/admin/exam/<int:exam_id>/stats')
+def admin_exam_stats(exam_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'Access denied'}, 403
+    exam = Exam.query.get_or_404(exam_id)
+    school_id = request.args.get('school_id', type=int) or 0
+    if not session.get('is_superadmin'):
+        school_id = _get_effective_school_id() or 0
+        if not school_id or not exam_belongs_to_school(exam.id, school_id):
+            return {'error': 'Access denied'}, 403
+    stats = exam_stats(exam.id, school_id, (request.args.get('class') or '').strip())
+    stats['exam_id'] = exam.id
+    return stats
 
 
 
@@ -4006,12 +6548,10 @@ def admin_edit_exam(exam_id):
             f = request.files['exam_image']
             if f and f.filename:
                 try:
-                    fname = secure_filename(f.filename)
-                    dest = os.path.join(app.config['UPLOAD_FOLDER'], 'exam_images')
-                    os.makedirs(dest, exist_ok=True)
-                    path = os.path.join(dest, fname)
-                    f.save(path)
-                    exam.exam_image = os.path.relpath(path)
+                    ext = f.filename.rsplit('.', 1)[-1] if '.' in f.filename else ''
+                    path, _, _ = store_content_addressed(f.stream, 'exam_images', ext)
+                    exam.exam_image = path
+                    schedule_image_variants(path)
                     db.session.add(exam)
                     db.session.commit()
                     flash('Exam image uploaded', 'success')
@@ -4085,27 +6625,10 @@ def admin_exam_codes_export(exam_id):
         return redirect(url_for('login'))
 
     exam = Exam.query.get_or_404(exam_id)
-    codes = ExamAccessCode.query.filter_by(exam_id=exam.id).all()
-
-    # Build CSV content
-    output = io.StringIO()
-    output.write('student_username,student_full_name,code,created_at\n')
-    for c in codes:
-        uname = c.student.username if c.student else ''
-        fname = c.student.full_name if c.student else ''
-        created = c.created_at.strftime('%Y-%m-%d %H:%M') if c.created_at else ''
-        output.write(f'{uname},{fname},{c.code},{created}\n')
-
-    csv_data = output.getvalue()
-    output.close()
-
-    return Response(
-        csv_data,
-        mimetype='text/csv',
-        headers={
-            'Content-Disposition': f'attachment; filename=exam_{exam.id}_codes.csv'
-        }
-    )
+    rows = iter_query_rows(exam_code_export_query(exam.id),
+                           lambda r: (r[0], r[1], r[2], r[3].strftime('%Y-%m-%d %H:%M') if r[3] else ''))
+    return export_response(request.args.get('format'), f'exam_{exam.id}_codes', 'Access Codes',
+                           ['student_username', 'student_full_name', 'code', 'created_at'], rows)
 
 
 @app.route('/admin/exam/<int:exam_id>/toggle_quick', methods=['POST'])
@@ -4315,29 +6838,373 @@ def add_exam():
         db.session.add(exam)
         db.session.commit()
 
-        flash('Exam created successfully', 'success')
-        return redirect(url_for('admin_exams'))
+        flash('Exam created successfully', 'success')
+        return redirect(url_for('admin_exams'))
+
+    return render_template('admin/add_exam.html', subjects=subjects, classes=classes)
+
+def _admin_result_page():
+    """Keyset page of completed sessions visible to the current admin (newest first)."""
+    if session.get('is_superadmin'):
+        school_id = None
+    else:
+        school_id = _get_effective_school_id()
+        if not school_id:
+            return [], None, 0
+    after, limit = list_page_args()
+    q = result_list_query(school_id)
+    rows, next_after = keyset_page(q, ExamSession.id, after, limit)
+    return [result_row(row) for row in rows], next_after, cached_count(('results', school_id), q)
+
+
+@app.route('/admin/results')
+def admin_results():
+    if 'user_id' not in session or session['role'] != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    
+    # Scope results to the effective school for non-superadmins
+    exam_sessions, next_after, total = _admin_result_page()
+    subjects = subjects_for_current_user()
+    return render_template('admin/results.html', exam_sessions=exam_sessions, subjects=subjects,
+                           next_after=next_after, total=total)
+
+
+@app.route('/admin/results/json')
+def admin_results_json():
+    """Next page of the results table: ?after=<last session id>&limit=N."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'access denied'}, 403
+    rows, next_after, total = _admin_result_page()
+    return {'results': rows, 'next_after': next_after, 'total': total}
+
+
+@app.route('/admin/results/<int:session_id>/json')
+def admin_result_detail_json(session_id):
+    """Details for the results modal, fetched when it is opened."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'access denied'}, 403
+    school_id = None if session.get('is_superadmin') else _get_effective_school_id()
+    if not session.get('is_superadmin') and not school_id:
+        return {'error': 'not found'}, 404
+    row = result_list_query(school_id).filter(ExamSession.id == session_id).first()
+    if not row:
+        return {'error': 'not found'}, 404
+    item = result_row(row)
+    answered, correct = db.session.query(func.count(Answer.selected_answer), func.sum(db.case((Answer.is_correct, 1), else_=0))) \
+        .filter(Answer.exam_session_id == session_id).one()
+    item.update(answered=answered or 0, correct=int(correct or 0))
+    return item
+
+
+# Class gradebook: average percentage per student per subject for one class and academic term,
+# pivoted with pandas from a single GROUP BY query. Built gradebooks are cached per
+# (school, class, term) together with a version read from the database (count and latest
+# graded_at of the sessions in scope), so grading, regrading or deleting a session in any
+# worker process makes the next read rebuild.
+# Terms are derived from completion dates: the academic year starts in September and its
+# terms start in the months below; term keys look like '2025-1' (first term of 2025/2026).
+ACADEMIC_TERM_START_MONTHS = (9, 1, 5)
+ACADEMIC_TERM_NAMES = ('First', 'Second', 'Third')
+GRADEBOOK_RECENT_TERMS = 6
+GRADEBOOK_CACHE_SIZE = 64
+_gradebook_cache = {}
+_gradebook_lock = threading.Lock()
+
+
+def academic_term(when):
+    """Term key of a datetime."""
+    year = when.year if when.month >= ACADEMIC_TERM_START_MONTHS[0] else when.year - 1
+    months = [(m if m >= ACADEMIC_TERM_START_MONTHS[0] else m + 12) for m in ACADEMIC_TERM_START_MONTHS]
+    month = when.month if when.month >= ACADEMIC_TERM_START_MONTHS[0] else when.month + 12
+    number = max(i for i, m in enumerate(months) if m <= month) + 1
+    return f'{year}-{number}'
+
+
+def _term_start(year, number):
+    month = ACADEMIC_TERM_START_MONTHS[number - 1]
+    return datetime(year if month >= ACADEMIC_TERM_START_MONTHS[0] else year + 1, month, 1)
+
+
+def term_bounds(term):
+    """(start, end) datetimes of a term key; raises ValueError for a malformed key."""
+    try:
+        year, number = (int(x) for x in term.split('-'))
+    except Exception:
+        raise ValueError(f'Invalid term "{term}"')
+    if not 1 <= number <= len(ACADEMIC_TERM_START_MONTHS):
+        raise ValueError(f'Invalid term "{term}"')
+    end = _term_start(year + 1, 1) if number == len(ACADEMIC_TERM_START_MONTHS) else _term_start(year, number + 1)
+    return _term_start(year, number), end
+
+
+def term_label(term):
+    year, number = (int(x) for x in term.split('-'))
+    return f'{year}/{year + 1} {ACADEMIC_TERM_NAMES[number - 1]} Term'
+
+
+def recent_terms(count=GRADEBOOK_RECENT_TERMS):
+    """The current term and the ones before it, newest first."""
+    terms, when = [], datetime.utcnow()
+    while len(terms) < count:
+        term = academic_term(when)
+        terms.append(term)
+        when = term_bounds(term)[0] - timedelta(days=1)
+    return terms
+
+
+def _gradebook_sessions(query, school_id, student_class, term):
+    """Restrict `query` (over ExamSession joined to User) to a class's completed sessions."""
+    query = query.filter(ExamSession.status == 'completed', User.student_class == student_class)
+    if school_id:
+        query = query.filter(User.school_id == school_id)
+    if term:
+        start, end = term_bounds(term)
+        query = query.filter(ExamSession.end_time >= start, ExamSession.end_time < end)
+    return query
+
+
+def gradebook_version(school_id, student_class, term=None):
+    """Changes whenever a session in the gradebook's scope is graded, regraded or deleted."""
+    q = db.session.query(func.count(ExamSession.id), func.max(ExamSession.graded_at)) \
+        .select_from(ExamSession).join(User, ExamSession.student_id == User.id)
+    count, latest = _gradebook_sessions(q, school_id, student_class, term).one()
+    return count, latest.isoformat() if latest else None
+
+
+def build_gradebook(school_id, student_class, term=None):
+    """Students x subjects average percentages of a class, with total, average and position.
+    `school_id` 0/None means every school; `term` None means all time."""
+    percent = 100.0 * func.coalesce(ExamSession.score, 0) / func.nullif(Exam.total_marks, 0)
+    q = (db.session.query(User.id, User.username, User.full_name, Subject.id, Subject.name, Subject.code,
+                          func.avg(percent))
+         .select_from(ExamSession)
+         .join(User, ExamSession.student_id == User.id)
+         .join(Exam, ExamSession.exam_id == Exam.id)
+         .join(Subject, Exam.subject_id == Subject.id)
+         .group_by(User.id, User.username, User.full_name, Subject.id, Subject.name, Subject.code))
+    q = _gradebook_sessions(q, school_id, student_class, term)
+    df = pd.DataFrame(q.all(), columns=['student_id', 'username', 'full_name', 'subject_id', 'subject',
+                                        'subject_code', 'percent'])
+    if df.empty:
+        return {'subjects': [], 'rows': [], 'subject_averages': []}
+    # subjects sharing a name (e.g. one per level) are told apart by code
+    subjects = df.drop_duplicates('subject_id')[['subject_id', 'subject', 'subject_code']].itertuples(index=False)
+    subjects = {sid: (name, code) for sid, name, code in subjects}
+    repeated = pd.Series([name for name, _ in subjects.values()]).value_counts()
+    labels = {sid: name if repeated[name] == 1 else f'{name} ({code or sid})' for sid, (name, code) in subjects.items()}
+    grid = df.pivot_table(index='student_id', columns='subject_id', values='percent', aggfunc='first')
+    grid = grid[sorted(grid.columns, key=lambda sid: labels[sid])]
+    names = df.drop_duplicates('student_id').set_index('student_id')[['username', 'full_name']]
+    scores = grid.to_numpy(dtype=float)
+    taken = (~np.isnan(scores)).sum(axis=1)
+    total = np.nansum(scores, axis=1)
+    average = np.divide(total, taken, out=np.zeros(len(total)), where=taken > 0)
+    position = pd.Series(average).rank(method='min', ascending=False).astype(int).to_numpy()
+    rows = []
+    for i in np.argsort(position, kind='stable'):
+        student_id = grid.index[i]
+        username, full_name = names.at[student_id, 'username'], names.at[student_id, 'full_name']
+        rows.append({'student_id': int(student_id), 'username': username,
+                     'full_name': None if pd.isna(full_name) else full_name,
+                     'scores': [None if np.isnan(v) else round(float(v), 1) for v in scores[i]],
+                     'subjects_taken': int(taken[i]), 'total': round(float(total[i]), 1),
+                     'average': round(float(average[i]), 1), 'position': int(position[i])})
+    subject_averages = [None if np.isnan(v) else round(float(v), 1) for v in grid.mean(axis=0).to_numpy()]
+    return {'subjects': [labels[sid] for sid in grid.columns], 'rows': rows, 'subject_averages': subject_averages}
+
+
+def class_gradebook(school_id, student_class, term=None):
+    """build_gradebook, reused while the scope's gradebook_version is unchanged."""
+    scope = (int(school_id or 0), (student_class or '').strip())
+    key = scope + (term or '',)
+    version = gradebook_version(scope[0], scope[1], term)
+    with _gradebook_lock:
+        hit = _gradebook_cache.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    book = build_gradebook(scope[0], scope[1], term)
+    with _gradebook_lock:
+        _gradebook_cache.pop(key, None)
+        while len(_gradebook_cache) >= GRADEBOOK_CACHE_SIZE:
+            _gradebook_cache.pop(next(iter(_gradebook_cache)))
+        _gradebook_cache[key] = (version, book)
+    return book
+
+
+@app.route('/admin/gradebook')
+def admin_gradebook():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    school_id = None if session.get('is_superadmin') else _get_effective_school_id()
+    if not session.get('is_superadmin') and not school_id:
+        flash('No school selected', 'warning')
+        return redirect(url_for('admin_results'))
+    student_class = (request.args.get('class') or '').strip()
+    term = (request.args.get('term') or '').strip() or None
+    if term:
+        try:
+            term_bounds(term)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin_gradebook', **{'class': student_class}))
+    book = class_gradebook(school_id, student_class, term) if student_class else None
+    fmt = request.args.get('format')
+    if book is not None and fmt in ('csv', 'xlsx'):
+        header = ['Position', 'Username', 'Full Name'] + book['subjects'] + ['Subjects', 'Total', 'Average']
+        rows = ([r['position'], r['username'], r['full_name']] + r['scores'] + [r['subjects_taken'], r['total'], r['average']]
+                for r in book['rows'])
+        basename = secure_filename(f"gradebook_{student_class}_{term or 'all'}") or 'gradebook'
+        return export_response(fmt, basename, f'{student_class} Gradebook', header, rows)
+    terms = [(t, term_label(t)) for t in recent_terms()]
+    return render_template('admin/gradebook.html', book=book, student_class=student_class, term=term,
+                           terms=terms, classes=classes_for_school(school_id))
+
+
+# Results change feed: sessions ordered by (graded_at, id) so a downstream system can pull only
+# what was completed or re-graded since its last cursor. Rows stamped within the last
+# RESULT_CHANGES_LAG_SECONDS are held back so a transaction still committing an earlier stamp
+# cannot be skipped over.
+RESULT_CHANGES_LAG_SECONDS = 5
+RESULT_CHANGES_MAX_LIMIT = 5000
+REGRADE_CHUNK = 200
+
+
+def encode_results_cursor(graded_at, session_id):
+    import base64
+    raw = f'{graded_at.isoformat()}|{session_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_results_cursor(cursor):
+    """Return (graded_at, session_id) or raise ValueError for a malformed cursor."""
+    import base64
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        stamp, sid = raw.rsplit('|', 1)
+        return datetime.fromisoformat(stamp), int(sid)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
 
-    return render_template('admin/add_exam.html', subjects=subjects, classes=classes)
+def result_changes(since=None, school_id=None, limit=500):
+    """One page of completed sessions graded after cursor `since`.
 
-@app.route('/admin/results')
-def admin_results():
-    if 'user_id' not in session or session['role'] != 'admin':
+    Returns {'results': [...], 'next_cursor': str, 'has_more': bool}. `next_cursor` is the cursor
+    to pass next time (unchanged when nothing new), so the cost is proportional to the changes.
+    """
+    from sqlalchemy.orm import aliased
+    Student = aliased(User)
+    limit = max(1, min(int(limit or 500), RESULT_CHANGES_MAX_LIMIT))
+    q = (db.session.query(ExamSession.id, ExamSession.graded_at, ExamSession.score, ExamSession.start_time,
+                          ExamSession.end_time, Exam.id, Exam.title, Exam.total_marks,
+                          func.coalesce(func.nullif(Exam.subject_class, ''), Subject.subject_class),
+                          Subject.name, Subject.code, Student.id, Student.username, Student.full_name,
+                          Student.student_class)
+         .join(Exam, ExamSession.exam_id == Exam.id)
+         .join(Subject, Exam.subject_id == Subject.id)
+         .join(Student, ExamSession.student_id == Student.id)
+         .filter(ExamSession.status == 'completed', ExamSession.graded_at.isnot(None),
+                 ExamSession.graded_at <= datetime.utcnow() - timedelta(seconds=RESULT_CHANGES_LAG_SECONDS)))
+    if school_id is not None:
+        q = q.filter(Student.school_id == school_id)
+    if since:
+        stamp, last_id = decode_results_cursor(since)
+        q = q.filter((ExamSession.graded_at > stamp) | ((ExamSession.graded_at == stamp) & (ExamSession.id > last_id)))
+    rows = q.order_by(ExamSession.graded_at, ExamSession.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    iso = lambda d: d.isoformat() if d else None
+    results = [{
+        'session_id': r[0], 'graded_at': iso(r[1]), 'score': r[2], 'start_time': iso(r[3]), 'end_time': iso(r[4]),
+        'exam_id': r[5], 'exam_title': r[6], 'total_marks': r[7], 'class': r[8],
+        'subject': r[9], 'subject_code': r[10], 'student_id': r[11], 'username': r[12],
+        'full_name': r[13], 'student_class': r[14],
+    } for r in rows]
+    next_cursor = encode_results_cursor(rows[-1][1], rows[-1][0]) if rows else since
+    return {'results': results, 'next_cursor': next_cursor, 'has_more': has_more}
+
+
+@app.route('/admin/results/changes')
+def admin_results_changes():
+    """JSON change feed: ?since=<cursor>&limit=N. Omit `since` to start from the beginning."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'Access denied'}, 403
+    school_id = None if session.get('is_superadmin') else _get_effective_school_id()
+    if not session.get('is_superadmin') and not school_id:
+        return {'error': 'No school selected'}, 403
+    try:
+        return result_changes(request.args.get('since') or None, school_id,
+                              request.args.get('limit', type=int) or 500)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+
+@job_handler('regrade_exam')
+def _job_regrade_exam(ctx):
+    """Re-mark every completed session of an exam, e.g. after an answer key was corrected."""
+    exam_id = ctx.params['exam_id']
+    last_id = int(ctx.checkpoint.get('session_id', 0))
+    changed = int(ctx.checkpoint.get('changed', 0))
+    base = ExamSession.query.filter(ExamSession.exam_id == exam_id, ExamSession.status == 'completed')
+    total = base.count()
+    done = base.filter(ExamSession.id <= last_id).count()
+    questions = {}
+    ctx.progress(done, total, message='Regrading')
+    while True:
+        batch = base.filter(ExamSession.id > last_id).order_by(ExamSession.id).limit(REGRADE_CHUNK).all()
+        if not batch:
+            break
+        # load the questions this batch answered that are not cached yet, in one query
+        qids = {qid for (qid,) in db.session.query(Answer.question_id).filter(
+            Answer.exam_session_id.in_([es.id for es in batch])).distinct()} - set(questions)
+        if qids:
+            questions.update({q.id: q for q in Question.query.filter(Question.id.in_(qids))})
+        for es in batch:
+            before = es.score
+            grade_exam_session(es, questions)
+            changed += before != es.score
+        # stamp right before committing so the change feed's lag window covers the transaction
+        now = datetime.utcnow()
+        for es in batch:
+            es.graded_at = now
+        last_id = batch[-1].id
+        done += len(batch)
+        ctx.progress(done, total, message=f'{changed} score(s) changed',
+                     checkpoint={'session_id': last_id, 'changed': changed})
+    ctx.job.message = f'Regraded {done} session(s), {changed} score(s) changed'
+    return {'sessions': done, 'changed': changed}
+
+
+@app.route('/admin/exam/<int:exam_id>/regrade', methods=['POST'])
+def admin_regrade_exam(exam_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
         flash('Access denied', 'danger')
         return redirect(url_for('login'))
-    
-    # Scope results to the effective school for non-superadmins
-    try:
-        if session.get('is_superadmin'):
-            exam_sessions = ExamSession.query.filter_by(status='completed').all()
-        else:
-            cur_sid = _get_effective_school_id()
-            # join with student to filter by student.school_id
-            exam_sessions = ExamSession.query.join(User, ExamSession.student_id == User.id).filter(ExamSession.status=='completed', User.school_id==cur_sid).all()
-    except Exception:
-        exam_sessions = ExamSession.query.filter_by(status='completed').all()
-    subjects = subjects_for_current_user()
-    return render_template('admin/results.html', exam_sessions=exam_sessions, subjects=subjects)
+    exam = Exam.query.get_or_404(exam_id)
+    if not session.get('is_superadmin') and not exam_belongs_to_school(exam.id, _get_effective_school_id()):
+        flash('Access denied', 'danger')
+        return redirect(url_for('admin_exams'))
+    job = enqueue_job('regrade_exam', params={'exam_id': exam.id}, message=f'Waiting to regrade {exam.title}')
+    return _job_started_response(job)
+
+
+@job_handler('export_results')
+def _job_export_results(ctx):
+    """Write a subject's completed results to an .xlsx in the job directory."""
+    subject = Subject.query.get(ctx.params['subject_id'])
+    if not subject:
+        raise ValueError('Subject not found')
+    q = result_export_query(subject.id, ctx.params.get('school_id'))
+    total = q.order_by(None).count()
+    ctx.progress(0, total, message='Writing results')
+    path = os.path.join(ctx.workdir, f"results_{subject.name.replace(' ', '_')}.xlsx")
+    done = write_xlsx_rows(path, f"{subject.name[:28]} Results", RESULT_EXPORT_HEADER, iter_query_rows(q),
+                           progress=lambda n: ctx.progress(n, total))
+    ctx.set_result_file(path)
+    ctx.job.message = f'Exported {done} result(s)'
+    return {'rows': done}
 
 
 @app.route('/admin/results/export_subject', methods=['POST'])
@@ -4357,55 +7224,159 @@ def admin_export_results_by_subject():
         flash('Subject not found', 'danger')
         return redirect(url_for('admin_results'))
 
-    # Gather completed exam sessions for exams in this subject
-    sessions = ExamSession.query.join(Exam, ExamSession.exam_id == Exam.id).filter(Exam.subject_id==subject_id, ExamSession.status=='completed').all()
-
-    # Filter by school ownership for non-superadmins
-    filtered = []
+    school_id = None if session.get('is_superadmin') else _get_effective_school_id()
+    if (request.form.get('format') or request.args.get('format')) == 'csv':
+        # CSV streams straight from the query, so it needs no background job
+        return csv_export_response(f"results_{subject.name.replace(' ', '_')}.csv", RESULT_EXPORT_HEADER,
+                                   iter_query_rows(result_export_query(subject.id, school_id)))
+    job = enqueue_job('export_results', params={
+        'subject_id': subject_id,
+        'school_id': school_id,
+    }, message=f'Waiting to export {subject.name} results')
+    return _job_started_response(job)
+
+
+def _job_for_current_admin(job_id):
+    """Return the job if the current admin may see it (creator, same school, or superadmin)."""
+    job = Job.query.get(job_id)
+    if not job:
+        return None
+    if session.get('is_superadmin') or job.created_by == session.get('user_id'):
+        return job
     cur_sid = _get_effective_school_id()
-    for s in sessions:
-        try:
-            if session.get('is_superadmin'):
-                filtered.append(s)
-            else:
-                # student must belong to current school and exam must belong to school
-                student = User.query.get(s.student_id)
-                if not student or not student.school_id:
-                    continue
-                if int(student.school_id) != int(cur_sid):
-                    continue
-                if not exam_belongs_to_school(s.exam_id, cur_sid):
-                    continue
-                filtered.append(s)
-        except Exception:
-            continue
+    if cur_sid and job.school_id and int(job.school_id) == int(cur_sid):
+        return job
+    return None
 
-    # Build Excel workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"{subject.name[:28]} Results"
-    headers = ['NAME', 'SUBJECT', 'CLASS', 'SCORE', 'EXAM']
-    ws.append(headers)
-    for s in filtered:
-        try:
-            student = User.query.get(s.student_id)
-            exam = Exam.query.get(s.exam_id)
-            name = student.full_name or student.username
-            subj_name = exam.subject.name if exam and exam.subject else subject.name
-            subj_class = exam.subject_class or (exam.subject.subject_class if exam and exam.subject else '')
-            score = s.score if s.score is not None else 0
-            exam_title = exam.title if exam else ''
-            ws.append([name, subj_name, subj_class, score, exam_title])
-        except Exception:
-            continue
 
-    # Save to bytes
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
+@app.route('/admin/jobs')
+def admin_jobs():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    q = Job.query
+    if not session.get('is_superadmin'):
+        cur_sid = _get_effective_school_id()
+        q = q.filter((Job.created_by == session.get('user_id')) | ((Job.school_id == cur_sid) & (Job.school_id.isnot(None))))
+    jobs = q.order_by(Job.id.desc()).limit(50).all()
+    return render_template('admin/jobs.html', jobs=jobs)
+
+
+@app.route('/admin/jobs/<int:job_id>')
+def admin_job(job_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    job = _job_for_current_admin(job_id)
+    if not job:
+        flash('Job not found', 'warning')
+        return redirect(url_for('admin_jobs'))
+    return render_template('admin/job.html', job=job, result=job.result_data())
+
+
+@app.route('/admin/jobs/<int:job_id>/status')
+def admin_job_status(job_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'Access denied'}, 403
+    job = _job_for_current_admin(job_id)
+    if not job:
+        return {'error': 'Job not found'}, 404
+    data = job.to_dict()
+    if job.is_finished and request.args.get('result'):
+        data['result'] = job.result_data()
+    return data
+
+
+@app.route('/admin/jobs/<int:job_id>/stream')
+def admin_job_stream(job_id):
+    """Server-sent events with the job's progress until it finishes (or ~10 minutes pass)."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return {'error': 'Access denied'}, 403
+    if not _job_for_current_admin(job_id):
+        return {'error': 'Job not found'}, 404
+    from flask import stream_with_context
+
+    def events():
+        last = None
+        deadline = time.monotonic() + 600
+        while time.monotonic() < deadline:
+            db.session.expire_all()
+            job = Job.query.get(job_id)
+            if not job:
+                break
+            payload = json.dumps(job.to_dict())
+            if payload != last:
+                last = payload
+                yield f'data: {payload}\n\n'
+            if job.is_finished:
+                break
+            db.session.rollback()  # end the read transaction so the worker's commits become visible
+            time.sleep(1)
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/admin/jobs/<int:job_id>/result')
+def admin_job_result(job_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    job = _job_for_current_admin(job_id)
+    if not job:
+        flash('Job not found', 'warning')
+        return redirect(url_for('admin_jobs'))
+    if job.status != 'completed':
+        return {'error': f'Job is {job.status}'}, 409
+    if job.result_file:
+        if not os.path.exists(job.result_file):
+            return {'error': 'Result file no longer available'}, 410
+        return send_file(os.path.abspath(job.result_file), as_attachment=True,
+                         download_name=os.path.basename(job.result_file))
+    return {'result': job.result_data()}
+
+
+@app.route('/admin/jobs/<int:job_id>/restart', methods=['POST'])
+def admin_job_restart(job_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    job = _job_for_current_admin(job_id)
+    if not job:
+        flash('Job not found', 'warning')
+        return redirect(url_for('admin_jobs'))
+    if job.status not in ('failed', 'cancelled'):
+        flash(f'Only failed or cancelled jobs can be restarted (job is {job.status})', 'warning')
+        return redirect(url_for('admin_job', job_id=job.id))
+    # keep the checkpoint so the handler resumes after the last committed chunk
+    job.status = 'queued'
+    job.cancel_requested = False
+    job.error = None
+    job.message = 'Restarted'
+    db.session.commit()
+    _submit_job(job.id)
+    return _job_started_response(job)
+
+
+@app.route('/admin/jobs/<int:job_id>/cancel', methods=['POST'])
+def admin_job_cancel(job_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    job = _job_for_current_admin(job_id)
+    if not job:
+        flash('Job not found', 'warning')
+        return redirect(url_for('admin_jobs'))
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.finished_at = datetime.utcnow()
+        job.message = 'Cancelled'
+    elif job.status == 'running':
+        # handlers notice the flag at their next progress report
+        job.cancel_requested = True
+        job.message = 'Cancelling…'
+    db.session.commit()
+    return redirect(url_for('admin_job', job_id=job.id))
 
-    filename = f"results_{subject.name.replace(' ', '_')}.xlsx"
-    return send_file(bio, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', as_attachment=True, download_name=filename)
 
 # Student Routes
 @app.route('/student/dashboard')
@@ -4896,7 +7867,8 @@ def get_question(session_id, question_index):
             'text': question.question_text,
             'options': options,
             'selected_answer': answer.selected_answer,
-            'marks': question.marks
+            'marks': question.marks,
+            'image': media_variant_urls(question.question_image)
         }
     }
 
@@ -4952,57 +7924,534 @@ def save_answer(session_id):
     
     return {'status': 'success'}
 
-@app.route('/api/exam/<int:session_id>/submit', methods=['POST'])
-def submit_exam(session_id):
-    if 'user_id' not in session:
-        return {'error': 'Unauthorized'}, 401
-    
-    exam_session = ExamSession.query.get_or_404(session_id)
-    
-    if exam_session.student_id != session['user_id']:
-        return {'error': 'Access denied'}, 403
-    
-    # Recalculate correctness for all answers (in case data changed or normalization needed)
-    answers = Answer.query.filter_by(exam_session_id=session_id).all()
-    total_score = 0
+def answer_is_correct(selected, question):
+    """Compare a stored answer (option letter or option text) with the question's correct option."""
+    sel = '' if selected is None else str(selected).upper().strip()
+    correct_letter = (question.correct_answer or '').upper().strip()
+    opts = {
+        'A': (question.option_a or ''),
+        'B': (question.option_b or ''),
+        'C': (question.option_c or ''),
+        'D': (question.option_d or ''),
+        'E': (question.option_e or '')
+    }
+    if len(sel) == 1 and sel in opts:
+        return sel == correct_letter
+    return sel == (opts.get(correct_letter, '') or '').upper().strip()
 
-    for a in answers:
-        question = Question.query.get(a.question_id)
-        if not question:
-            a.is_correct = False
-            continue
 
-        # Normalize stored selected answer and correct answer
-        sel = '' if a.selected_answer is None else str(a.selected_answer).upper().strip()
-        correct_letter = (question.correct_answer or '').upper().strip()
+# Per-exam score statistics. Grading adds a session's score to the exam's overall, school and
+# class ExamStats rows with atomic SQL increments (safe under a burst of concurrent submits), and a
+# regrade moves it. Reads cost a few rows plus at most EXAM_STATS_BINS histogram bins, whatever the
+# cohort size. An exam's stats are built from its sessions the first time they are read.
+EXAM_STATS_BINS = 100
+EXAM_STATS_PERCENTILES = (25, 50, 75, 90)
 
-        opts = {
-            'A': (question.option_a or ''),
-            'B': (question.option_b or ''),
-            'C': (question.option_c or ''),
-            'D': (question.option_d or ''),
-            'E': (question.option_e or '')
-        }
 
-        is_correct = False
-        if len(sel) == 1 and sel in opts:
-            is_correct = (sel == correct_letter)
-        else:
-            sel_text = sel
-            correct_text = (opts.get(correct_letter, '') or '').upper().strip()
-            is_correct = (sel_text == correct_text)
+def _stats_bin(score, total_marks):
+    if not total_marks:
+        return 0
+    return max(0, min(EXAM_STATS_BINS - 1, int((score or 0) / total_marks * EXAM_STATS_BINS)))
+
+
+def _stats_scopes(school_id, student_class):
+    """(school_id, class) keys a session counts towards: all schools, its school, its class."""
+    school_id = int(school_id or 0)
+    return {(0, ''), (school_id, ''), (school_id, (student_class or '').strip())}
+
+
+def _insert_ignore(table, values):
+    """INSERT that silently does nothing when the row's key already exists."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        db.session.execute(insert(table).values(**values).on_conflict_do_nothing())
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        db.session.execute(insert(table).values(**values).on_conflict_do_nothing())
+    else:
+        from sqlalchemy.exc import IntegrityError
+        try:
+            db.session.execute(table.insert().values(**values))
+        except IntegrityError:
+            pass
+
+
+def _stats_ids(exam_id, scopes):
+    """{(school_id, class): ExamStats.id} for `scopes`, creating missing rows."""
+    def existing():
+        return {(sid, cls): i for i, sid, cls in db.session.query(ExamStats.id, ExamStats.school_id, ExamStats.student_class)
+                .filter(ExamStats.exam_id == exam_id)}
+    ids = existing()
+    missing = set(scopes) - set(ids)
+    for school_id, cls in missing:
+        _insert_ignore(ExamStats.__table__, {'exam_id': exam_id, 'school_id': school_id, 'student_class': cls,
+                                             'count': 0, 'total': 0, 'total_sq': 0})
+    if missing:
+        ids = existing()
+    return {scope: ids[scope] for scope in scopes}
+
+
+def _bump_stats_bin(stats_id, bin_no, delta):
+    t = ExamStatsBin.__table__
+    update = t.update().where(t.c.stats_id == stats_id, t.c.bin == bin_no).values(count=t.c.count + delta)
+    if not db.session.execute(update).rowcount:
+        _insert_ignore(t, {'stats_id': stats_id, 'bin': bin_no, 'count': 0})
+        db.session.execute(update)
+
+
+def _stats_session_query(exam_id):
+    """Score, school and class of every session counted in an exam's stats."""
+    return (db.session.query(func.coalesce(ExamSession.score, 0), User.school_id, User.student_class)
+            .join(User, ExamSession.student_id == User.id)
+            .filter(ExamSession.exam_id == exam_id, ExamSession.status == 'completed',
+                    ExamSession.graded_at.isnot(None)))
+
+
+def _refresh_stats_min_max(stats_id):
+    """Recompute min/max of one scope after its extreme score was regraded away (rare)."""
+    row = db.session.get(ExamStats, stats_id)
+    q = db.session.query(func.min(func.coalesce(ExamSession.score, 0)), func.max(func.coalesce(ExamSession.score, 0))) \
+        .filter(ExamSession.exam_id == row.exam_id, ExamSession.status == 'completed', ExamSession.graded_at.isnot(None))
+    if row.student_class:
+        q = q.filter(ExamSession.stats_school_id == row.school_id, ExamSession.stats_class == row.student_class)
+    elif row.school_id:
+        q = q.filter(ExamSession.stats_school_id == row.school_id)
+    row.min_score, row.max_score = q.one()
+
+
+def record_exam_score(exam_session, new=None, old=None):
+    """Withdraw `old` (the session's previously counted score) from the scopes it was counted
+    under and add `new` to the scopes of the student's current school and class. Exams whose
+    stats were never read are skipped. Does not commit."""
+    exam = exam_session.exam
+    if exam is None or (new is None and old is None):
+        return
+    if not db.session.query(ExamStats.id).filter_by(exam_id=exam.id, school_id=0, student_class='').first():
+        return
+    student = exam_session.student
+    new_scope = (int(getattr(student, 'school_id', None) or 0), (getattr(student, 'student_class', None) or '').strip())
+    old_scope = new_scope
+    if exam_session.stats_class is not None:
+        old_scope = (int(exam_session.stats_school_id or 0), exam_session.stats_class)
+    changes = {}
+    if old is not None:
+        for scope in _stats_scopes(*old_scope):
+            changes.setdefault(scope, {'added': None, 'removed': None})['removed'] = old
+    if new is not None:
+        for scope in _stats_scopes(*new_scope):
+            changes.setdefault(scope, {'added': None, 'removed': None})['added'] = new
+        exam_session.stats_school_id, exam_session.stats_class = new_scope
+    t = ExamStats.__table__
+    ids = _stats_ids(exam.id, set(changes))
+    for scope, change in changes.items():
+        stats_id, added, removed = ids[scope], change['added'], change['removed']
+        values = {'count': t.c.count + (added is not None) - (removed is not None),
+                  'total': t.c.total + (added or 0) - (removed or 0),
+                  'total_sq': t.c.total_sq + (added or 0) ** 2 - (removed or 0) ** 2,
+                  'updated_at': datetime.utcnow()}
+        if added is not None:
+            values['min_score'] = db.case((t.c.min_score.is_(None) | (t.c.min_score > added), added), else_=t.c.min_score)
+            values['max_score'] = db.case((t.c.max_score.is_(None) | (t.c.max_score < added), added), else_=t.c.max_score)
+        db.session.execute(t.update().where(t.c.id == stats_id).values(**values))
+        if removed is not None:
+            _bump_stats_bin(stats_id, _stats_bin(removed, exam.total_marks), -1)
+        if added is not None:
+            _bump_stats_bin(stats_id, _stats_bin(added, exam.total_marks), 1)
+        if removed is not None and removed != added:
+            lo, hi = db.session.query(ExamStats.min_score, ExamStats.max_score).filter(ExamStats.id == stats_id).one()
+            if removed in (lo, hi):
+                _refresh_stats_min_max(stats_id)
+
+
+def rebuild_exam_stats(exam_id):
+    """Recompute every stats scope of an exam from its graded sessions. Does not commit."""
+    exam = db.session.get(Exam, exam_id)
+    if exam is None:
+        return
+    stale = db.session.query(ExamStats.id).filter(ExamStats.exam_id == exam_id)
+    ExamStatsBin.query.filter(ExamStatsBin.stats_id.in_(stale)).delete(synchronize_session=False)
+    ExamStats.query.filter(ExamStats.exam_id == exam_id).delete(synchronize_session=False)
+    agg = {(0, ''): {'count': 0, 'total': 0.0, 'total_sq': 0.0, 'min_score': None, 'max_score': None, 'bins': {}}}
+    for score, school_id, cls in _stats_session_query(exam_id):
+        for scope in _stats_scopes(school_id, cls):
+            a = agg.setdefault(scope, {'count': 0, 'total': 0.0, 'total_sq': 0.0, 'min_score': None,
+                                       'max_score': None, 'bins': {}})
+            a['count'] += 1
+            a['total'] += score
+            a['total_sq'] += score * score
+            a['min_score'] = score if a['min_score'] is None else min(a['min_score'], score)
+            a['max_score'] = score if a['max_score'] is None else max(a['max_score'], score)
+            b = _stats_bin(score, exam.total_marks)
+            a['bins'][b] = a['bins'].get(b, 0) + 1
+    rows = {scope: ExamStats(exam_id=exam_id, school_id=scope[0], student_class=scope[1],
+                             **{k: v for k, v in a.items() if k != 'bins'}) for scope, a in agg.items()}
+    db.session.add_all(rows.values())
+    db.session.flush()
+    bins = [{'stats_id': rows[scope].id, 'bin': b, 'count': n} for scope, a in agg.items() for b, n in a['bins'].items()]
+    if bins:
+        db.session.execute(ExamStatsBin.__table__.insert(), bins)
+    # remember the scope each counted session now sits in
+    es, u = ExamSession.__table__, User.__table__
+    db.session.execute(es.update().where(
+        es.c.exam_id == exam_id, es.c.status == 'completed', es.c.graded_at.isnot(None)).values(
+        stats_school_id=db.select(func.coalesce(u.c.school_id, 0)).where(u.c.id == es.c.student_id).scalar_subquery(),
+        stats_class=db.select(func.trim(func.coalesce(u.c.student_class, ''))).where(u.c.id == es.c.student_id).scalar_subquery()))
+
+
+def exam_stats(exam_id, school_id=0, student_class=''):
+    """Score aggregates of one scope: count, mean, std, min, max, percentiles and the histogram."""
+    def scope_row():
+        return ExamStats.query.filter_by(exam_id=exam_id, school_id=int(school_id or 0),
+                                         student_class=student_class or '').first()
+    row = scope_row()
+    if row is None and not ExamStats.query.filter_by(exam_id=exam_id, school_id=0, student_class='').first():
+        try:
+            rebuild_exam_stats(exam_id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print('Could not build exam stats:', exam_id, e)
+        row = scope_row()
+    exam = db.session.get(Exam, exam_id)
+    total_marks = exam.total_marks if exam else 0
+    histogram = [0] * EXAM_STATS_BINS
+    if row is not None:
+        for b, n in db.session.query(ExamStatsBin.bin, ExamStatsBin.count).filter(ExamStatsBin.stats_id == row.id):
+            histogram[b] = n
+    count = row.count if row is not None else 0
+    stats = {'count': count, 'total_marks': total_marks, 'histogram': histogram,
+             'mean': None, 'std': None, 'min': None, 'max': None}
+    if count:
+        mean = row.total / count
+        stats.update(mean=round(mean, 2), std=round(max(0.0, row.total_sq / count - mean * mean) ** 0.5, 2),
+                     min=row.min_score, max=row.max_score)
+    cumulative = np.cumsum(histogram)
+    for p in EXAM_STATS_PERCENTILES:
+        value = None
+        if count:
+            b = int(np.searchsorted(cumulative, p / 100 * count))
+            # bin midpoint, kept inside the observed range
+            value = round(min(max((b + 0.5) / EXAM_STATS_BINS * total_marks, row.min_score), row.max_score), 1)
+        stats[f'p{p}'] = value
+    return stats
+
+
+def exam_stats_scopes(exam_id, school_id=None):
+    """Per-class (and per-school) stats rows of an exam, for breakdown tables."""
+    q = ExamStats.query.filter(ExamStats.exam_id == exam_id, ExamStats.count > 0)
+    if school_id is not None:
+        q = q.filter(ExamStats.school_id == int(school_id))
+    return [{'school_id': r.school_id, 'student_class': r.student_class, 'count': r.count,
+             'mean': round(r.total / r.count, 2), 'min': r.min_score, 'max': r.max_score}
+            for r in q.order_by(ExamStats.school_id, ExamStats.student_class)]
+
+
+def session_rank(session_id):
+    """(rank, cohort size, scope label) of a graded session among its class (or school) for that
+    exam, read from the histogram: students in the same 1% bin share a rank."""
+    row = (db.session.query(ExamSession.exam_id, ExamSession.score, Exam.total_marks, User.school_id, User.student_class,
+                            ExamSession.stats_school_id, ExamSession.stats_class)
+           .join(Exam, ExamSession.exam_id == Exam.id).join(User, ExamSession.student_id == User.id)
+           .filter(ExamSession.id == session_id, ExamSession.status == 'completed').first())
+    if row is None:
+        return None
+    exam_id, score, total_marks, school_id, cls, counted_school, counted_class = row
+    # the scope the score is counted under; sessions not counted yet are once the stats are built
+    if counted_class is not None:
+        scope = (int(counted_school or 0), counted_class)
+    else:
+        scope = (int(school_id or 0), (cls or '').strip())
+    stats = exam_stats(exam_id, *scope)
+    if not stats['count']:
+        return None
+    stats_id = db.session.query(ExamStats.id).filter_by(exam_id=exam_id, school_id=scope[0], student_class=scope[1]).scalar()
+    above = db.session.query(func.coalesce(func.sum(ExamStatsBin.count), 0)).filter(
+        ExamStatsBin.stats_id == stats_id, ExamStatsBin.bin > _stats_bin(score, total_marks)).scalar()
+    return int(above) + 1, stats['count'], (scope[1] or 'school')
+
+
+@db.event.listens_for(ExamSession, 'after_delete')
+@db.event.listens_for(Exam, 'after_delete')
+def _forget_exam_stats(mapper, connection, target):
+    """A deleted session (or exam) drops the exam's stats; they are rebuilt on next read."""
+    exam_id = target.exam_id if isinstance(target, ExamSession) else target.id
+    stats = ExamStats.__table__
+    ids = db.select(stats.c.id).where(stats.c.exam_id == exam_id)
+    connection.execute(ExamStatsBin.__table__.delete().where(ExamStatsBin.__table__.c.stats_id.in_(ids)))
+    connection.execute(stats.delete().where(stats.c.exam_id == exam_id))
+
+
+# Classical item analysis. An exam's answers are loaded in one query into dense session x item
+# matrices (int8 option codes, bool correctness) and every statistic is computed column-wise.
+# Results are cached per exam version: the number of graded sessions and the latest graded_at,
+# which every submit, regrade and session delete changes.
+ITEM_OPTIONS = 'ABCDE'
+ITEM_NOT_SHOWN, ITEM_BLANK = -1, 0        # option codes; A..E are 1..5
+ITEM_ANALYSIS_GROUP = 0.27                # upper/lower group share for the discrimination index
+ITEM_ANALYSIS_CACHE_SIZE = 32
+_item_analysis_cache = {}
+_item_analysis_lock = threading.Lock()
+
+
+def item_response_matrix(exam_id):
+    """(session_ids, question_ids, codes, correct) of an exam's graded sessions: `codes` is an int8
+    session x item matrix of option codes (-1 where the item was not shown), `correct` a bool one."""
+    rows = db.session.execute(
+        db.select(Answer.exam_session_id, Answer.question_id, Answer.selected_answer, Answer.is_correct)
+        .join(ExamSession, Answer.exam_session_id == ExamSession.id)
+        .filter(ExamSession.exam_id == exam_id, ExamSession.status == 'completed',
+                ExamSession.graded_at.isnot(None))).all()
+    if not rows:
+        empty = np.zeros((0, 0), dtype=np.int8)
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), empty, empty.astype(bool)
+    sids, qids, selected, correct = zip(*rows)
+    session_ids, r = np.unique(np.array(sids, dtype=np.int64), return_inverse=True)
+    question_ids, c = np.unique(np.array(qids, dtype=np.int64), return_inverse=True)
+    lookup = {letter: i + 1 for i, letter in enumerate(ITEM_OPTIONS)}
+    lookup.update({letter.lower(): i + 1 for i, letter in enumerate(ITEM_OPTIONS)})
+    codes = np.full((len(session_ids), len(question_ids)), ITEM_NOT_SHOWN, dtype=np.int8)
+    codes[r, c] = np.fromiter((lookup.get(x, ITEM_BLANK) for x in selected), dtype=np.int8, count=len(rows))
+    marked = np.zeros(codes.shape, dtype=bool)
+    marked[r, c] = np.fromiter((bool(x) for x in correct), dtype=bool, count=len(rows))
+    return session_ids, question_ids, codes, marked
+
+
+def analyse_items(codes, correct):
+    """Per-item difficulty, discrimination, point-biserial and option counts, plus KR-20, from the
+    matrices of item_response_matrix. Items a student was not shown are left out of that item's
+    statistics; totals are the number of items answered correctly."""
+    n_students, n_items = codes.shape
+    shown = codes != ITEM_NOT_SHOWN
+    right = correct & shown
+    x = right.sum(axis=1, dtype=np.float64)                  # student totals
+    n = shown.sum(axis=0, dtype=np.float64)
+    safe_n = np.where(n > 0, n, 1)
+    p = right.sum(axis=0, dtype=np.float64) / safe_n          # difficulty (share correct)
+
+    # point-biserial: Pearson correlation of item score with total, over students shown the item
+    shown_f = shown.astype(np.float32)
+    right_f = right.astype(np.float32)
+    sum_x = x @ shown_f
+    sum_xx = (x * x) @ shown_f
+    sum_xy = x @ right_f
+    mean_x = sum_x / safe_n
+    var_x = np.maximum(sum_xx / safe_n - mean_x * mean_x, 0)
+    cov = sum_xy / safe_n - p * mean_x
+    denom = np.sqrt(var_x * p * (1 - p))
+    r_pb = np.divide(cov, denom, out=np.zeros(n_items), where=denom > 0)
+
+    # discrimination: difficulty in the top group minus the bottom group (by total score)
+    order = np.argsort(x, kind='stable')
+    g = max(1, int(round(n_students * ITEM_ANALYSIS_GROUP))) if n_students else 0
+    def group_p(idx):
+        gn = shown[idx].sum(axis=0)
+        return np.divide(right[idx].sum(axis=0), gn, out=np.zeros(n_items), where=gn > 0)
+    disc = group_p(order[-g:]) - group_p(order[:g]) if g else np.zeros(n_items)
+
+    # option counts per item: column k holds code k-1 (not shown, blank, A..E)
+    width = len(ITEM_OPTIONS) + 2
+    flat = (codes.astype(np.int64) + 1) + np.arange(n_items, dtype=np.int64) * width
+    options = np.bincount(flat.ravel(), minlength=n_items * width).reshape(n_items, width)
+
+    k = n_items
+    var_total = x.var() if n_students else 0.0
+    kr20 = None
+    if k > 1 and var_total > 0:
+        kr20 = float(k / (k - 1) * (1 - (p * (1 - p)).sum() / var_total))
+    return {'n': n.astype(np.int64), 'difficulty': p, 'discrimination': disc, 'point_biserial': r_pb,
+            'options': options, 'kr20': kr20, 'mean': float(x.mean()) if n_students else None,
+            'std': float(np.sqrt(var_total)) if n_students else None}
+
+
+def _item_analysis_version(exam_id):
+    count, latest = db.session.query(func.count(ExamSession.id), func.max(ExamSession.graded_at)).filter(
+        ExamSession.exam_id == exam_id, ExamSession.status == 'completed', ExamSession.graded_at.isnot(None)).one()
+    return count, latest.isoformat() if latest else None
+
+
+def item_flags(difficulty, discrimination, point_biserial):
+    """Review hints for one item."""
+    flags = []
+    if difficulty < 0.2:
+        flags.append('very hard')
+    elif difficulty > 0.9:
+        flags.append('very easy')
+    if point_biserial < 0:
+        flags.append('negative correlation')
+    elif discrimination < 0.2:
+        flags.append('weak discrimination')
+    return flags
+
+
+def exam_item_analysis(exam_id):
+    """Item analysis report of an exam, cached until its graded sessions change."""
+    version = _item_analysis_version(exam_id)
+    with _item_analysis_lock:
+        cached = _item_analysis_cache.get(exam_id)
+    if cached and cached['version'] == version:
+        return cached
+    started = time.perf_counter()
+    session_ids, question_ids, codes, correct = item_response_matrix(exam_id)
+    stats = analyse_items(codes, correct)
+    questions = {q.id: q for q in Question.query.filter(Question.id.in_(question_ids.tolist()))} if len(question_ids) else {}
+    items = []
+    for j, qid in enumerate(question_ids.tolist()):
+        q = questions.get(qid)
+        counts = stats['options'][j]
+        difficulty, discrimination, r_pb = (round(float(stats[k][j]), 3) for k in ('difficulty', 'discrimination', 'point_biserial'))
+        items.append({
+            'question_id': qid,
+            'question_text': (q.question_text if q else '(deleted question)')[:120],
+            'correct_answer': (q.correct_answer or '').upper() if q else '',
+            'shown': int(stats['n'][j]),
+            'difficulty': difficulty,
+            'discrimination': discrimination,
+            'point_biserial': r_pb,
+            'blank': int(counts[1]),
+            'options': {letter: int(counts[i + 2]) for i, letter in enumerate(ITEM_OPTIONS)},
+            'flags': item_flags(difficulty, discrimination, r_pb),
+        })
+    report = {'version': version, 'students': len(session_ids), 'items': items,
+              'kr20': round(stats['kr20'], 3) if stats['kr20'] is not None else None,
+              'mean': round(stats['mean'], 2) if stats['mean'] is not None else None,
+              'std': round(stats['std'], 2) if stats['std'] is not None else None,
+              'seconds': round(time.perf_counter() - started, 3)}
+    with _item_analysis_lock:
+        _item_analysis_cache.pop(exam_id, None)
+        while len(_item_analysis_cache) >= ITEM_ANALYSIS_CACHE_SIZE:
+            _item_analysis_cache.pop(next(iter(_item_analysis_cache)))
+        _item_analysis_cache[exam_id] = report
+    return report
+
+
+def format_time_used(start, end):
+    if not start:
+        return 'N/A'
+    seconds = int(((end or datetime.utcnow()) - start).total_seconds())
+    minutes, secs = divmod(seconds, 60)
+    return f"{minutes} min {secs} sec" if minutes > 0 else f"{secs} sec"
+
+
+def build_script_snapshot(exam_session, answers=None, questions=None):
+    """The dict a graded-script snapshot stores; `answers` and `questions` ({id: Question})
+    are reused when the caller already loaded them."""
+    if answers is None:
+        answers = Answer.query.filter_by(exam_session_id=exam_session.id).order_by(Answer.id).all()
+    if questions is None:
+        qids = {a.question_id for a in answers}
+        questions = {q.id: q for q in Question.query.filter(Question.id.in_(qids))} if qids else {}
+    exam, student = exam_session.exam, exam_session.student
+    total_marks = exam.total_marks if exam else 0
+    items = []
+    for a in sorted(answers, key=lambda a: a.id or 0):
+        q = questions.get(a.question_id)
+        items.append({
+            'question_id': a.question_id,
+            'question_text': q.question_text if q else '(question deleted)',
+            'options': {k.upper(): v for k in 'abcde' if (v := getattr(q, 'option_' + k, None))} if q else {},
+            'correct_answer': q.correct_answer if q else '',
+            'is_theory': bool(q.is_theory) if q else False,
+            'marks': (q.marks or 1) if q else 1,
+            'selected_answer': a.selected_answer,
+            'is_correct': bool(a.is_correct),
+        })
+    percent = score_percent(exam_session.score, total_marks)
+    return {
+        'session_id': exam_session.id,
+        'exam': {'title': exam.title if exam else '', 'code': exam.code if exam else None,
+                 'subject': exam.subject.name if exam and exam.subject else '',
+                 'duration': exam.duration if exam else None, 'total_marks': total_marks},
+        'student': {'id': exam_session.student_id, 'username': student.username if student else '',
+                    'full_name': student.full_name if student else ''},
+        'score': exam_session.score,
+        'percent': percent,
+        'band_colour': result_band(percent)[1],
+        'start_time': exam_session.start_time.isoformat() if exam_session.start_time else None,
+        'end_time': exam_session.end_time.isoformat() if exam_session.end_time else None,
+        'time_used': format_time_used(exam_session.start_time, exam_session.end_time),
+        'items': items,
+    }
+
+
+def store_script_snapshot(exam_session, answers=None, questions=None):
+    """(Re)write the session's snapshot; the caller commits."""
+    import zlib
+    data = zlib.compress(json.dumps(build_script_snapshot(exam_session, answers, questions),
+                                    separators=(',', ':')).encode('utf-8'))
+    if exam_session.script is None:
+        exam_session.script = ScriptSnapshot(student_id=exam_session.student_id, data=data)
+    else:
+        exam_session.script.data = data
+        exam_session.script.created_at = datetime.utcnow()
+    return exam_session.script
+
+
+def load_script(session_id):
+    """Snapshot dict of a session from one row, or None when it has no snapshot. Sessions graded
+    before snapshots existed get one written on first view; unfinished ones are built, not stored."""
+    snap = db.session.get(ScriptSnapshot, session_id)
+    if snap is not None:
+        return snap.script
+    exam_session = db.session.get(ExamSession, session_id)
+    if exam_session is None:
+        return None
+    if exam_session.status != 'completed':
+        return build_script_snapshot(exam_session)
+    try:
+        snap = store_script_snapshot(exam_session)
+        db.session.commit()
+        return snap.script
+    except Exception:
+        db.session.rollback()
+        return build_script_snapshot(exam_session)
+
+
+def grade_exam_session(exam_session, questions=None):
+    """Re-mark every answer of `exam_session`, set its score and stamp graded_at, then rebuild
+    its script snapshot and move its score in the exam stats. Does not commit.
 
-        a.is_correct = bool(is_correct)
+    `questions` ({id: Question}) may be passed when grading many sessions of one exam. Returns the score.
+    """
+    answers = Answer.query.filter_by(exam_session_id=exam_session.id).order_by(Answer.id).all()
+    if questions is None:
+        qids = {a.question_id for a in answers}
+        questions = {q.id: q for q in Question.query.filter(Question.id.in_(qids))} if qids else {}
+    # the score this session already contributes to the exam stats, if it was graded before
+    counted = (exam_session.score or 0) if exam_session.graded_at is not None else None
+    total_score = 0
+    for a in answers:
+        question = questions.get(a.question_id)
+        if not question:
+            a.is_correct = False
+            continue
+        a.is_correct = bool(answer_is_correct(a.selected_answer, question))
         if a.is_correct:
             try:
                 total_score += int(question.marks or 1)
             except Exception:
                 total_score += 1
+    exam_session.score = total_score
+    exam_session.graded_at = datetime.utcnow()
+    store_script_snapshot(exam_session, answers, questions)
+    record_exam_score(exam_session, new=total_score, old=counted)
+    return total_score
+
 
-    # Update exam session
+@app.route('/api/exam/<int:session_id>/submit', methods=['POST'])
+def submit_exam(session_id):
+    if 'user_id' not in session:
+        return {'error': 'Unauthorized'}, 401
+    
+    exam_session = ExamSession.query.get_or_404(session_id)
+    
+    if exam_session.student_id != session['user_id']:
+        return {'error': 'Access denied'}, 403
+    
+    # Recalculate correctness for all answers (in case data changed or normalization needed)
     exam_session.end_time = datetime.utcnow()
-    exam_session.score = total_score
     exam_session.status = 'completed'
+    total_score = grade_exam_session(exam_session)
 
     db.session.commit()
 
@@ -5037,185 +8486,481 @@ def student_results():
     
     return render_template('student/results.html', exam_sessions=exam_sessions)
 
+def _student_script_or_none(session_id):
+    """The logged-in student's own graded script, or None."""
+    script = load_script(session_id)
+    if script is None or script['student']['id'] != session['user_id']:
+        return None
+    return script
+
+
 @app.route('/student/result/<int:session_id>')
 def view_result(session_id):
     if 'user_id' not in session or session['role'] != 'student':
         flash('Access denied', 'danger')
         return redirect(url_for('login'))
     
-    exam_session = ExamSession.query.get_or_404(session_id)
-    
-    if exam_session.student_id != session['user_id']:
+    script = _student_script_or_none(session_id)
+    if script is None:
         flash('Access denied', 'danger')
         return redirect(url_for('student_dashboard'))
-    
-    answers = Answer.query.filter_by(exam_session_id=session_id).all()
-    questions = []
-
-    for answer in answers:
-        question = Question.query.get(answer.question_id)
-        questions.append({
-            'question': question,
-            'selected_answer': answer.selected_answer,
-            'is_correct': answer.is_correct
-        })
-
-    # Compute time used: prefer end_time - start_time, otherwise now - start_time
-    time_used_str = 'N/A'
+    return render_template('student/result_detail.html', script=script, rank=session_rank(session_id))
+
+
+# Result PDFs are rendered once per snapshot version in the CPU pool and cached on disk as
+# PRIVATE_FOLDER/result_pdfs/<session>/<version>.pdf; a regrade changes the snapshot and so the version.
+RESULT_PDF_SUBDIR = 'result_pdfs'
+# how long a download request waits for a fresh render before answering "preparing"
+RESULT_PDF_WAIT_SECONDS = float(os.environ.get('RESULT_PDF_WAIT_SECONDS', '3'))
+RESULT_PDF_OPTIONS = {
+    'margin-top': '0mm',
+    'margin-bottom': '0mm',
+    # Use a slight negative left margin to increase usable width on the page
+    'margin-left': '-0.25in',
+    'margin-right': '0in',
+    'encoding': 'UTF-8'
+}
+_result_pdfs_pending = {}
+_result_pdfs_failed = set()
+_result_pdfs_lock = threading.Lock()
+
+
+def _wkhtmltopdf_binary():
     try:
-        if exam_session.start_time:
-            end = exam_session.end_time or datetime.utcnow()
-            delta = end - exam_session.start_time
-            seconds = int(delta.total_seconds())
-            minutes = seconds // 60
-            secs = seconds % 60
-            if minutes > 0:
-                time_used_str = f"{minutes} min {secs} sec"
-            else:
-                time_used_str = f"{secs} sec"
+        import shutil
+        # Allow explicit override via environment variable WKHTMLTOPDF_BIN
+        wk = os.getenv('WKHTMLTOPDF_BIN') or shutil.which('wkhtmltopdf')
+        return str(wk) if wk else None
     except Exception:
-        time_used_str = 'N/A'
+        return None
+
+
+def script_pdf_bytes(html, script, wkhtmltopdf=None):
+    """PDF of a graded script: wkhtmltopdf on the rendered page when available, otherwise a plain
+    ReportLab listing drawn from the snapshot. Raises when neither backend is installed."""
+    if pdfkit and wkhtmltopdf:
+        try:
+            config = None
+            try:
+                from pdfkit import configuration
+                config = configuration(wkhtmltopdf=wkhtmltopdf)
+            except Exception:
+                config = None
+            return pdfkit.from_string(html, False, options=RESULT_PDF_OPTIONS, configuration=config)
+        except Exception as e:
+            print(f"PDF generation failed: {e}")
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    bio = BytesIO()
+    c = canvas.Canvas(bio, pagesize=letter)
+    width, height = letter
+    margin = 40
+    y = height - margin
+    # Header
+    student_name = script['student']['full_name'] or script['student']['username'] or 'Student'
+    c.setFont('Helvetica-Bold', 14)
+    c.drawString(margin, y, f'Result for: {student_name} (Session {script["session_id"]})')
+    y -= 24
+    c.setFont('Helvetica', 10)
+    c.drawString(margin, y, f'Exam: {script["exam"]["title"] or "-"}    Score: {script["score"] or 0}')
+    y -= 18
+    c.drawString(margin, y, f'Time used: {script["time_used"]}')
+    y -= 24
+
+    # Questions list (truncate long texts)
+    for idx, q in enumerate(script['items'], start=1):
+        qtext = q['question_text'][:300] + '...' if len(q['question_text']) > 300 else q['question_text']
+        sel = q.get('selected_answer') or ''
+        corr = 'Yes' if q.get('is_correct') else 'No'
+        line = f"{idx}. {qtext} -- Selected: {sel} -- Correct: {corr}"
+        # Wrap lines if necessary
+        max_chars = 100
+        parts = [line[i:i+max_chars] for i in range(0, len(line), max_chars)]
+        for p in parts:
+            if y < margin + 40:
+                c.showPage()
+                y = height - margin
+                c.setFont('Helvetica', 10)
+            c.drawString(margin, y, p)
+            y -= 14
+
+    c.showPage()
+    c.save()
+    return bio.getvalue()
+
+
+def render_script_pdf(html, script, target, wkhtmltopdf=None):
+    """Worker: write the script's PDF to `target` atomically and drop older versions beside it.
+    Runs in the CPU process pool, so it only touches the filesystem."""
+    data = script_pdf_bytes(html, script, wkhtmltopdf)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f'{target}.{os.getpid()}.part'
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, target)
+    for name in os.listdir(os.path.dirname(target)):
+        if name.endswith('.pdf') and os.path.join(os.path.dirname(target), name) != target:
+            try:
+                os.remove(os.path.join(os.path.dirname(target), name))
+            except OSError:
+                pass
+    return target
+
+
+def script_version(script):
+    import hashlib
+    return hashlib.sha1(json.dumps(script, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def result_pdf_path(script):
+    return os.path.abspath(os.path.join(app.config['PRIVATE_FOLDER'], RESULT_PDF_SUBDIR,
+                                        str(script['session_id']), script_version(script) + '.pdf'))
+
+
+def schedule_result_pdf(script, html):
+    """Queue a render of the script's PDF (once per version). Returns the pending future, or
+    None when it finished inline or cannot be rendered (see `_result_pdfs_failed`)."""
+    target = result_pdf_path(script)
+    with _result_pdfs_lock:
+        if target in _result_pdfs_failed:
+            return None
+        fut = _result_pdfs_pending.get(target)
+        if fut is not None:
+            return fut
+    wk = _wkhtmltopdf_binary()
+    if app.config.get('JOBS_INLINE'):
+        try:
+            render_script_pdf(html, script, target, wk)
+        except Exception as e:
+            print('Result PDF rendering failed:', target, e)
+            with _result_pdfs_lock:
+                _result_pdfs_failed.add(target)
+        return None
 
-    return render_template('student/result_detail.html', 
-                         exam_session=exam_session, 
-                         questions=questions,
-                         time_used=time_used_str)
+    def _done(f):
+        with _result_pdfs_lock:
+            _result_pdfs_pending.pop(target, None)
+            if f.exception() is not None:
+                print('Result PDF rendering failed:', target, f.exception())
+                _result_pdfs_failed.add(target)
+
+    try:
+        fut = _get_cpu_pool().submit(render_script_pdf, html, script, target, wk)
+    except Exception as e:
+        print('Could not queue result PDF:', target, e)
+        _reset_cpu_pool()
+        return None
+    with _result_pdfs_lock:
+        _result_pdfs_pending[target] = fut
+    fut.add_done_callback(_done)
+    return fut
 
 
 @app.route('/student/result/<int:session_id>/pdf')
 def result_pdf(session_id):
-    # Generate a printable PDF of the marked script (fallback to HTML)
+    # Serve the cached PDF of the marked script; render it in the background on first request
     if 'user_id' not in session or session['role'] != 'student':
         flash('Access denied', 'danger')
         return redirect(url_for('login'))
 
-    exam_session = ExamSession.query.get_or_404(session_id)
-    if exam_session.student_id != session['user_id']:
+    script = _student_script_or_none(session_id)
+    if script is None:
         flash('Access denied', 'danger')
         return redirect(url_for('student_dashboard'))
 
-    answers = Answer.query.filter_by(exam_session_id=session_id).all()
-    questions = []
-    for answer in answers:
-        question = Question.query.get(answer.question_id)
-        questions.append({
-            'question': question,
-            'selected_answer': answer.selected_answer,
-            'is_correct': answer.is_correct
-        })
-
-    # Compute time used for PDF as well
-    time_used_str = 'N/A'
-    try:
-        if exam_session.start_time:
-            end = exam_session.end_time or datetime.utcnow()
-            delta = end - exam_session.start_time
-            seconds = int(delta.total_seconds())
-            minutes = seconds // 60
-            secs = seconds % 60
-            if minutes > 0:
-                time_used_str = f"{minutes} min {secs} sec"
-            else:
-                time_used_str = f"{secs} sec"
-    except Exception:
-        time_used_str = 'N/A'
-
-    # Render HTML for the result (pass pdf_mode to hide buttons)
-    rendered = render_template('student/result_detail.html', exam_session=exam_session, questions=questions, pdf_mode=True, time_used=time_used_str)
-
-    # If pdfkit/wkhtmltopdf is available, convert to PDF
-    # Try to generate PDF if pdfkit is available and wkhtmltopdf binary exists
-    try:
-        import shutil
-        # Allow explicit override via environment variable WKHTMLTOPDF_BIN
-        wk = os.getenv('WKHTMLTOPDF_BIN') or shutil.which('wkhtmltopdf')
-        if wk:
-            wk = str(wk)
-    except Exception:
-        wk = None
-
-    if pdfkit and wk:
-        try:
-            config = None
+    target = result_pdf_path(script)
+    if not os.path.isfile(target):
+        # Render HTML for the result (pass pdf_mode to hide buttons)
+        rendered = render_template('student/result_detail.html', script=script, pdf_mode=True)
+        fut = schedule_result_pdf(script, rendered)
+        if fut is not None:
             try:
-                from pdfkit import configuration
-                config = configuration(wkhtmltopdf=wk)
+                fut.result(timeout=RESULT_PDF_WAIT_SECONDS)
             except Exception:
-                config = None
-
-            # Attempt to create PDF bytes with zero margins for printing
-            options = {
-                'margin-top': '0mm',
-                'margin-bottom': '0mm',
-                # Use a slight negative left margin to increase usable width on the page
-                'margin-left': '-0.25in',
-                'margin-right': '0in',
-                'encoding': 'UTF-8'
-            }
-            pdf_bytes = pdfkit.from_string(rendered, False, options=options, configuration=config)
-            return Response(pdf_bytes, mimetype='application/pdf', headers={
-                'Content-Disposition': f'attachment; filename=result_{session_id}.pdf'
-            })
-        except Exception as e:
-            # Fall back to returning HTML but warn user
-            print(f"PDF generation failed: {e}")
-            flash('PDF generation failed on server; returning printable HTML.', 'warning')
+                pass
+        if not os.path.isfile(target):
+            with _result_pdfs_lock:
+                failed = target in _result_pdfs_failed
+            if not failed:
+                return render_template('student/result_preparing.html', session_id=session_id), 202, {'Retry-After': '2'}
+            flash('PDF generation not available on server; download/print the HTML page.', 'warning')
             return Response(rendered, mimetype='text/html', headers={
                 'Content-Disposition': f'attachment; filename=result_{session_id}.html'
             })
-    # Attempt to generate a simple PDF using ReportLab as a pure-Python fallback
-    try:
-        from reportlab.lib.pagesizes import letter
-        from reportlab.pdfgen import canvas
-        bio = BytesIO()
-        c = canvas.Canvas(bio, pagesize=letter)
-        width, height = letter
-        margin = 40
-        y = height - margin
-        # Header
+    return send_file(target, mimetype='application/pdf', as_attachment=True,
+                     download_name=f'result_{session_id}.pdf')
+
+# Scripts in flight per CPU worker while batch printing; enough to keep the pool busy while
+# bounding how many rendered PDFs wait to be packed
+PRINT_SCRIPTS_INFLIGHT_PER_WORKER = 2
+# pypdf's PdfWriter holds every appended page until it writes the file, so one merged PDF is
+# limited to this many scripts; larger exams are packed as a ZIP, which is written as it goes
+PRINT_SCRIPTS_MERGE_MAX = int(os.environ.get('PRINT_SCRIPTS_MERGE_MAX', '300'))
+
+
+def _print_script_name(username, full_name, used):
+    name = secure_filename(f"{full_name or ''}_{username}".strip('_')) or 'script'
+    candidate, n = name, 1
+    while candidate in used:
+        n += 1
+        candidate = f'{name}_{n}'
+    used.add(candidate)
+    return candidate + '.pdf'
+
+
+@job_handler('print_exam_scripts')
+def _job_print_exam_scripts(ctx):
+    """Render every completed script of an exam to PDF across the CPU pool and pack them, in
+    student order, into one ZIP written entry by entry as renders finish, or into one merged
+    PDF, which is held in memory until the last script is appended (see PRINT_SCRIPTS_MERGE_MAX).
+
+    Renders go through the result PDF cache, so scripts printed before are not redrawn and
+    students downloading their own PDF afterwards get the cached file.
+    """
+    import zipfile
+    from collections import deque
+    exam = Exam.query.get(ctx.params['exam_id'])
+    if not exam:
+        raise ValueError('Exam not found')
+    merged = ctx.params.get('format') == 'pdf' and PdfWriter is not None
+    rows = (db.session.query(ExamSession.id, User.username, User.full_name)
+            .join(User, ExamSession.student_id == User.id)
+            .filter(ExamSession.exam_id == exam.id, ExamSession.status == 'completed')
+            .order_by(User.full_name, User.username, ExamSession.id).all())
+    total = len(rows)
+    merged = merged and total <= PRINT_SCRIPTS_MERGE_MAX
+    ctx.progress(0, total, message='Rendering scripts')
+    wk = _wkhtmltopdf_binary()
+    window = (os.cpu_count() or 1) * PRINT_SCRIPTS_INFLIGHT_PER_WORKER
+    base = secure_filename(f'scripts_{exam.title}') or f'scripts_{exam.id}'
+    path = os.path.join(ctx.workdir, base + ('.pdf' if merged else '.zip'))
+
+    def submit(row):
+        script = load_script(row.id)
+        target = result_pdf_path(script)
+        if os.path.isfile(target):
+            return row, script, None, None, target
+        html = None
+        if wk:
+            with app.test_request_context():
+                html = render_template('student/result_detail.html', script=script, pdf_mode=True)
         try:
-            student = User.query.get(exam_session.student_id)
-            student_name = student.full_name or student.username
-        except Exception:
-            student_name = 'Student'
-        c.setFont('Helvetica-Bold', 14)
-        c.drawString(margin, y, f'Result for: {student_name} (Session {session_id})')
-        y -= 24
-        c.setFont('Helvetica', 10)
-        c.drawString(margin, y, f'Exam: {exam_session.exam.title if exam_session.exam else "-"}    Score: {exam_session.score or 0}')
-        y -= 18
-        c.drawString(margin, y, f'Time used: {time_used_str}')
-        y -= 24
-
-        # Questions list (truncate long texts)
-        for idx, q in enumerate(questions, start=1):
-            qtext = (q['question'].question_text[:300] + '...') if q['question'] and getattr(q['question'], 'question_text', None) and len(q['question'].question_text) > 300 else (q['question'].question_text if q['question'] else '')
-            sel = q.get('selected_answer') or ''
-            corr = 'Yes' if q.get('is_correct') else 'No'
-            line = f"{idx}. {qtext} -- Selected: {sel} -- Correct: {corr}"
-            # Wrap lines if necessary
-            max_chars = 100
-            parts = [line[i:i+max_chars] for i in range(0, len(line), max_chars)]
-            for p in parts:
-                if y < margin + 40:
-                    c.showPage()
-                    y = height - margin
-                    c.setFont('Helvetica', 10)
-                c.drawString(margin, y, p)
-                y -= 14
-
-        c.showPage()
-        c.save()
-        bio.seek(0)
-        return Response(bio.read(), mimetype='application/pdf', headers={
-            'Content-Disposition': f'attachment; filename=result_{session_id}.pdf'
-        })
-    except Exception as e:
-        print('ReportLab PDF generation failed:', e)
-        flash('PDF generation not available on server; download/print the HTML page.', 'warning')
-        return Response(rendered, mimetype='text/html', headers={
-            'Content-Disposition': f'attachment; filename=result_{session_id}.html'
-        })
+            fut = _get_cpu_pool().submit(render_script_pdf, html, script, target, wk)
+        except Exception as e:
+            print('Could not queue script PDF, rendering inline:', row.id, e)
+            _reset_cpu_pool()
+            fut = None
+        return row, script, html, fut, target
+
+    problems = []
+    used = set()
+    done = 0
+    pending = deque()
+    todo = iter(rows)
+    writer = PdfWriter() if merged else None
+    zf = None if merged else zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+    try:
+        while True:
+            while len(pending) < window:
+                row = next(todo, None)
+                if row is None:
+                    break
+                pending.append(submit(row))
+            if not pending:
+                break
+            row, script, html, fut, target = pending.popleft()
+            try:
+                if fut is not None:
+                    fut.result()
+                elif not os.path.isfile(target):
+                    render_script_pdf(html, script, target, wk)
+                if merged:
+                    writer.append(target)
+                else:
+                    zf.write(target, _print_script_name(row.username, row.full_name, used))
+            except JobCancelled:
+                raise
+            except Exception as e:
+                problems.append({'row': row.id, 'username': row.username, 'reason': str(e)[:300]})
+            done += 1
+            ctx.progress(done, total, message=f'Rendered {done} of {total} script(s)')
+    finally:
+        for item in pending:
+            if item[3] is not None:
+                item[3].cancel()
+        if zf is not None:
+            zf.close()
+    if merged:
+        with open(path, 'wb') as fh:
+            writer.write(fh)
+    ctx.set_result_file(path)
+    ctx.job.message = f'{done - len(problems)} script(s) ready' + (f', {len(problems)} failed' if problems else '')
+    return {'scripts': done - len(problems), 'problems': problems[:1000]}
+
+
+@app.route('/admin/exam/<int:exam_id>/print_scripts', methods=['POST'])
+def admin_print_exam_scripts(exam_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    exam = Exam.query.get_or_404(exam_id)
+    if not session.get('is_superadmin') and not exam_belongs_to_school(exam.id, _get_effective_school_id()):
+        flash('Access denied', 'danger')
+        return redirect(url_for('admin_exams'))
+    fmt = 'pdf' if request.form.get('format') == 'pdf' else 'zip'
+    if fmt == 'pdf' and PdfWriter is None:
+        flash('Merged PDFs need the pypdf package; preparing a ZIP of PDFs instead', 'warning')
+        fmt = 'zip'
+    total = ExamSession.query.filter_by(exam_id=exam.id, status='completed').count()
+    if fmt == 'pdf' and total > PRINT_SCRIPTS_MERGE_MAX:
+        flash(f'A merged PDF is limited to {PRINT_SCRIPTS_MERGE_MAX} scripts; preparing a ZIP of PDFs instead', 'warning')
+        fmt = 'zip'
+    if not total:
+        flash('No completed scripts to print for this exam', 'info')
+        return redirect(url_for('admin_view_exam', exam_id=exam.id))
+    job = enqueue_job('print_exam_scripts', params={'exam_id': exam.id, 'format': fmt}, total=total,
+                      message=f'Waiting to print {total} script(s)')
+    return _job_started_response(job)
+
+
+
+# Answer-copying screen. Two scripts sharing a wrong option on an item is evidence of copying in
+# proportion to how unpopular that wrong option is. Each script's wrong answers are one-hot
+# encoded (item x option columns), so one matrix product counts identical wrong answers for
+# every pair; the pairs are walked in COLLUSION_TILE x COLLUSION_TILE tiles to bound memory.
+COLLUSION_TILE = 512
+# fewest identical wrong answers worth reporting, however unlikely
+COLLUSION_MIN_MATCHES = 5
+# family-wise false alarm rate across all pairs of an exam (Bonferroni)
+COLLUSION_ALPHA = 0.001
+COLLUSION_REPORT_LIMIT = 500
+COLLUSION_EXPORT_HEADER = ['Session A', 'Username A', 'Name A', 'Session B', 'Username B', 'Name B',
+                           'Identical wrong', 'Both wrong', 'Expected', 'z', 'Recordings A', 'Recordings B']
+
+
+def collusion_pairs(codes, correct, tile=COLLUSION_TILE, alpha=COLLUSION_ALPHA,
+                    min_matches=COLLUSION_MIN_MATCHES, progress=None):
+    """Pairs of rows of the item_response_matrix matrices with improbably many identical wrong
+    answers, most suspicious first.
+
+    For items both students got wrong, the chance of picking the same wrong option is taken from
+    the cohort's wrong-answer spread, and the count of matches is compared with its expectation
+    by a normal approximation. `progress(rows_done)` is called after each tile row.
+    """
+    from statistics import NormalDist
+    n, items = codes.shape
+    if n < 2 or not items:
+        return []
+    width = len(ITEM_OPTIONS)
+    wrong = (codes > ITEM_BLANK) & ~correct
+    onehot = np.zeros((n, items * width), dtype=np.float32)
+    r, c = np.nonzero(wrong)
+    onehot[r, c * width + codes[r, c].astype(np.int64) - 1] = 1
+    chosen = onehot.sum(axis=0, dtype=np.float64).reshape(items, width)
+    spread = chosen.sum(axis=1)
+    same = np.divide((chosen * chosen).sum(axis=1), spread * spread, out=np.zeros(items), where=spread > 0)
+    wrong_f = wrong.astype(np.float32)
+    wrong_same = wrong_f * same.astype(np.float32)
+    wrong_var = wrong_f * (same * (1 - same)).astype(np.float32)
+    z_crit = NormalDist().inv_cdf(1 - alpha / (n * (n - 1) / 2))
+
+    pairs = []
+    for a0 in range(0, n, tile):
+        a1 = min(n, a0 + tile)
+        for b0 in range(a0, n, tile):
+            b1 = min(n, b0 + tile)
+            matches = onehot[a0:a1] @ onehot[b0:b1].T
+            candidate = matches >= min_matches
+            if a0 == b0:
+                candidate &= np.triu(np.ones(candidate.shape, dtype=bool), k=1)
+            if not candidate.any():
+                continue
+            expected = wrong_same[a0:a1] @ wrong_f[b0:b1].T
+            var = wrong_var[a0:a1] @ wrong_f[b0:b1].T
+            z = np.divide(matches - expected, np.sqrt(var), out=np.zeros(matches.shape, dtype=np.float32), where=var > 0)
+            flagged = candidate & (z > z_crit)
+            both = None
+            for i, j in zip(*np.nonzero(flagged)):
+                if both is None:
+                    both = wrong_f[a0:a1] @ wrong_f[b0:b1].T
+                pairs.append({'a': a0 + int(i), 'b': b0 + int(j), 'matches': int(matches[i, j]),
+                              'both_wrong': int(both[i, j]), 'expected': round(float(expected[i, j]), 2),
+                              'z': round(float(z[i, j]), 2)})
+        if progress:
+            progress(a1)
+    # ties broken by row so the order doesn't depend on the tile size
+    pairs.sort(key=lambda p: (-p['z'], -p['matches'], p['a'], p['b']))
+    return pairs
+
+
+@job_handler('collusion_scan')
+def _job_collusion_scan(ctx):
+    """Compare every pair of an exam's graded scripts for shared wrong answers and write the
+    flagged pairs, with their students' recordings, to a CSV."""
+    import csv
+    exam = Exam.query.get(ctx.params['exam_id'])
+    if not exam:
+        raise ValueError('Exam not found')
+    ctx.progress(0, None, message='Loading answers')
+    session_ids, question_ids, codes, correct = item_response_matrix(exam.id)
+    n = len(session_ids)
+    ctx.progress(0, n, message=f'Comparing {n} script(s)')
+    found = collusion_pairs(codes, correct, progress=lambda done: ctx.progress(done, n))
+
+    involved = sorted({int(session_ids[p[k]]) for p in found for k in ('a', 'b')})
+    students, recordings = {}, {}
+    for chunk in _in_chunks(involved, 500):
+        for sid, username, full_name in (db.session.query(ExamSession.id, User.username, User.full_name)
+                                         .join(User, ExamSession.student_id == User.id)
+                                         .filter(ExamSession.id.in_(chunk))):
+            students[sid] = (username, full_name)
+        for rec in Recording.query.filter(Recording.exam_session_id.in_(chunk)).order_by(Recording.id):
+            recordings.setdefault(rec.exam_session_id, []).append(
+                {'id': rec.id, 'filename': _recording_media_name(rec.filename)})
+    pairs = []
+    for p in found:
+        sa, sb = int(session_ids[p['a']]), int(session_ids[p['b']])
+        (ua, na), (ub, nb) = students.get(sa, ('', '')), students.get(sb, ('', ''))
+        pairs.append({'session_a': sa, 'username_a': ua, 'name_a': na, 'recordings_a': recordings.get(sa, []),
+                      'session_b': sb, 'username_b': ub, 'name_b': nb, 'recordings_b': recordings.get(sb, []),
+                      'matches': p['matches'], 'both_wrong': p['both_wrong'], 'expected': p['expected'], 'z': p['z']})
+
+    path = os.path.join(ctx.workdir, secure_filename(f'collusion_{exam.title}') + '.csv')
+    with open(path, 'w', newline='', encoding='utf-8') as fh:
+        w = csv.writer(fh)
+        w.writerow(COLLUSION_EXPORT_HEADER)
+        for p in pairs:
+            w.writerow([p['session_a'], p['username_a'], p['name_a'], p['session_b'], p['username_b'], p['name_b'],
+                        p['matches'], p['both_wrong'], p['expected'], p['z'],
+                        ' '.join(r['filename'] for r in p['recordings_a']),
+                        ' '.join(r['filename'] for r in p['recordings_b'])])
+    ctx.set_result_file(path)
+    ctx.job.message = f'{len(pairs)} suspicious pair(s) among {n} script(s)'
+    return {'exam_id': exam.id, 'scripts': n, 'items': len(question_ids), 'flagged': len(pairs),
+            'pairs': pairs[:COLLUSION_REPORT_LIMIT]}
+
+
+def _collusion_job_for(exam_id):
+    return (Job.query.filter_by(kind='collusion_scan', params=json.dumps({'exam_id': exam_id}))
+            .order_by(Job.id.desc()).first())
+
+
+@app.route('/admin/exam/<int:exam_id>/collusion', methods=['GET', 'POST'])
+def admin_exam_collusion(exam_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('login'))
+    exam = Exam.query.get_or_404(exam_id)
+    if not session.get('is_superadmin') and not exam_belongs_to_school(exam.id, _get_effective_school_id()):
+        flash('Access denied', 'danger')
+        return redirect(url_for('admin_exams'))
+    if request.method == 'POST':
+        job = enqueue_job('collusion_scan', params={'exam_id': exam.id}, message=f'Waiting to screen {exam.title}')
+        return _job_started_response(job)
+    job = _collusion_job_for(exam.id)
+    result = job.result_data() if job is not None and job.status == 'completed' else None
+    return render_template('admin/exam_collusion.html', exam=exam, job=job, result=result,
+                           min_matches=COLLUSION_MIN_MATCHES, alpha=COLLUSION_ALPHA)
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""Time the item-analysis engine on a synthetic exam.
+Usage: python scripts/bench_item_analysis.py [students] [items] [repeats]
+Defaults to 5000 students x 200 items; every student sees every item.
+"""
+import sys, os
+import time
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from code1 import analyse_items, ITEM_OPTIONS
+
+
+def synthetic(students, items, seed=0):
+    """Option codes and correctness from a one-parameter logistic model."""
+    rng = np.random.default_rng(seed)
+    ability = rng.normal(size=(students, 1))
+    difficulty = rng.normal(size=(1, items))
+    keys = rng.integers(1, len(ITEM_OPTIONS) + 1, size=items, dtype=np.int8)
+    correct = rng.random((students, items)) < 1 / (1 + np.exp(difficulty - ability))
+    codes = rng.integers(1, len(ITEM_OPTIONS) + 1, size=(students, items), dtype=np.int8)
+    codes = np.where(correct, keys, codes).astype(np.int8)
+    correct = codes == keys
+    return codes, correct
+
+
+if __name__ == '__main__':
+    students = int(sys.argv[1]) if len(sys.argv) >= 2 else 5000
+    items = int(sys.argv[2]) if len(sys.argv) >= 3 else 200
+    repeats = int(sys.argv[3]) if len(sys.argv) >= 4 else 5
+    codes, correct = synthetic(students, items)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        stats = analyse_items(codes, correct)
+        timings.append(time.perf_counter() - started)
+    print(f'{students} students x {items} items: best {min(timings) * 1000:.1f} ms, '
+          f'median {sorted(timings)[len(timings) // 2] * 1000:.1f} ms')
+    print(f"KR-20 {stats['kr20']:.3f}, mean difficulty {stats['difficulty'].mean():.3f}, "
+          f"mean point-biserial {stats['point_biserial'].mean():.3f}")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Benchmark login throughput (password verifications per second) for each hashing policy.
+Usage: python scripts/bench_password_hash.py [seconds_per_policy] [policy ...]
+Policies may be preset names (high, medium, low) or werkzeug method strings
+such as scrypt:8192:8:1 or pbkdf2:sha256:100000. Defaults to all presets.
+"""
+import sys, os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from code1 import PASSWORD_HASH_PRESETS, normalize_password_hash_method
+
+PASSWORD = '100001'
+
+
+def verify_for(pw_hash, seconds):
+    """Verify the same hash repeatedly for `seconds`; return the number of verifications."""
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        check_password_hash(pw_hash, PASSWORD)
+        done += 1
+    return done
+
+
+def bench(method, seconds, cores):
+    pw_hash = generate_password_hash(PASSWORD, method=method)
+    # single core
+    started = time.perf_counter()
+    single = verify_for(pw_hash, seconds)
+    single_rate = single / (time.perf_counter() - started)
+    # all cores
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=cores) as pool:
+        total = sum(pool.map(verify_for, [pw_hash] * cores, [seconds] * cores))
+    multi_rate = total / (time.perf_counter() - started)
+    return single_rate, multi_rate
+
+
+if __name__ == '__main__':
+    seconds = float(sys.argv[1]) if len(sys.argv) >= 2 else 2.0
+    policies = sys.argv[2:] or list(PASSWORD_HASH_PRESETS.keys())
+    cores = os.cpu_count() or 1
+    print(f'{cores} core(s), {seconds:.1f}s per measurement')
+    print(f"{'policy':<20} {'method':<24} {'ms/login':>9} {'logins/s/core':>14} {'logins/s all':>13} {'500 logins':>11}")
+    for policy in policies:
+        try:
+            method = normalize_password_hash_method(policy)
+        except ValueError as e:
+            print(f'{policy:<20} skipped: {e}')
+            continue
+        single_rate, multi_rate = bench(method, seconds, cores)
+        print(f'{policy:<20} {method:<24} {1000.0 / single_rate:>9.1f} {single_rate:>14.1f} {multi_rate:>13.1f} {500.0 / multi_rate:>10.1f}s')
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""Print exam results completed or re-graded since a cursor, for syncing another system.
+Usage: python scripts/results_changes.py [--since CURSOR | --state FILE] [--school-id ID] [--limit N] [--all]
+Each result is printed as one JSON line; the cursor to resume from is printed to stderr and,
+with --state, saved to FILE (read back as the starting cursor on the next run).
+--all keeps fetching pages until there are no more changes.
+"""
+import sys, os
+import argparse
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from code1 import app, result_changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental results feed')
+    parser.add_argument('--since', help='cursor returned by a previous run')
+    parser.add_argument('--state', help='file holding the cursor between runs')
+    parser.add_argument('--school-id', type=int, help='only students of this school')
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--all', action='store_true', help='fetch every page')
+    args = parser.parse_args()
+
+    cursor = args.since
+    if not cursor and args.state and os.path.exists(args.state):
+        with open(args.state) as fh:
+            cursor = fh.read().strip() or None
+
+    with app.app_context():
+        while True:
+            page = result_changes(cursor, args.school_id, args.limit)
+            for row in page['results']:
+                print(json.dumps(row))
+            cursor = page['next_cursor']
+            if args.state and cursor:
+                with open(args.state, 'w') as fh:
+                    fh.write(cursor)
+            if not (args.all and page['has_more']):
+                break
+    print(f'cursor: {cursor or ""}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
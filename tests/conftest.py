@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database, private folder and uploads folder so the suite
+# never touches instance/cbt.db or the real uploads.
+_TMP = tempfile.mkdtemp(prefix='cbt-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'cbt.db')
+os.environ['PRIVATE_FOLDER'] = os.path.join(_TMP, 'private')
+# run jobs in the request thread so tests can check their outcome
+os.environ['JOBS_INLINE'] = '1'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import code1  # noqa: E402
+
+code1.app.config['UPLOAD_FOLDER'] = os.path.join(_TMP, 'uploads')
+os.makedirs(code1.app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+
+@pytest.fixture
+def app_ctx():
+    """A freshly seeded database inside an application context."""
+    code1.app.testing = True
+    with code1.app.app_context():
+        code1.db.session.remove()
+        code1.db.drop_all()
+    code1.init_db()
+    code1._gradebook_cache.clear()
+    code1._item_analysis_cache.clear()
+    with code1.app.app_context():
+        yield code1.db.session
+        code1.db.session.remove()
+
+
+@pytest.fixture
+def admin_client(app_ctx):
+    client = code1.app.test_client()
+    assert client.post('/login', data={'username': 'admin', 'password': 'admin123'}).status_code == 302
+    return client
@@ -0,0 +1,56 @@
+import numpy as np
+
+from code1 import ITEM_BLANK, collusion_pairs
+
+
+def _independent(students, items, seed):
+    """Random answers (0 blank, 1..5 A..E) with ability-driven accuracy; the key is A (1)."""
+    rng = np.random.default_rng(seed)
+    ability = rng.uniform(0.3, 0.8, size=(students, 1))
+    knows = rng.random((students, items)) < ability
+    codes = np.where(knows, 1, rng.integers(0, 6, size=(students, items))).astype(np.int8)
+    return codes
+
+
+def _plant(codes, a, b, seed):
+    """Give students a and b the same script of a weak student (mostly guesses)."""
+    rng = np.random.default_rng(seed)
+    codes[a] = codes[b] = rng.integers(0, 6, size=codes.shape[1])
+
+
+def _shared_wrong(codes, a, b):
+    wrong = (codes > ITEM_BLANK) & (codes != 1)
+    return int((wrong[a] & wrong[b] & (codes[a] == codes[b])).sum())
+
+
+def test_independent_students_are_not_flagged():
+    for seed in range(3):
+        codes = _independent(150, 60, seed)
+        assert collusion_pairs(codes, codes == 1) == []
+
+
+def test_copied_pair_is_flagged_with_exact_match_count():
+    codes = _independent(150, 60, seed=11)
+    # student 97 copies student 12's script apart from a few items
+    codes[97] = codes[12]
+    codes[97, :5] = 1
+    pairs = collusion_pairs(codes, codes == 1)
+    assert [(p['a'], p['b']) for p in pairs] == [(12, 97)]
+    assert pairs[0]['matches'] == _shared_wrong(codes, 12, 97)
+    assert pairs[0]['z'] > 0
+
+
+def test_tiles_give_the_same_pairs_as_one_tile():
+    codes = _independent(101, 40, seed=5)
+    _plant(codes, 3, 50, seed=1)
+    _plant(codes, 99, 100, seed=2)   # pair inside the last, partial tile
+    _plant(codes, 20, 21, seed=3)    # pair on a tile's diagonal
+    correct = codes == 1
+    whole = collusion_pairs(codes, correct, tile=len(codes))
+    assert {(p['a'], p['b']) for p in whole} == {(3, 50), (99, 100), (20, 21)}
+    for tile in (1, 7, 32, 100):
+        done = []
+        tiled = collusion_pairs(codes, correct, tile=tile, progress=done.append)
+        assert tiled == whole
+        assert done[-1] == len(codes)
+    assert all(p['a'] < p['b'] for p in whole)
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pytest
+
+from code1 import (Answer, Exam, ExamSession, ExamStats, ExamStatsBin, Question, User, db, exam_stats,
+                   grade_exam_session, rebuild_exam_stats)
+
+
+def _snapshot(exam_id):
+    rows = ExamStats.query.filter_by(exam_id=exam_id).all()
+    bins = {r.id: sorted((b.bin, b.count) for b in ExamStatsBin.query.filter_by(stats_id=r.id) if b.count) for r in rows}
+    return sorted((r.school_id, r.student_class, r.count, pytest.approx(r.total), pytest.approx(r.total_sq),
+                   r.min_score, r.max_score, tuple(bins[r.id])) for r in rows if r.count)
+
+
+def test_incremental_stats_match_rebuild_after_regrade(app_ctx):
+    exam = Exam.query.first()
+    studs = User.query.filter_by(role='student').limit(6).all()
+    questions = Question.query.filter_by(subject_id=exam.subject_id).limit(4).all()
+    assert len(questions) == 4
+    for i, st in enumerate(studs):
+        st.student_class = 'JSS1' if i < 3 else 'JSS2'
+        es = ExamSession(exam_id=exam.id, student_id=st.id, start_time=datetime.utcnow(), status='completed')
+        db.session.add(es)
+        db.session.flush()
+        for j, q in enumerate(questions):
+            db.session.add(Answer(exam_session_id=es.id, question_id=q.id,
+                                  selected_answer=q.correct_answer if j <= i % 4 else 'Z'))
+    db.session.commit()
+    exam_stats(exam.id)
+    for es in ExamSession.query.filter_by(exam_id=exam.id):
+        grade_exam_session(es)
+    db.session.commit()
+
+    # move a student to another class and change an answer key, then regrade everyone
+    studs[0].student_class = 'JSS2'
+    questions[0].correct_answer = 'Z'
+    db.session.commit()
+    for es in ExamSession.query.filter_by(exam_id=exam.id):
+        grade_exam_session(es)
+    db.session.commit()
+
+    incremental = _snapshot(exam.id)
+    rebuild_exam_stats(exam.id)
+    db.session.commit()
+    assert incremental == _snapshot(exam.id)
+    assert exam_stats(exam.id)['count'] == len(studs)
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import code1
+from code1 import Exam, ExamSession, Subject, User, class_gradebook, db, grade_exam_session
+
+
+def _class_with_scores(students=4, subjects=3):
+    studs = User.query.filter_by(role='student').limit(students).all()
+    assert len(studs) == students
+    for i, st in enumerate(studs):
+        st.student_class = 'JSS1'
+        if i == 0:
+            st.full_name = None
+    exams = []
+    for sub in Subject.query.limit(subjects).all():
+        exam = Exam(subject_id=sub.id, title=f'{sub.name} test', duration=10, total_marks=20)
+        db.session.add(exam)
+        exams.append(exam)
+    db.session.flush()
+    now = datetime.utcnow()
+    for i, st in enumerate(studs):
+        for j, exam in enumerate(exams):
+            db.session.add(ExamSession(exam_id=exam.id, student_id=st.id, start_time=now, end_time=now,
+                                       status='completed', score=(i + j) % 20, graded_at=now))
+    db.session.commit()
+    return studs, exams
+
+
+def test_gradebook_has_one_row_per_student(app_ctx):
+    studs, exams = _class_with_scores()
+    book = class_gradebook(studs[0].school_id, 'JSS1')
+    assert len(book['rows']) == len(studs)
+    assert len(book['subjects']) == len(exams)
+    assert sorted(r['student_id'] for r in book['rows']) == sorted(s.id for s in studs)
+    first = next(r for r in book['rows'] if r['student_id'] == studs[0].id)
+    assert first['full_name'] is None
+
+
+def test_gradebook_cache_follows_grading_in_every_scope(app_ctx):
+    studs, exams = _class_with_scores()
+    school = studs[0].school_id
+    scoped = class_gradebook(school, 'JSS1')
+    everywhere = class_gradebook(0, 'JSS1')
+    assert class_gradebook(school, 'JSS1') is scoped
+    assert class_gradebook(0, 'JSS1') is everywhere
+
+    es = ExamSession.query.filter_by(student_id=studs[1].id).first()
+    grade_exam_session(es)
+    db.session.commit()
+    assert class_gradebook(school, 'JSS1') is not scoped
+    assert class_gradebook(0, 'JSS1') is not everywhere
+
+    db.session.delete(es)
+    db.session.commit()
+    rows = class_gradebook(0, 'JSS1')['rows']
+    assert len(rows) == len(studs)
+    assert sum(r['subjects_taken'] for r in rows) == len(studs) * len(exams) - 1
+    assert code1._gradebook_cache
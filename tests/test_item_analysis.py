@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from code1 import ITEM_NOT_SHOWN, analyse_items
+
+
+def _responses(students, items, seed, hide=0.0):
+    """Random codes (0 blank, 1..5 A..E) driven by a latent ability, with an answer key of 1."""
+    rng = np.random.default_rng(seed)
+    ability = rng.normal(size=(students, 1))
+    hardness = rng.normal(size=(1, items))
+    knows = rng.random((students, items)) < 1 / (1 + np.exp(hardness - ability))
+    codes = np.where(knows, 1, rng.integers(0, 6, size=(students, items))).astype(np.int8)
+    if hide:
+        codes[rng.random((students, items)) < hide] = ITEM_NOT_SHOWN
+    return codes, codes == 1
+
+
+def test_kr20_and_point_biserial_match_reference():
+    codes, correct = _responses(200, 30, seed=7)
+    got = analyse_items(codes, correct)
+
+    scores = correct.astype(float)
+    totals = scores.sum(axis=1)
+    p = scores.mean(axis=0)
+    k = scores.shape[1]
+    kr20 = k / (k - 1) * (1 - (p * (1 - p)).sum() / totals.var())
+    r_pb = [np.corrcoef(scores[:, j], totals)[0, 1] for j in range(k)]
+
+    assert got['kr20'] == pytest.approx(kr20, rel=1e-6)
+    np.testing.assert_allclose(got['difficulty'], p)
+    np.testing.assert_allclose(got['point_biserial'], r_pb, atol=1e-4)
+    assert got['mean'] == pytest.approx(totals.mean())
+
+
+def test_point_biserial_uses_only_students_shown_the_item():
+    codes, correct = _responses(150, 12, seed=3, hide=0.3)
+    got = analyse_items(codes, correct)
+
+    shown = codes != ITEM_NOT_SHOWN
+    totals = (correct & shown).sum(axis=1).astype(float)
+    for j in range(codes.shape[1]):
+        rows = shown[:, j]
+        expected = np.corrcoef(correct[rows, j].astype(float), totals[rows])[0, 1]
+        assert got['n'][j] == rows.sum()
+        assert got['point_biserial'][j] == pytest.approx(expected, abs=1e-4)
+        assert got['options'][j].sum() == codes.shape[0]
+        assert got['options'][j][0] == (~rows).sum()
@@ -0,0 +1,36 @@
+import os
+from io import BytesIO
+
+import pytest
+
+import code1
+
+
+def _put(relpath, data=b'x'):
+    path = os.path.join(code1.app.config['UPLOAD_FOLDER'], relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fh:
+        fh.write(data)
+
+
+@pytest.mark.parametrize('path', [
+    'result_pdfs/1/results.pdf',
+    'jobs/7/photo.png',
+    './jobs/7/photo.png',
+    'question_images/notes.txt',
+])
+def test_variant_route_refuses_private_and_non_image_files(app_ctx, path):
+    _put(path.lstrip('./'))
+    client = code1.app.test_client()
+    assert client.get('/media/v/thumb.webp/' + path).status_code == 404
+    assert not code1._variants_pending
+
+
+def test_variant_route_serves_public_images(app_ctx):
+    Image = pytest.importorskip('PIL.Image')
+    buf = BytesIO()
+    Image.new('RGB', (8, 8)).save(buf, 'PNG')
+    _put('question_images/tiny.png', buf.getvalue())
+    client = code1.app.test_client()
+    assert client.get('/media/v/thumb.webp/question_images/tiny.png').status_code == 200
+    assert client.get('/uploads/jobs/7/photo.png').status_code == 404
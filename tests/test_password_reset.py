@@ -0,0 +1,54 @@
+from code1 import School, User, db
+
+
+def _hashes():
+    return dict(db.session.query(User.id, User.password_hash).filter(User.role == 'student'))
+
+
+def _two_schools():
+    schools = [School(name='North'), School(name='South')]
+    db.session.add_all(schools)
+    db.session.flush()
+    students = User.query.filter_by(role='student').order_by(User.id).limit(6).all()
+    for i, st in enumerate(students):
+        st.school_id = schools[i % 2].id
+        st.student_class = 'JSS1'
+    db.session.commit()
+    return schools, students
+
+
+def _reset(client, **form):
+    client.post('/admin/students/reset_passwords', data=form)
+    db.session.expire_all()
+
+
+def test_superadmin_reset_is_scoped_to_the_active_school(admin_client):
+    (north, south), students = _two_schools()
+    before = _hashes()
+
+    # no active school: a class reset is refused outright
+    _reset(admin_client, **{'class': 'JSS1'})
+    assert _hashes() == before
+
+    with admin_client.session_transaction() as sess:
+        sess['school_id'] = north.id
+    _reset(admin_client, **{'class': 'JSS1'})
+    after = _hashes()
+    changed = {uid for uid in before if before[uid] != after[uid]}
+    assert changed == {st.id for st in students if st.school_id == north.id}
+
+
+def test_reset_all_needs_explicit_confirmation(admin_client):
+    (north, _), students = _two_schools()
+    with admin_client.session_transaction() as sess:
+        sess['school_id'] = north.id
+    before = _hashes()
+    _reset(admin_client, **{'class': 'ALL'})
+    assert _hashes() == before
+    _reset(admin_client, **{'class': ''})
+    assert _hashes() == before
+
+    _reset(admin_client, **{'class': 'ALL', 'confirm_all': 'ALL'})
+    after = _hashes()
+    north_ids = {uid for (uid,) in db.session.query(User.id).filter_by(role='student', school_id=north.id)}
+    assert {uid for uid in before if before[uid] != after[uid]} == north_ids
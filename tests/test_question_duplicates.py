@@ -0,0 +1,92 @@
+import zlib
+
+import numpy as np
+
+from code1 import (QUESTION_NEAR_DUPLICATE_THRESHOLD, QUESTION_SHINGLE_SIZE, Question, Subject, db,
+                   find_question_duplicates, index_question_fingerprints, minhash_similarity,
+                   normalize_question_text, question_duplicate_clusters, question_fingerprint,
+                   screen_question_duplicates)
+
+STEM = ('Which of the following gases is released when dilute hydrochloric acid reacts with '
+        'marble chips in an open beaker at room temperature')
+
+
+def _row(text, subject_id=None, a='Carbon dioxide', b='Oxygen'):
+    return {'subject_id': subject_id, 'question_text': text, 'theory_text': None,
+            'option_a': a, 'option_b': b, 'option_c': 'Hydrogen', 'option_d': 'Nitrogen', 'option_e': ''}
+
+
+def _jaccard(x, y):
+    def shingles(row):
+        text = ' '.join(f for f in (normalize_question_text(row[k]) for k in
+                                    ('question_text', 'theory_text', 'option_a', 'option_b', 'option_c',
+                                     'option_d', 'option_e')) if f)
+        k = QUESTION_SHINGLE_SIZE
+        return {zlib.crc32(text[i:i + k].encode()) for i in range(max(1, len(text) - k + 1))}
+    sx, sy = shingles(x), shingles(y)
+    return len(sx & sy) / len(sx | sy)
+
+
+def test_exact_hash_ignores_case_accents_and_punctuation():
+    assert normalize_question_text('  Whát is   2+2? ') == 'what is 2 2'
+    plain = question_fingerprint(_row(STEM + '?'))
+    noisy = question_fingerprint(_row(STEM.upper().replace(' ', '  ') + ' ??', a='carbon-dioxide'))
+    assert plain[0] == noisy[0]
+    assert np.array_equal(plain[1], noisy[1])
+
+
+def test_minhash_similarity_tracks_jaccard():
+    base = _row(STEM)
+    for other in (_row(STEM.replace('marble chips', 'limestone')), _row(STEM[:60]),
+                  _row('Name the capital city of Nigeria', a='Abuja', b='Lagos')):
+        estimate = minhash_similarity(question_fingerprint(base)[1], question_fingerprint(other)[1])
+        assert abs(estimate - _jaccard(base, other)) < 0.15
+
+
+def _indexed(subject, texts):
+    questions = [Question(subject_id=subject.id, question_text=t, option_a='Carbon dioxide', option_b='Oxygen',
+                          option_c='Hydrogen', option_d='Nitrogen', option_e='', correct_answer='A')
+                 for t in texts]
+    db.session.add_all(questions)
+    db.session.flush()
+    index_question_fingerprints(questions)
+    db.session.commit()
+    return questions
+
+
+def test_lookup_finds_exact_and_near_duplicates_within_a_subject(app_ctx):
+    chemistry, other = Subject(name='Dup Chemistry'), Subject(name='Dup Other')
+    db.session.add_all([chemistry, other])
+    db.session.flush()
+    original, unrelated = _indexed(chemistry, [STEM, 'State two uses of sodium chloride in the home'])
+
+    near = _row(STEM.replace('an open beaker', 'a beaker'))
+    assert _jaccard(_row(STEM), near) >= QUESTION_NEAR_DUPLICATE_THRESHOLD
+    queries = [question_fingerprint(r) for r in (_row(STEM.lower()), near, _row('Define osmosis'))]
+    exact_hit, near_hit, miss = find_question_duplicates(chemistry.id, queries)
+    assert exact_hit == (original.id, 1.0, 'exact')
+    assert near_hit[0] == original.id and near_hit[2] == 'near'
+    assert miss is None
+    assert find_question_duplicates(other.id, queries) == [None, None, None]
+    assert find_question_duplicates(chemistry.id, queries[:1], exclude_ids={original.id}) == [None]
+
+    # word-for-word repeats are dropped on import, within the batch too; near ones are counted
+    duplicates = {}
+    kept, _ = screen_question_duplicates(
+        [_row(STEM, chemistry.id), dict(near, subject_id=chemistry.id), _row('Define osmosis', chemistry.id),
+         _row('Define  OSMOSIS.', chemistry.id)], duplicates)
+    assert [r['question_text'] for r in kept] == [near['question_text'], 'Define osmosis']
+    assert duplicates == {'exact': 2, 'near': 1}
+
+
+def test_clusters_group_duplicates_by_subject(app_ctx):
+    subject = Subject(name='Dup Clusters')
+    db.session.add(subject)
+    db.session.flush()
+    a, b, c, _ = _indexed(subject, [STEM, STEM + '.', STEM.replace('an open beaker', 'a beaker'),
+                                    'Explain why the sky appears blue during the day'])
+    clusters, total = question_duplicate_clusters([subject.id])
+    assert total == 1
+    assert clusters[0]['question_ids'] == [a.id, b.id, c.id]
+    assert clusters[0]['subject_id'] == subject.id
+    assert QUESTION_NEAR_DUPLICATE_THRESHOLD <= clusters[0]['similarity'] < 1.0
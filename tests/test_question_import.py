@@ -0,0 +1,181 @@
+import json
+import os
+from io import BytesIO
+
+import pandas as pd
+
+import code1
+from code1 import (Job, Question, School, Subject, User, _question_subject_maps, db, import_question_frame,
+                   match_sheet_subject)
+
+
+def _school_with_admin(name):
+    school = School(name=name)
+    db.session.add(school)
+    db.session.flush()
+    admin = User(username=f'admin-{name}', role='admin', school_id=school.id)
+    admin.set_password('x')
+    db.session.add(admin)
+    db.session.flush()
+    return school, admin
+
+
+def _subject(name, code, admin):
+    subject = Subject(name=name, code=code, created_by=admin.id)
+    db.session.add(subject)
+    db.session.flush()
+    return subject
+
+
+def test_sheet_and_row_subjects_stay_within_the_school(app_ctx):
+    north, north_admin = _school_with_admin('North')
+    south, south_admin = _school_with_admin('South')
+    # the other school's subject is created first, so an unscoped lookup would pick it
+    theirs = _subject('Algebra', 'ALG-S', south_admin)
+    ours = _subject('Algebra', 'ALG-N', north_admin)
+    fallback = _subject('General', 'GEN-N', north_admin)
+    db.session.commit()
+
+    maps = _question_subject_maps(north.id)
+    assert match_sheet_subject('Algebra JSS2', maps) == (ours.id, 'JSS2')
+    assert match_sheet_subject('ALG-S', maps) == (None, None)
+    assert match_sheet_subject('Algebra', _question_subject_maps(south.id))[0] == theirs.id
+
+    df = pd.DataFrame({'Question': ['By name', 'By code'], 'Option A': ['a', 'a'], 'Option B': ['b', 'b'],
+                       'Correct Answer': ['A', 'A'], 'Subject': ['Algebra', None], 'Subject Code': [None, 'ALG-S']})
+    added, errors = import_question_frame(df, fallback.id, '', {}, north_admin.id, school_id=north.id)
+    assert added == 0
+    assert errors == [(3, 'Unknown Subject Code: ALG-S')]
+
+    added, errors = import_question_frame(df.iloc[:1], fallback.id, '', {}, north_admin.id, school_id=north.id)
+    assert (added, errors) == (1, [])
+    assert Question.query.filter_by(question_text='By name').one().subject_id == ours.id
+    assert not Question.query.filter_by(subject_id=theirs.id).count()
+
+
+def _workbook(rows=3):
+    buf = BytesIO()
+    pd.DataFrame({'Question': [f'Q{i}' for i in range(rows)], 'Option A': 'a', 'Option B': 'b',
+                  'Correct Answer': 'A'}).to_excel(buf, index=False)
+    buf.seek(0)
+    return buf
+
+
+def test_large_workbook_goes_to_a_job_and_oversized_one_is_refused(admin_client, monkeypatch):
+    subject = Subject.query.first()
+    monkeypatch.setitem(code1.app.config, 'QUESTION_UPLOAD_INLINE_BYTES', 1)
+    r = admin_client.post('/admin/question/upload', data={'subject_id': subject.id, 'file': (_workbook(), 'q.xlsx')})
+    assert r.status_code == 302
+    job = Job.query.order_by(Job.id.desc()).first()
+    assert (job.kind, job.status) == ('upload_questions', 'completed')
+
+    monkeypatch.setitem(code1.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    jobs = Job.query.count()
+    r = admin_client.post('/admin/question/upload', data={'subject_id': subject.id, 'file': (_workbook(), 'q.xlsx')})
+    assert r.status_code == 302 and '/admin/question/upload' in r.headers['Location']
+    assert Job.query.count() == jobs
+    # the same amount of data as CSV is streamed to a job
+    csv = BytesIO(('Question,Option A,Option B,Correct Answer\n' + 'Long question text,a,b,A\n' * 100).encode())
+    r = admin_client.post('/admin/question/upload', data={'subject_id': subject.id, 'file': (csv, 'q.csv')})
+    assert Job.query.order_by(Job.id.desc()).first().kind == 'import_questions_csv'
+
+
+def test_workbook_job_with_only_invalid_rows_fails(admin_client, monkeypatch):
+    subject = Subject.query.first()
+    monkeypatch.setitem(code1.app.config, 'QUESTION_UPLOAD_INLINE_BYTES', 1)
+    buf = BytesIO()
+    pd.DataFrame({'Question': ['No key', 'Also no key'], 'Option A': 'a', 'Option B': 'b',
+                  'Correct Answer': [None, None]}).to_excel(buf, index=False)
+    buf.seek(0)
+    admin_client.post('/admin/question/upload', data={'subject_id': subject.id, 'file': (buf, 'bad.xlsx')})
+    job = Job.query.order_by(Job.id.desc()).first()
+    assert job.kind == 'upload_questions'
+    assert job.status == 'failed'
+    assert job.message == 'No questions imported: 2 invalid row(s)'
+    assert [p['reason'] for p in job.result_data()['problems']] == ['Missing Correct Answer'] * 2
+    status = admin_client.get(f'/admin/jobs/{job.id}/status').get_json()
+    assert status['status'] == 'failed'
+
+
+def test_csv_import_resumes_after_the_last_committed_chunk(admin_client, monkeypatch):
+    subject = Subject.query.first()
+    lines = ['Question,Option A,Option B,Correct Answer']
+    lines += ['"Multi\nline 0",a,b,A', ',a,b,A']                    # a quoted newline and an invalid row
+    lines += [f'CSV{i},a,"b, with comma",B' for i in range(1, 10)]
+    monkeypatch.setattr(code1, 'QUESTION_CSV_CHUNK', 4)
+    real_insert = code1.insert_question_rows
+    calls = []
+
+    def crash_on_second_chunk(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError('worker died')
+        return real_insert(*args, **kwargs)
+
+    monkeypatch.setattr(code1, 'insert_question_rows', crash_on_second_chunk)
+    r = admin_client.post('/admin/question/upload?format=json',
+                          data={'subject_id': subject.id, 'file': (BytesIO('\n'.join(lines).encode()), 'bank.csv')})
+    job_id = r.get_json()['job_id']
+    job = db.session.get(Job, job_id)
+    assert job.status == 'failed'
+    checkpoint = json.loads(job.checkpoint)
+    assert (checkpoint['rows'], checkpoint['added'], checkpoint['invalid']) == (4, 3, 1)
+    imported = lambda: [q.question_text for q in Question.query.filter(
+        (Question.question_text.like('CSV%')) | (Question.question_text.like('Multi%'))).order_by(Question.id)]
+    assert imported() == ['Multi\nline 0', 'CSV1', 'CSV2']
+
+    admin_client.post(f'/admin/jobs/{job_id}/restart')
+    db.session.expire_all()
+    job = db.session.get(Job, job_id)
+    assert (job.status, job.attempts) == ('completed', 2)
+    assert imported() == ['Multi\nline 0'] + [f'CSV{i}' for i in range(1, 10)]
+    result = job.result_data()
+    assert (result['added'], result['invalid']) == (10, 1)
+    # rows rejected before the restart are still reported
+    assert result['problems'] == [{'row': 3, 'reason': 'Missing question text'}]
+
+
+def _bundle(members):
+    import zipfile
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def test_bundle_links_images_and_stores_identical_ones_once(admin_client):
+    subject = Subject.query.first()
+    sheet = BytesIO()
+    pd.DataFrame({'Question': ['B1', 'B2', 'B3', 'B4'], 'Option A': 'a', 'Option B': 'b', 'Correct Answer': 'A',
+                  'Image Filename': ['images/one.png', 'two.png', 'images\\sub\\one copy.png', None]}
+                 ).to_excel(sheet, index=False)
+    bundle = _bundle({
+        'bank/questions.xlsx': sheet.getvalue(),
+        'bank/images/one.png': b'same bytes',
+        'bank/images/two.png': b'other bytes',
+        'bank/images/sub/one copy.png': b'same bytes',
+        '__MACOSX/bank/._one.png': b'resource fork',
+    })
+    r = admin_client.post('/admin/question/upload?format=json',
+                          data={'subject_id': subject.id, 'file': (bundle, 'bank.zip')})
+    job = db.session.get(Job, r.get_json()['job_id'])
+    assert job.status == 'completed', job.error
+    result = job.result_data()
+    assert (result['added'], result['images'], result['images_stored'], result['images_deduplicated']) == (4, 3, 2, 1)
+
+    images = {q.question_text: q.question_image for q in Question.query.filter(Question.question_text.like('B_'))}
+    assert images['B1'] == images['B3'] != images['B2']
+    assert images['B4'] is None
+    assert os.path.isfile(images['B1']) and os.path.isfile(images['B2'])
+
+
+def test_bundle_without_exactly_one_sheet_fails(admin_client):
+    subject = Subject.query.first()
+    bundle = _bundle({'a.csv': 'Question,Option A,Option B,Correct Answer\nQ,a,b,A\n', 'b.csv': 'x'})
+    r = admin_client.post('/admin/question/upload?format=json',
+                          data={'subject_id': subject.id, 'file': (bundle, 'two.zip')})
+    job = db.session.get(Job, r.get_json()['job_id'])
+    assert job.status == 'failed'
+    assert 'exactly one question sheet' in job.error
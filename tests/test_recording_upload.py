@@ -0,0 +1,80 @@
+import hashlib
+import os
+from datetime import datetime
+
+import pytest
+
+import code1
+from code1 import Exam, ExamSession, Recording, RecordingChunk, User, db
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def student_upload(app_ctx):
+    """A logged-in student's client and a fresh upload id for their in-progress session."""
+    student = User.query.filter_by(role='student').first()
+    student.set_password('pw')
+    es = ExamSession(exam_id=Exam.query.first().id, student_id=student.id, start_time=datetime.utcnow(),
+                     status='in_progress')
+    db.session.add(es)
+    db.session.commit()
+    client = code1.app.test_client()
+    client.post('/login', data={'username': student.username, 'password': 'pw'})
+    r = client.post(f'/recording/upload/init/{es.id}', json={'filename': 'clip.webm'})
+    assert r.status_code == 201
+    return client, r.get_json()['upload_id']
+
+
+def _put(client, upload_id, index, data, sha=None):
+    headers = {'X-Chunk-SHA256': sha} if sha else {}
+    return client.put(f'/recording/upload/{upload_id}/chunk/{index}', data=data, headers=headers)
+
+
+def test_chunks_out_of_order_duplicate_and_bad_checksum(student_upload):
+    client, up = student_upload
+    parts = [os.urandom(1000), os.urandom(700), os.urandom(300)]
+
+    assert _put(client, up, 0, parts[0], _sha(parts[0])).get_json()['chunk'] == 'stored'
+    # a retried chunk with the same bytes is acknowledged, different bytes are refused
+    assert _put(client, up, 0, parts[0], _sha(parts[0])).get_json()['chunk'] == 'duplicate'
+    assert _put(client, up, 0, parts[1]).status_code == 409
+    # a gap is refused and tells the client where to resume
+    r = _put(client, up, 2, parts[2])
+    assert r.status_code == 409 and r.get_json()['next_index'] == 1
+    # a body that doesn't match its checksum is refused before anything is written
+    r = _put(client, up, 1, parts[1], '0' * 64)
+    assert r.status_code == 422 and r.get_json()['sha256'] == _sha(parts[1])
+    assert client.get(f'/recording/upload/{up}').get_json()['bytes_received'] == len(parts[0])
+
+    assert _put(client, up, 1, parts[1], _sha(parts[1])).status_code == 200
+    assert _put(client, up, 2, parts[2], _sha(parts[2])).status_code == 200
+    assert client.post(f'/recording/upload/{up}/complete', json={'chunks': 2}).status_code == 409
+    r = client.post(f'/recording/upload/{up}/complete', json={'chunks': 3})
+    assert r.status_code == 200 and r.get_json()['status'] == 'complete'
+    rec = db.session.get(Recording, r.get_json()['recording_id'])
+    with open(rec.filename, 'rb') as fh:
+        assert fh.read() == b''.join(parts)
+    assert not RecordingChunk.query.filter_by(upload_id=up).count()
+    assert not os.path.exists(code1._recording_partial_path(up))
+
+
+def test_damaged_partial_file_rewinds_to_the_bad_chunk(student_upload):
+    client, up = student_upload
+    parts = [os.urandom(1000) for _ in range(3)]
+    for i, data in enumerate(parts):
+        _put(client, up, i, data, _sha(data))
+    with open(code1._recording_partial_path(up), 'r+b') as fh:
+        fh.seek(1500)
+        fh.write(b'\0' * 10)
+    r = client.post(f'/recording/upload/{up}/complete', json={'chunks': 3})
+    assert r.status_code == 409
+    assert (r.get_json()['next_index'], r.get_json()['bytes_received']) == (1, 1000)
+    for i in (1, 2):
+        assert _put(client, up, i, parts[i], _sha(parts[i])).get_json()['chunk'] == 'stored'
+    r = client.post(f'/recording/upload/{up}/complete', json={'chunks': 3})
+    rec = db.session.get(Recording, r.get_json()['recording_id'])
+    with open(rec.filename, 'rb') as fh:
+        assert fh.read() == b''.join(parts)
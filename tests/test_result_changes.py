@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from code1 import (Exam, ExamSession, User, db, decode_results_cursor, encode_results_cursor,
+                   result_changes)
+
+
+def test_cursor_round_trip():
+    stamp = datetime(2026, 3, 1, 8, 30, 15, 123456)
+    cursor = encode_results_cursor(stamp, 4821)
+    assert '=' not in cursor
+    assert decode_results_cursor(cursor) == (stamp, 4821)
+    assert decode_results_cursor(encode_results_cursor(stamp.replace(microsecond=0), 1)) == \
+        (stamp.replace(microsecond=0), 1)
+
+
+@pytest.mark.parametrize('cursor', ['', 'not-a-cursor', encode_results_cursor(datetime(2026, 1, 1), 1)[:-3]])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_results_cursor(cursor)
+
+
+def _graded_sessions(count, stamp):
+    exam = Exam.query.first()
+    student = User.query.filter_by(role='student').first()
+    sessions = [ExamSession(exam_id=exam.id, student_id=student.id, start_time=stamp, end_time=stamp,
+                            status='completed', score=1, graded_at=stamp) for _ in range(count)]
+    db.session.add_all(sessions)
+    db.session.commit()
+    return [es.id for es in sessions]
+
+
+def _drain(since, limit):
+    seen = []
+    while True:
+        page = result_changes(since, limit=limit)
+        seen.extend(r['session_id'] for r in page['results'])
+        since = page['next_cursor']
+        if not page['has_more']:
+            return seen, since
+
+
+def test_pages_through_equal_graded_at_without_gaps_or_repeats(app_ctx):
+    stamp = datetime.utcnow() - timedelta(hours=1)
+    ids = _graded_sessions(7, stamp)
+    seen, cursor = _drain(None, limit=3)
+    assert seen == ids
+
+    # nothing new: the cursor is handed back unchanged
+    page = result_changes(cursor, limit=3)
+    assert page['results'] == [] and page['next_cursor'] == cursor
+
+    # a regraded session moves behind the cursor and comes through once
+    es = db.session.get(ExamSession, ids[2])
+    es.graded_at = stamp + timedelta(minutes=1)
+    db.session.commit()
+    assert _drain(cursor, limit=3)[0] == [ids[2]]
+
+
+def test_recent_stamps_are_held_back(app_ctx):
+    ids = _graded_sessions(2, datetime.utcnow())
+    seen, _ = _drain(None, limit=100)
+    assert not set(ids) & set(seen)
+
+
+def test_feed_route_rejects_bad_cursor(admin_client):
+    r = admin_client.get('/admin/results/changes?since=garbage')
+    assert r.status_code == 400
+    assert r.get_json() == {'error': 'Invalid cursor'}